@@ -9,15 +9,33 @@ from mongoengine import (
     DoesNotExist,
 )
 from marshmallow import ValidationError as MMW_ValidationError
-from datetime import timedelta
+from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from flask_socketio import SocketIO
 from app.socketio_handler import handle_socketio_requests
 import logging
 
-from app.utils import LogOutBlockList, create_audit_log
-from app.config import REDIS_SYNC_INTERVAL, REDIS_SETTINGS, REDIS_URI, MONGODB_SETTINGS
+from app.utils import LogOutBlockList, InvalidCursorError, create_audit_log
+from app.config import (
+    REDIS_SYNC_INTERVAL,
+    REDIS_SETTINGS,
+    REDIS_URI,
+    MONGODB_SETTINGS,
+    COUNTER_RECONCILE_INTERVAL,
+    HOT_SCORE_INTERVAL,
+    VOTE_WRITE_BEHIND,
+    VOTE_FLUSH_INTERVAL,
+    VOTE_SHARDING,
+    VOTE_SHARD_FOLD_INTERVAL,
+)
 from app.database import connect_redis, connect_mongodb
+from app.counters import reconcile_counters
+from app.ranking import recompute_hot_scores
+from app.search import load_search_index, start_search_listener
+from app.tag_registry import load_tag_registry, start_tag_listener
+from app.vote_buffer import flush_vote_buffer
+from app.vote_shards import fold_vote_shards
+from app.migrations import register_commands, rerender_content_html
 from app.resources.root import RootResource
 from app.resources.user import (
     UserResource,
@@ -33,11 +51,14 @@ from app.resources.post import (
     ShowPostResource,
     PostTagsView,
     get_other_users_posts_with_user_id,
+    bulk_posts_view,
 )
 from app.resources.feed import FeedResource
-from app.resources.vote import VoteResource
+from app.resources.vote import VoteResource, lookup_votes_view
 from app.resources.comment import CommentResource
-from app.resources.tag import TagResource
+from app.resources.tag import TagResource, get_tag_posts_view
+from app.resources.export import export_posts_view
+from app.resources.search import search_posts_view
 from app.resources.auth import LoginView, RegisterView, LogOutView, RefreshView
 
 socketio = SocketIO()
@@ -69,8 +90,11 @@ def create_app(
             redis_db=REDIS_SETTINGS["db"],
         )
 
+    app.config["redis"] = app.config["jwt_redis_blocklist"]
     app.config["logout_blocklist"] = LogOutBlockList(app.config["BLOCKED_USERS"])
 
+    connect_mongodb(mongodb_uri, **kwargs)
+
     scheduler = BackgroundScheduler()
     # Scheduler runs sync_redis twice when use_reload=True or DEBUG=True.
     scheduler.add_job(
@@ -79,10 +103,43 @@ def create_app(
         minutes=REDIS_SYNC_INTERVAL,
         args=[app.config["jwt_redis_blocklist"]],
     )
+    reconcile_options = {}
+    if kwargs.get("TESTING") != True:
+        # Also repair drifted or missing counters once on startup.
+        reconcile_options["next_run_time"] = datetime.now()
+    scheduler.add_job(
+        reconcile_counters,
+        "interval",
+        minutes=COUNTER_RECONCILE_INTERVAL,
+        **reconcile_options,
+    )
+    scheduler.add_job(recompute_hot_scores, "interval", minutes=HOT_SCORE_INTERVAL)
+    if VOTE_WRITE_BEHIND:
+        scheduler.add_job(
+            flush_vote_buffer,
+            "interval",
+            seconds=VOTE_FLUSH_INTERVAL,
+            args=[app.config["redis"]],
+            max_instances=1,
+        )
+    if VOTE_SHARDING:
+        scheduler.add_job(
+            fold_vote_shards,
+            "interval",
+            seconds=VOTE_SHARD_FOLD_INTERVAL,
+            args=[app.config["redis"]],
+            max_instances=1,
+        )
+    if kwargs.get("TESTING") != True:
+        # The search index and the tag registry live in memory, they are filled
+        # once on startup and follow the writes of other processes through Redis.
+        scheduler.add_job(load_search_index)
+        scheduler.add_job(load_tag_registry)
+        start_search_listener(app.config["redis"])
+        start_tag_listener(app.config["redis"])
+        scheduler.add_job(rerender_content_html)
     scheduler.start()
 
-    connect_mongodb(mongodb_uri, **kwargs)
-
     @app.errorhandler(MMW_ValidationError)  # Marshmallow Validation Error
     def handle_validation_error(error):
         app.logger.error(error)
@@ -104,6 +161,11 @@ def create_app(
         app.logger.error(error)
         return {"error": "Not found."}, 404
 
+    @app.errorhandler(InvalidCursorError)
+    def handle_invalid_cursor_error(error):
+        app.logger.error(error)
+        return {"error": "Invalid cursor."}, 400
+
     @app.errorhandler(KeyError)
     def handle_key_error(error):
         app.logger.error(error)
@@ -142,12 +204,42 @@ def create_app(
         PostTagsView.as_view("post_tag_events"),
         methods=["GET", "POST", "DELETE"],
     )
+    app.add_url_rule(
+        "/post/bulk",
+        "post_bulk",
+        bulk_posts_view,
+        methods=["POST"],
+    )
+    app.add_url_rule(
+        "/vote/lookup",
+        "vote_lookup",
+        lookup_votes_view,
+        methods=["POST"],
+    )
     app.add_url_rule(
         "/user/<string:id>/post",
         "user_posts",
         get_other_users_posts_with_user_id,
         methods=["GET"],
     )
+    app.add_url_rule(
+        "/tag/<string:id>/posts",
+        "tag_posts",
+        get_tag_posts_view,
+        methods=["GET"],
+    )
+    app.add_url_rule(
+        "/export/posts",
+        "export_posts",
+        export_posts_view,
+        methods=["GET"],
+    )
+    app.add_url_rule(
+        "/search",
+        "search_posts",
+        search_posts_view,
+        methods=["GET"],
+    )
     app.add_url_rule(
         "/user/<string:id>/follow",
         "user_follow",
@@ -189,6 +281,8 @@ def create_app(
     api.add_resource(FeedResource, "/feed")
     api.add_resource(TagResource, "/tag", "/tag/<string:id>")
 
+    register_commands(app)
+
     socketio.init_app(app, cors_allowed_origins="*", allow_unsafe_werkzeug=True)
     handle_socketio_requests(socketio, app)  # This may be a bad usage.
 
@@ -0,0 +1,125 @@
+from flask import Response, json
+from flask_restful import current_app, request
+from functools import wraps
+from redis import RedisError
+from app.config import FEED_CACHE_TTL, FEED_CACHE_STALE_TTL, FEED_CACHE_LOCK_TTL
+from app.database import decode_redis
+from hashlib import sha1
+from urllib.parse import urlencode
+from werkzeug.http import quote_etag
+import logging
+import time
+
+# Redis keys:
+# cache:feed:<hash>             "<stored_at>\n<json body>" of one anonymous page.
+# cache:feed:<hash>:lock        Held by the request that refreshes a stale page.
+# cache:feed:invalidated_at     Pages stored before this time are stale.
+FEED_CACHE_KEY = "cache:feed:{}"
+FEED_CACHE_LOCK_KEY = "cache:feed:{}:lock"
+FEED_CACHE_INVALIDATED_KEY = "cache:feed:invalidated_at"
+
+
+def _request_hash():
+    # Same parameters in any order share one entry.
+    query = urlencode(sorted(request.args.items(multi=True)))
+    return sha1(f"{request.path}?{query}".encode("utf-8")).hexdigest()
+
+
+def _cached_response(body: str, state: str):
+    return Response(
+        body, status=200, mimetype="application/json", headers={"X-Cache": state}
+    )
+
+
+def cached_response(func):
+    """
+    Caches the JSON body of successful anonymous responses in Redis.
+
+    Pages are fresh for FEED_CACHE_TTL seconds or until invalidate_feed_cache
+    is called. Stale pages are kept for FEED_CACHE_STALE_TTL seconds and served
+    while a single request, holding a lock, renders the page again.
+    Authenticated requests are never cached.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if request.headers.get("Authorization"):
+            return func(*args, **kwargs)
+
+        request_hash = _request_hash()
+        key = FEED_CACHE_KEY.format(request_hash)
+        lock_key = FEED_CACHE_LOCK_KEY.format(request_hash)
+        try:
+            redis_client = current_app.config["redis"]
+            entry, invalidated_at = redis_client.mget(key, FEED_CACHE_INVALIDATED_KEY)
+            if entry:
+                stored_at, body = decode_redis(entry).split("\n", 1)
+                stored_at = float(stored_at)
+                invalidated_at = float(decode_redis(invalidated_at) or 0)
+                if (
+                    stored_at > invalidated_at
+                    and stored_at + FEED_CACHE_TTL > time.time()
+                ):
+                    return _cached_response(body, "HIT")
+                if not redis_client.set(lock_key, 1, nx=True, ex=FEED_CACHE_LOCK_TTL):
+                    return _cached_response(body, "STALE")
+        except RedisError as error:
+            logging.error(f"Response cache read failed: {error}")
+            return func(*args, **kwargs)
+
+        stored_at = time.time()
+        response = func(*args, **kwargs)
+        data, status = response[:2] if isinstance(response, tuple) else (response, 200)
+        body = json.dumps(data) if status == 200 else None
+        try:
+            pipeline = redis_client.pipeline(transaction=False)
+            if body is None:
+                pipeline.delete(key)
+            else:
+                pipeline.set(key, f"{stored_at}\n{body}", ex=FEED_CACHE_STALE_TTL)
+            pipeline.delete(lock_key)
+            pipeline.execute()
+        except RedisError as error:
+            logging.error(f"Response cache write failed: {error}")
+        if body is None:
+            return response
+        return _cached_response(body, "MISS")
+
+    return wrapper
+
+
+def invalidate_feed_cache():
+    """
+    Marks every cached feed page as stale.
+
+    Called after writes that change what anonymous feed pages show:
+    post create, edit and delete, votes and tag changes.
+    """
+    try:
+        current_app.config["redis"].set(FEED_CACHE_INVALIDATED_KEY, time.time())
+    except RedisError as error:
+        logging.error(f"Response cache invalidation failed: {error}")
+
+
+def make_etag(*parts):
+    """
+    Builds the value of a weak ETag from the parts a response depends on.
+
+    Parts are usually version counters and updated_at dates, plus the
+    viewer for responses that differ per user.
+    """
+    return sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def etag_header(etag: str):
+    return {"ETag": quote_etag(etag, weak=True)}
+
+
+def not_modified(etag: str):
+    """
+    Returns a 304 response if the request's If-None-Match matches the ETag,
+    None otherwise.
+    """
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=etag_header(etag))
+    return None
@@ -12,8 +12,37 @@ REDIS_URI = (
     + str(REDIS_SETTINGS["db"])
 )
 MONGODB_SETTINGS = {"host": "mongodb://mongo-service:27017/microblog"}
+QUERY_WORKERS = 8  # Threads shared by requests that run MongoDB reads in parallel
 REDIS_SYNC_INTERVAL = 60  # In minutes
+COUNTER_RECONCILE_INTERVAL = 60  # In minutes
+HOT_SCORE_INTERVAL = 5  # In minutes
+HOT_SCORE_WINDOW = 72  # In hours, older posts drop to a hot score of 0
+HOT_SCORE_GRAVITY = 1.8
+TIMELINE_MAX_LENGTH = 800  # Post ids kept per home timeline
+TIMELINE_FANOUT_LIMIT = 10000  # Authors above this follower count are read on demand
+TIMELINE_TTL = 60 * 60 * 24 * 7  # In seconds
+FOLLOWEE_CACHE_TTL = 600  # In seconds
+FOLLOWED_FEED_CHUNK_SIZE = 500  # Followed authors per query on large follow lists
+FEED_CACHE_TTL = 10  # In seconds, anonymous feed pages are fresh for this long
+FEED_CACHE_STALE_TTL = 120  # In seconds, stale pages are served while refreshing
+FEED_CACHE_LOCK_TTL = 5  # In seconds
+RELATION_CACHE_SIZE = 10000  # Users and tags kept in memory per process
+RELATION_CACHE_TTL = 60  # In seconds
+VOTE_WRITE_BEHIND = False  # Buffer votes in Redis and write them to MongoDB in batches
+VOTE_FLUSH_INTERVAL = 5  # In seconds, how often buffered votes are written
+VOTE_SHARDING = False  # Spread the votes of busy posts over counter shards
+VOTE_SHARD_COUNT = 8  # Counter shards of a promoted post
+VOTE_SHARD_THRESHOLD = 600  # Votes per minute that promote a post to shards
+VOTE_SHARD_CACHE_TTL = 2  # In seconds, summed shards are reused this long
+VOTE_SHARD_FOLD_INTERVAL = 10  # In seconds, how often shard totals are written to posts
+SEARCH_BM25_K1 = 1.2  # Term frequency saturation of search ranking
+SEARCH_BM25_B = 0.75  # Document length normalization of search ranking
+SEARCH_TITLE_WEIGHT = 2  # Title terms count this many times in a post
 MAX_BLOCKED_USER = 10000
+PAGINATION_COUNT_LIMIT = 10000  # Matches counted by estimated page counts
+PAGINATION_MAX_LIMIT = 500  # Items per page, keeps a page under the 16 MB $facet result
+BULK_POST_LIMIT = 1000  # Posts per POST /post/bulk request
+VOTE_LOOKUP_LIMIT = 200  # Posts per POST /vote/lookup request
 DOMAIN_ROOT = HOST + ":" + str(PORT)
 FRONTEND_ROOT = "microblog.local:4173"
 SECRET_KEY = "usmanim_nereye_gidersin_youtu.be/0ZPg9GwExFg"
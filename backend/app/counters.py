@@ -0,0 +1,166 @@
+from pymongo import UpdateOne
+from datetime import datetime
+from app.models.counter import (
+    CounterModel,
+    POSTS_COUNTER,
+    AUTHOR_POSTS_COUNTER,
+    POST_COMMENTS_COUNTER,
+    FOLLOWERS_COUNTER,
+    FOLLOWING_COUNTER,
+    UNRECONCILED_COUNTER_PREFIXES,
+)
+from app.models.post import PostModel
+from app.models.tag import TagModel
+from app.models.comment import CommentModel
+from app.models.user import UserFollowModel
+import logging
+import re
+
+# Vote shards are only written by votes, they are never reset here.
+UNRECONCILED_COUNTER_PATTERN = re.compile(
+    "^(" + "|".join(map(re.escape, UNRECONCILED_COUNTER_PREFIXES)) + ")"
+)
+
+
+def _group_count(model, field: str, name_format: str):
+    pipeline = [
+        {"$match": {"deleted_at": None}},
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+    ]
+    return {
+        name_format.format(group["_id"]): group["count"]
+        for group in model._get_collection().aggregate(pipeline)
+    }
+
+
+def reconcile_counters():
+    """
+    Recomputes every counter from the source collections and repairs drift.
+
+    Counters are incremented next to the writes they track, without a
+    transaction, so a failed request can leave them off by a few.
+    This job is scheduled in create_app.
+
+    Returns
+    -------
+    int
+        Number of repaired counters.
+    """
+    expected = {POSTS_COUNTER: PostModel.objects(deleted_at=None).count()}
+    expected.update(_group_count(PostModel, "author", AUTHOR_POSTS_COUNTER))
+    comment_counts = _group_count(CommentModel, "post_id", "{}")
+    expected.update(
+        (POST_COMMENTS_COUNTER.format(post_id), count)
+        for post_id, count in comment_counts.items()
+    )
+    expected.update(_group_count(UserFollowModel, "followee_id", FOLLOWERS_COUNTER))
+    expected.update(_group_count(UserFollowModel, "follower_id", FOLLOWING_COUNTER))
+
+    current = {
+        counter["name"]: counter["value"]
+        for counter in CounterModel._get_collection().find(
+            {"name": {"$not": UNRECONCILED_COUNTER_PATTERN}}, {"name": 1, "value": 1}
+        )
+    }
+
+    now = datetime.now()
+    operations = [
+        UpdateOne(
+            {"name": name},
+            {"$set": {"value": value, "updated_at": now}},
+            upsert=True,
+        )
+        for name, value in expected.items()
+        if current.get(name) != value
+    ]
+    # Counters without live documents left behind.
+    operations.extend(
+        UpdateOne({"name": name}, {"$set": {"value": 0, "updated_at": now}})
+        for name, value in current.items()
+        if name not in expected and value != 0
+    )
+
+    if operations:
+        CounterModel._get_collection().bulk_write(operations, ordered=False)
+        logging.warning(f"Counter reconciliation repaired {len(operations)} counters.")
+    return (
+        len(operations)
+        + reconcile_tag_post_counts()
+        + reconcile_post_comment_counts(comment_counts)
+    )
+
+
+def reconcile_tag_post_counts():
+    """
+    Repairs TagModel.post_count from the live posts of each tag.
+
+    Returns
+    -------
+    int
+        Number of repaired tags.
+    """
+    pipeline = [
+        {"$match": {"deleted_at": None}},
+        {"$unwind": "$tags"},
+        {"$group": {"_id": "$tags", "count": {"$sum": 1}}},
+    ]
+    expected = {
+        group["_id"]: group["count"]
+        for group in PostModel._get_collection().aggregate(pipeline)
+    }
+    now = datetime.now()
+    operations = [
+        UpdateOne(
+            {"_id": tag["_id"]},
+            {"$set": {"post_count": expected.get(tag["_id"], 0), "updated_at": now}},
+        )
+        for tag in TagModel._get_collection().find({}, {"post_count": 1})
+        if tag.get("post_count") != expected.get(tag["_id"], 0)
+    ]
+    if operations:
+        TagModel._get_collection().bulk_write(operations, ordered=False)
+        logging.warning(
+            f"Counter reconciliation repaired {len(operations)} tag counts."
+        )
+    return len(operations)
+
+
+def reconcile_post_comment_counts(comment_counts=None):
+    """
+    Repairs PostModel.comment_count from the live comments of each post.
+
+    Posts keep their own copy of the count for list pages, next to the
+    POST_COMMENTS_COUNTER counter CommentResource reads.
+
+    Parameters
+    ----------
+    comment_counts: dict, optional
+        Post id string -> live comments, counted here when not given.
+
+    Returns
+    -------
+    int
+        Number of repaired posts.
+    """
+    if comment_counts is None:
+        comment_counts = _group_count(CommentModel, "post_id", "{}")
+    operations = [
+        # The version moves too, post ETags are built from it.
+        UpdateOne(
+            {"_id": post["_id"]},
+            {
+                "$set": {"comment_count": comment_counts.get(str(post["_id"]), 0)},
+                "$inc": {"version": 1},
+            },
+        )
+        for post in PostModel._get_collection().find(
+            {"deleted_at": None}, {"comment_count": 1}
+        )
+        if post.get("comment_count") != comment_counts.get(str(post["_id"]), 0)
+    ]
+    if operations:
+        PostModel._get_collection().bulk_write(operations, ordered=False)
+        logging.warning(
+            f"Counter reconciliation repaired {len(operations)} post comment counts."
+        )
+    return len(operations)
@@ -1,5 +1,11 @@
 import redis
+from flask_restful import current_app
 from mongoengine import connect
+from concurrent.futures import ThreadPoolExecutor
+from app.config import QUERY_WORKERS
+
+# Shared by all requests that run independent MongoDB reads in parallel.
+query_executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS)
 
 
 def connect_mongodb(mongodb_uri, **kwargs):
@@ -10,3 +16,12 @@ def connect_redis(redis_host, redis_port, redis_db, **kwargs):
     return redis.StrictRedis(
         host=redis_host, port=redis_port, db=redis_db, decode_responses=True, **kwargs
     )
+
+
+def get_redis():
+    return current_app.config["redis"]
+
+
+def decode_redis(value):
+    # Clients made by connect_redis decode responses, other clients return bytes.
+    return value.decode("utf-8") if isinstance(value, bytes) else value
@@ -0,0 +1,174 @@
+from flask import g
+from bson import ObjectId
+from collections import OrderedDict
+from threading import Lock
+from app.config import RELATION_CACHE_SIZE, RELATION_CACHE_TTL
+from app.models.user import UserModel
+from app.models.tag import TagModel
+from app.tag_registry import tag_registry, tag_to_dict
+import time
+
+
+class LRUCache:
+    """
+    A thread safe, size bounded cache with a time to live.
+
+    Attributes
+    ----------
+    max_size: int
+    ttl: int
+        In seconds.
+    """
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[1] < now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[0]
+        return found
+
+    def set_many(self, values: dict):
+        expire_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (value, expire_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Process-wide caches for hot entities, behind every request-scoped loader.
+user_cache = LRUCache(RELATION_CACHE_SIZE, RELATION_CACHE_TTL)
+tag_cache = LRUCache(RELATION_CACHE_SIZE, RELATION_CACHE_TTL)
+
+
+def _user_to_dict(user):
+    return {
+        "id": user.id,
+        "name": user.name,
+        "version": user.version,
+        "deleted": user.deleted_at is not None,
+    }
+
+
+class RelationLoader:
+    """
+    Request-scoped batch loader for the users and tags referenced by a response.
+
+    Ids can be queued from several places and are resolved together, with one
+    $in query per kind for the ids that are neither memoized in this request
+    nor found in the process-wide cache, or the tag registry once it is
+    loaded. Entities are returned as dicts.
+
+    Methods
+    -------
+    queue_users(ids)
+        Adds user ids to the next load.
+    load_users(ids)
+        Returns an id -> user map for the given and queued ids.
+    queue_tags(ids)
+        Adds tag ids to the next load.
+    load_tags(ids)
+        Returns an id -> tag map for the given and queued ids.
+    """
+
+    def __init__(self):
+        self._kinds = {
+            "user": (
+                UserModel,
+                ("id", "name", "version", "deleted_at"),
+                _user_to_dict,
+                user_cache,
+            ),
+            "tag": (TagModel, None, tag_to_dict, tag_cache),
+        }
+        self._loaded = {kind: {} for kind in self._kinds}
+        self._queued = {kind: set() for kind in self._kinds}
+
+    def _queue(self, kind: str, ids):
+        for id in ids:
+            if id is not None and ObjectId.is_valid(id):
+                self._queued[kind].add(ObjectId(id))
+
+    def _load(self, kind: str, ids):
+        self._queue(kind, ids)
+        requested, self._queued[kind] = self._queued[kind], set()
+        model, fields, to_dict, cache = self._kinds[kind]
+        if kind == "tag" and tag_registry.ready:
+            # Live tags are all in the registry, only unknown ids are queried.
+            cache = tag_registry
+        loaded = self._loaded[kind]
+
+        missing = [id for id in requested if id not in loaded]
+        if missing:
+            cached = cache.get_many(missing)
+            loaded.update(cached)
+            missing = [id for id in missing if id not in cached]
+        if missing:
+            query = model.objects(id__in=missing)
+            if fields:
+                query = query.only(*fields)
+            found = {document.id: to_dict(document) for document in query}
+            cache.set_many(found)
+            loaded.update(found)
+            # Unknown ids are remembered for this request only.
+            loaded.update({id: None for id in missing if id not in found})
+
+        return {id: dict(loaded[id]) for id in requested if loaded[id] is not None}
+
+    def queue_users(self, ids):
+        self._queue("user", ids)
+
+    def load_users(self, ids):
+        return self._load("user", ids)
+
+    def queue_tags(self, ids):
+        self._queue("tag", ids)
+
+    def load_tags(self, ids):
+        return self._load("tag", ids)
+
+
+def get_loader():
+    """
+    Returns the RelationLoader of the current request.
+    """
+    if "relation_loader" not in g:
+        g.relation_loader = RelationLoader()
+    return g.relation_loader
+
+
+def forget_user(id):
+    """
+    Drops a user from the process-wide cache after it changed.
+    """
+    user_cache.delete(ObjectId(id))
+
+
+def forget_tag(id):
+    """
+    Drops a tag from the process-wide cache after it changed.
+    """
+    tag_cache.delete(ObjectId(id))
@@ -0,0 +1,229 @@
+from pymongo import UpdateOne
+from app.models.post import PostModel
+from app.models.comment import CommentModel
+from app.sanitizer import render_html, RENDER_VERSION
+import click
+import re
+
+MIGRATION_BATCH_SIZE = 1000
+
+
+def _run_in_batches(collection, documents, build_operation):
+    updated_count = 0
+    operations = []
+    for document in documents:
+        operations.append(build_operation(document))
+        if len(operations) == MIGRATION_BATCH_SIZE:
+            updated_count += collection.bulk_write(
+                operations, ordered=False
+            ).modified_count
+            operations = []
+    if operations:
+        updated_count += collection.bulk_write(operations, ordered=False).modified_count
+    return updated_count
+
+
+def backfill_post_list_fields():
+    """
+    Stores summary and comment_count on posts written before they existed.
+
+    Returns
+    -------
+    int
+        Number of updated posts.
+    """
+    collection = PostModel._get_collection()
+    posts = collection.find(
+        {"summary": {"$exists": False}}, {"content": 1, "comments": 1}
+    ).batch_size(MIGRATION_BATCH_SIZE)
+    return _run_in_batches(
+        collection,
+        posts,
+        lambda post: UpdateOne(
+            {"_id": post["_id"]},
+            {
+                "$set": {
+                    "summary": PostModel.create_summary(post.get("content", "")),
+                    "comment_count": len(post.get("comments", [])),
+                }
+            },
+        ),
+    )
+
+
+def backfill_post_slugs():
+    """
+    Moves posts from a stored url to a slug, the url is built at dump time.
+
+    The slug is the last part of the old url. Old urls collided rarely,
+    colliding ones get a numbered suffix like new posts. The taken slugs of
+    each batch are read with one query, see PostModel.create_slugs.
+
+    Returns
+    -------
+    int
+        Number of updated posts.
+    """
+    collection = PostModel._get_collection()
+    posts = collection.find(
+        {"slug": None}, {"url": 1, "title": 1, "created_at": 1}
+    ).batch_size(MIGRATION_BATCH_SIZE)
+    updated_count = 0
+    batch = []
+
+    def base_slug(post):
+        if post.get("url"):
+            return re.sub(r"[^a-zA-Z0-9\-]", "", post["url"].rstrip("/").split("/")[-1])
+        return PostModel.create_base_slug(post["title"], post["created_at"])
+
+    def backfill(posts):
+        slugs = PostModel.create_slugs([base_slug(post) for post in posts])
+        operations = [
+            UpdateOne(
+                {"_id": post["_id"]}, {"$set": {"slug": slug}, "$unset": {"url": ""}}
+            )
+            for post, slug in zip(posts, slugs)
+        ]
+        return collection.bulk_write(operations, ordered=False).modified_count
+
+    for post in posts:
+        batch.append(post)
+        if len(batch) == MIGRATION_BATCH_SIZE:
+            updated_count += backfill(batch)
+            batch = []
+    if batch:
+        updated_count += backfill(batch)
+    return updated_count
+
+
+def drain_post_comments():
+    """
+    Drops the comments arrays of old posts, comments are found by post_id.
+
+    comment_count is recomputed from the live comments of each batch of posts.
+
+    Returns
+    -------
+    int
+        Number of updated posts.
+    """
+    collection = PostModel._get_collection()
+    posts = collection.find({"comments": {"$exists": True}}, {"_id": 1}).batch_size(
+        MIGRATION_BATCH_SIZE
+    )
+    updated_count = 0
+    batch = []
+
+    def drain(post_ids):
+        pipeline = [
+            {"$match": {"post_id": {"$in": post_ids}, "deleted_at": None}},
+            {"$group": {"_id": "$post_id", "count": {"$sum": 1}}},
+        ]
+        counts = {
+            group["_id"]: group["count"]
+            for group in CommentModel._get_collection().aggregate(pipeline)
+        }
+        operations = [
+            UpdateOne(
+                {"_id": post_id},
+                {
+                    "$set": {"comment_count": counts.get(post_id, 0)},
+                    "$unset": {"comments": ""},
+                },
+            )
+            for post_id in post_ids
+        ]
+        return collection.bulk_write(operations, ordered=False).modified_count
+
+    for post in posts:
+        batch.append(post["_id"])
+        if len(batch) == MIGRATION_BATCH_SIZE:
+            updated_count += drain(batch)
+            batch = []
+    if batch:
+        updated_count += drain(batch)
+    return updated_count
+
+
+def rerender_content_html():
+    """
+    Renders content_html again where it was rendered with other allow-lists.
+
+    Live posts and comments whose content_html_version differs from
+    RENDER_VERSION are updated in batches, posts also get a new version so
+    their ETags change. Each update is filtered on the version or updated_at
+    that was read, a document edited in between keeps its newer HTML.
+    It runs once on startup, so a changed allow-list is applied after a deploy.
+
+    Returns
+    -------
+    int
+        Number of updated posts and comments.
+    """
+    query = {"deleted_at": None, "content_html_version": {"$ne": RENDER_VERSION}}
+    collection = PostModel._get_collection()
+    posts = collection.find(query, {"content": 1, "version": 1}).batch_size(
+        MIGRATION_BATCH_SIZE
+    )
+    updated_count = _run_in_batches(
+        collection,
+        posts,
+        lambda post: UpdateOne(
+            {"_id": post["_id"], "version": post.get("version")},
+            {
+                "$set": {
+                    "content_html": render_html(post.get("content", "")),
+                    "content_html_version": RENDER_VERSION,
+                },
+                "$inc": {"version": 1},
+            },
+        ),
+    )
+
+    collection = CommentModel._get_collection()
+    comments = collection.find(query, {"content": 1, "updated_at": 1}).batch_size(
+        MIGRATION_BATCH_SIZE
+    )
+    updated_count += _run_in_batches(
+        collection,
+        comments,
+        lambda comment: UpdateOne(
+            {"_id": comment["_id"], "updated_at": comment.get("updated_at")},
+            {
+                "$set": {
+                    "content_html": render_html(comment.get("content", "")),
+                    "content_html_version": RENDER_VERSION,
+                }
+            },
+        ),
+    )
+    return updated_count
+
+
+def register_commands(app):
+    """
+    Registers the data migrations as Flask CLI commands.
+
+    Usage:
+        flask --app app:create_app <command>
+    """
+
+    @app.cli.command("backfill-post-list-fields")
+    def backfill_post_list_fields_command():
+        """Stores summary and comment_count on old posts."""
+        click.echo(f"{backfill_post_list_fields()} posts updated.")
+
+    @app.cli.command("backfill-post-slugs")
+    def backfill_post_slugs_command():
+        """Replaces the stored url of old posts with a slug."""
+        click.echo(f"{backfill_post_slugs()} posts updated.")
+
+    @app.cli.command("drain-post-comments")
+    def drain_post_comments_command():
+        """Removes the comments arrays of old posts."""
+        click.echo(f"{drain_post_comments()} posts updated.")
+
+    @app.cli.command("rerender-content-html")
+    def rerender_content_html_command():
+        """Sanitizes content_html again after an allow-list change."""
+        click.echo(f"{rerender_content_html()} posts and comments updated.")
@@ -1,5 +1,8 @@
 from mongoengine import fields, Document, EmbeddedDocument
 from datetime import datetime
+from app.models.counter import CounterModel, POST_COMMENTS_COUNTER
+from app.models.post import PostModel
+from app.sanitizer import render_html, RENDER_VERSION
 
 
 class AuthorEmbedded(EmbeddedDocument):
@@ -11,20 +14,50 @@ class CommentModel(Document):
     author = fields.EmbeddedDocumentField(AuthorEmbedded, required=True)
     post_id = fields.ObjectIdField(required=True)
     content = fields.StringField(reuqired=True, max_length=1024)  # 1024 is random value
+    content_html = fields.StringField()
+    content_html_version = fields.StringField()
     created_at = fields.DateTimeField(required=True)
     updated_at = fields.DateTimeField(required=True)
     deleted_at = fields.DateTimeField(required=False, default=None)
 
+    meta = {"indexes": [("post_id", "deleted_at", "created_at", "id")]}
+
     class Meta:
         exclude = ["deleted_at"]
 
     def save(self, *args, **kwargs):
-        if not self.created_at:
+        created = not self.created_at
+        if created:
             self.created_at = datetime.now()
         self.updated_at = datetime.now()
-        return super(CommentModel, self).save(*args, **kwargs)
+        if (
+            created
+            or "content" in self._get_changed_fields()
+            or self.content_html_version != RENDER_VERSION
+        ):
+            self.content_html = render_html(self.content)
+            self.content_html_version = RENDER_VERSION
+        result = super(CommentModel, self).save(*args, **kwargs)
+        if created:
+            self.update_counters(1)
+        return result
+
+    def update_counters(self, value: int):
+        CounterModel.increment(POST_COMMENTS_COUNTER.format(self.post_id), value)
+        # Post details embed their first comments, so their version changes too.
+        PostModel.objects(id=self.post_id).update_one(
+            inc__comment_count=value, inc__version=1
+        )
 
     def soft_delete(self):
-        if not self.deleted_at:
-            self.deleted_at = datetime.now()
-            self.save()
+        """
+        Deletes the comment, concurrent deletes only update the counters once.
+        """
+        now = datetime.now()
+        deleted = CommentModel.objects(id=self.id, deleted_at=None).update_one(
+            set__deleted_at=now, set__updated_at=now
+        )
+        if deleted:
+            self.deleted_at = self.updated_at = now
+            self.update_counters(-1)
+        return bool(deleted)
@@ -0,0 +1,40 @@
+from mongoengine import Document, fields
+from datetime import datetime
+
+# Counter names:
+POSTS_COUNTER = "posts"  # Live posts
+AUTHOR_POSTS_COUNTER = "posts:author:{}"  # Live posts of an author
+POST_COMMENTS_COUNTER = "comments:post:{}"  # Live comments of a post
+FOLLOWERS_COUNTER = "followers:{}"  # Users following a user
+FOLLOWING_COUNTER = "following:{}"  # Users followed by a user
+POST_VOTE_SHARD_COUNTER = "votes:post:{}:{}"  # One vote shard of a promoted post
+# Counters that are not derived from other collections, reconcile_counters skips them.
+UNRECONCILED_COUNTER_PREFIXES = (POST_VOTE_SHARD_COUNTER.split("{")[0],)
+
+
+class CounterModel(Document):
+    name = fields.StringField(required=True, unique=True)
+    value = fields.IntField(required=True, default=0)
+    updated_at = fields.DateTimeField(required=True)
+
+    @classmethod
+    def increment(cls, name: str, value: int = 1):
+        cls.objects(name=name).update_one(
+            inc__value=value, set__updated_at=datetime.now(), upsert=True
+        )
+
+    @classmethod
+    def get_value(cls, name: str):
+        """
+        Returns the value of a counter, None if it was never written.
+        """
+        counter = cls.objects(name=name).only("value").first()
+        return None if counter is None else counter.value
+
+    @classmethod
+    def get_values(cls, names: list):
+        """
+        Returns a name -> value map of the given counters with a single query.
+        """
+        counters = cls.objects(name__in=names).only("name", "value")
+        return {counter.name: counter.value for counter in counters}
@@ -1,38 +1,184 @@
-from mongoengine import Document, fields
+from mongoengine import Document, NotUniqueError, fields
 from datetime import datetime
-from random import randint
+from secrets import token_hex
 from app.config import FRONTEND_ROOT
+from app.models.counter import CounterModel, POSTS_COUNTER, AUTHOR_POSTS_COUNTER
+from app.models.tag import TagModel
+from app.sanitizer import render_html, RENDER_VERSION
 import re
 
+SLUG_SUFFIX_PATTERN = re.compile(r"^(.+)-(\d+)$")
+
 
 class PostModel(Document):
     title = fields.StringField(required=True)
     author = fields.ObjectIdField(required=True)
     content = fields.StringField(required=True)
+    content_html = fields.StringField()
+    content_html_version = fields.StringField()
+    summary = fields.StringField()
     vote = fields.IntField(default=0, required=True)
-    comments = fields.ListField(fields.ObjectIdField(), default=[])
+    hot_score = fields.FloatField(default=0, required=True)
+    comment_count = fields.IntField(default=0, required=True)
     tags = fields.ListField(fields.ObjectIdField(), default=[])
-    url = fields.StringField(required=True)
+    slug = fields.StringField(unique=True, sparse=True)
+    version = fields.IntField(default=0, required=True)
+    # Latest vote buffer flushes applied to vote, see app.vote_buffer.
+    vote_flushes = fields.ListField(fields.StringField(), default=[])
+    # Counter shards of a post promoted by app.vote_shards and the part of
+    # their total already added to vote.
+    vote_shards = fields.IntField()
+    vote_shard_total = fields.IntField()
     created_at = fields.DateTimeField(required=True)
     updated_at = fields.DateTimeField(required=True)
     deleted_at = fields.DateTimeField(required=False, default=None)
 
+    meta = {
+        # Posts written before slugs keep a stored url, and before comment
+        # buckets a comments array, until they are migrated.
+        "strict": False,
+        "indexes": [
+            ("author", "-created_at"),
+            ("author", "-updated_at"),
+            ("deleted_at", "-created_at", "-id"),
+            ("deleted_at", "-vote", "-created_at", "-id"),
+            ("deleted_at", "-hot_score", "-id"),
+            ("tags", "deleted_at", "-created_at", "-id"),
+            ("tags", "deleted_at", "-hot_score", "-id"),
+        ],
+    }
+
+    # Fields needed to render a post in lists, without the full content.
+    LIST_FIELDS = (
+        "id",
+        "title",
+        "author",
+        "summary",
+        "tags",
+        "vote",
+        "vote_shards",
+        "vote_shard_total",
+        "hot_score",
+        "comment_count",
+        "slug",
+        "created_at",
+        "updated_at",
+    )
+
     class Meta:
         exclude = ["deleted_at"]
 
     def save(self, *args, **kwargs):
-        if not self.created_at:
+        created = not self.created_at
+        if created:
             self.created_at = datetime.now()
-            self.url = self.create_url(self.title, self.created_at)
+            self.slug = self.create_slug(self.title, self.created_at)
         self.updated_at = datetime.now()
-        return super(PostModel, self).save(*args, **kwargs)
+        self.version += 1
+        self.set_list_fields()
+        try:
+            result = super(PostModel, self).save(*args, **kwargs)
+        except NotUniqueError:
+            if not created:
+                raise
+            # Lost a race for the same slug, a random suffix settles it.
+            self.slug = f"{self.slug}-{token_hex(3)}"
+            result = super(PostModel, self).save(*args, **kwargs)
+        if created:
+            self.update_counters(1)
+        return result
+
+    @property
+    def url(self):
+        if self.slug is None:
+            return self._data.get("url")
+        return self.create_url(self.slug)
+
+    def set_list_fields(self):
+        # Only recomputed when their source fields change,
+        # comment_count is kept by CommentModel with $inc.
+        changed_fields = self._get_changed_fields()
+        if self._created or "content" in changed_fields:
+            self.summary = self.create_summary(self.content)
+        if (
+            self._created
+            or "content" in changed_fields
+            or self.content_html_version != RENDER_VERSION
+        ):
+            # Reads serve the stored HTML, it is only sanitized here.
+            self.content_html = render_html(self.content)
+            self.content_html_version = RENDER_VERSION
+
+    @staticmethod
+    def create_summary(content: str):
+        return content[:200] + "..."
+
+    def update_counters(self, value: int):
+        CounterModel.increment(POSTS_COUNTER, value)
+        CounterModel.increment(AUTHOR_POSTS_COUNTER.format(self.author), value)
+        TagModel.increment_post_count(self.tags, value)
+
+    @staticmethod
+    def create_url(slug: str):
+        # WARN(ahmet): in prod, we need more s'es, (https)
+        return "http://" + FRONTEND_ROOT + "/post/" + slug
+
+    @staticmethod
+    def create_base_slug(title: str, created_at: datetime):
+        raw_slug = f"{'-'.join(title.lower().split())}-{created_at.strftime('%Y%m%d')}"
+        return re.sub(r"[^a-zA-Z0-9\-]", "", raw_slug).strip("-")
+
+    @classmethod
+    def create_slug(cls, title: str, created_at: datetime):
+        """
+        Returns a free slug, "<title>-<date>" or "<title>-<date>-<n>".
+        """
+        return cls.create_slugs([cls.create_base_slug(title, created_at)])[0]
+
+    @classmethod
+    def create_slugs(cls, base_slugs: [str]):
+        """
+        Returns a free slug for each base slug, repeated bases get increasing suffixes.
+
+        Taken slugs of all bases are read in one query, an $or of anchored
+        regexes on the slug index, so the next free suffix is known without
+        trying them in turn.
+        """
+        patterns = {
+            base_slug: re.compile(rf"^{re.escape(base_slug)}(-(\d+))?$")
+            for base_slug in set(base_slugs)
+        }
+        taken = cls._get_collection().find(
+            {"$or": [{"slug": pattern} for pattern in patterns.values()]}, {"slug": 1}
+        )
+        last_suffix = dict.fromkeys(patterns, 0)
+        for document in taken:
+            slug = document["slug"]
+            candidates = [(slug, 1)]
+            match = SLUG_SUFFIX_PATTERN.match(slug)
+            if match:
+                candidates.append((match.group(1), int(match.group(2))))
+            for base_slug, suffix in candidates:
+                if base_slug in last_suffix:
+                    last_suffix[base_slug] = max(last_suffix[base_slug], suffix)
 
-    def create_url(self, title, created_at):
-        raw_url = f"{'-'.join(title.lower().split())}-{created_at.strftime('%Y%m%d')}{randint(1000, 9999)}"
-        endpoint = re.sub(r"[^a-zA-Z0-9\-]", "", raw_url)
-        return "http://" + FRONTEND_ROOT + "/post/" + endpoint
+        slugs = []
+        for base_slug in base_slugs:
+            last_suffix[base_slug] += 1
+            suffix = last_suffix[base_slug]
+            slugs.append(base_slug if suffix == 1 else f"{base_slug}-{suffix}")
+        return slugs
 
     def soft_delete(self):
-        if not self.deleted_at:
-            self.deleted_at = datetime.now()
-            self.save()
+        """
+        Deletes the post, concurrent deletes only update the counters once.
+        """
+        now = datetime.now()
+        deleted = PostModel.objects(id=self.id, deleted_at=None).update_one(
+            set__deleted_at=now, set__updated_at=now, inc__version=1
+        )
+        if deleted:
+            self.deleted_at = self.updated_at = now
+            self.version += 1
+            self.update_counters(-1)
+        return bool(deleted)
@@ -1,5 +1,6 @@
 from mongoengine import fields, Document
 from datetime import datetime
+from bson import ObjectId
 
 
 class TagModel(Document):
@@ -8,6 +9,17 @@ class TagModel(Document):
     created_at = fields.DateTimeField(required=True)
     updated_at = fields.DateTimeField(required=True)
     deleted_at = fields.DateTimeField(required=False, default=None)
+    version = fields.IntField(default=0, required=True)
+    post_count = fields.IntField(default=0, required=True)  # Live posts with this tag
+
+    meta = {
+        "indexes": [
+            ("name", "deleted_at"),
+            # GET /tag orderings.
+            ("deleted_at", "name", "id"),
+            ("deleted_at", "-post_count", "-id"),
+        ]
+    }
 
     class Meta:
         exclude = ["deleted_at"]
@@ -16,9 +28,48 @@ class TagModel(Document):
         if not self.created_at:
             self.created_at = datetime.now()
         self.updated_at = datetime.now()
+        self.version += 1
         return super(TagModel, self).save(*args, **kwargs)
 
     def soft_delete(self):
         if not self.deleted_at:
             self.deleted_at = datetime.now()
             self.save()
+
+    @classmethod
+    def increment_post_count(cls, tag_ids, value: int = 1):
+        # updated_at moves too, the tag list ETag is built from it.
+        if tag_ids:
+            cls.objects(id__in=list(tag_ids)).update(
+                inc__post_count=value, set__updated_at=datetime.now()
+            )
+
+    @classmethod
+    def apply_post_count_deltas(cls, deltas: dict):
+        """
+        Applies tag id -> post count changes, with one update per distinct change.
+        """
+        tag_ids_by_delta = {}
+        for tag_id, delta in deltas.items():
+            if delta:
+                tag_ids_by_delta.setdefault(delta, []).append(tag_id)
+        for delta, tag_ids in tag_ids_by_delta.items():
+            cls.increment_post_count(tag_ids, delta)
+
+    @staticmethod
+    def normalize_name(name: str):
+        return str(name).lower().capitalize()
+
+    @classmethod
+    def resolve_id(cls, value: str):
+        """
+        Resolves a tag id or tag name to a tag id.
+
+        Returns None if no tag is named so.
+        """
+        if ObjectId.is_valid(value):
+            return ObjectId(value)
+
+        name = cls.normalize_name(value)
+        tag = cls.objects(name=name, deleted_at=None).only("id").first()
+        return tag.id if tag else None
@@ -1,6 +1,7 @@
 from mongoengine import Document, fields
 from datetime import datetime
 from app.models.post import PostModel
+from app.models.counter import CounterModel, FOLLOWERS_COUNTER, FOLLOWING_COUNTER
 from app.config import APP_NAME
 import pyotp
 
@@ -14,11 +15,13 @@ class UserModel(Document):
     created_at = fields.DateTimeField(required=True)
     updated_at = fields.DateTimeField(required=True)
     deleted_at = fields.DateTimeField(required=False, default=None)
+    version = fields.IntField(default=0, required=True)
 
     def save(self, *args, **kwargs):
         if not self.created_at:
             self.created_at = datetime.now()
         self.updated_at = datetime.now()
+        self.version += 1
         return super(UserModel, self).save(*args, **kwargs)
 
     def set_2fa_secret_token(self):
@@ -51,12 +54,43 @@ class UserFollowModel(Document):
     created_at = fields.DateTimeField(required=True)
     deleted_at = fields.DateTimeField(required=False, default=None)
 
+    meta = {
+        "indexes": [
+            ("follower_id", "followee_id", "deleted_at"),
+            ("followee_id", "deleted_at"),
+        ]
+    }
+
     def save(self, *args, **kwargs):
-        if not self.created_at:
+        created = not self.created_at
+        if created:
             self.created_at = datetime.now()
-        return super(UserFollowModel, self).save(*args, **kwargs)
+        result = super(UserFollowModel, self).save(*args, **kwargs)
+        if created:
+            self.update_counters(1)
+        return result
+
+    def update_counters(self, value: int):
+        CounterModel.increment(FOLLOWERS_COUNTER.format(self.followee_id), value)
+        CounterModel.increment(FOLLOWING_COUNTER.format(self.follower_id), value)
+
+    # Both are conditional updates, so concurrent requests only update the
+    # counters once.
+    def restore(self):
+        restored = UserFollowModel.objects(id=self.id, deleted_at__ne=None).update_one(
+            set__deleted_at=None
+        )
+        if restored:
+            self.deleted_at = None
+            self.update_counters(1)
+        return bool(restored)
 
     def soft_delete(self):
-        if not self.deleted_at:
-            self.deleted_at = datetime.now()
-            self.save()
+        now = datetime.now()
+        deleted = UserFollowModel.objects(id=self.id, deleted_at=None).update_one(
+            set__deleted_at=now
+        )
+        if deleted:
+            self.deleted_at = now
+            self.update_counters(-1)
+        return bool(deleted)
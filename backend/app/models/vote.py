@@ -1,4 +1,7 @@
 from mongoengine import fields, Document
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
 
 
 class VoteModel(Document):
@@ -6,3 +9,60 @@ class VoteModel(Document):
     post_id = fields.ObjectIdField(required=True)
     vote_value = fields.IntField(required=True)
     # In feed, upvote moves post point 1 up, downvote moves post point 2-3 down...
+
+    meta = {"indexes": [{"fields": ("author", "post_id"), "unique": True}]}
+
+    @classmethod
+    def set_value(cls, author, post_id, vote_value: int):
+        """
+        Stores a user's vote on a post with one upsert and returns the previous value.
+
+        Returns None when the user had not voted, a blank vote never creates one.
+        """
+        collection = cls._get_collection()
+        query = {"author": ObjectId(author), "post_id": ObjectId(post_id)}
+        try:
+            previous = collection.find_one_and_update(
+                query,
+                {"$set": {"vote_value": vote_value}},
+                projection={"vote_value": 1},
+                upsert=vote_value != 0,
+                return_document=ReturnDocument.BEFORE,
+            )
+        except DuplicateKeyError:
+            # Lost the race for the first vote, the other request inserted it.
+            previous = collection.find_one_and_update(
+                query,
+                {"$set": {"vote_value": vote_value}},
+                projection={"vote_value": 1},
+                return_document=ReturnDocument.BEFORE,
+            )
+        return None if previous is None else previous["vote_value"]
+
+    @classmethod
+    def restore_value(cls, author, post_id, vote_value):
+        """
+        Undoes set_value, vote_value is the value it returned.
+        """
+        query = {"author": ObjectId(author), "post_id": ObjectId(post_id)}
+        if vote_value is None:
+            cls._get_collection().delete_one(query)
+        else:
+            cls._get_collection().update_one(
+                query, {"$set": {"vote_value": vote_value}}
+            )
+
+    @classmethod
+    def get_values(cls, author, post_ids):
+        """
+        Returns a user's votes on the given posts, post id -> vote value.
+
+        One query on the (author, post_id) index, posts without a vote are left out.
+        """
+        post_ids = list(post_ids)
+        if not post_ids:
+            return {}
+        votes = cls.objects(author=author, post_id__in=post_ids).only(
+            "post_id", "vote_value"
+        )
+        return {vote.post_id: vote.vote_value for vote in votes}
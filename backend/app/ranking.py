@@ -0,0 +1,116 @@
+from pymongo import UpdateOne
+from datetime import datetime, timedelta
+from app.config import HOT_SCORE_GRAVITY, HOT_SCORE_WINDOW
+from app.models.post import PostModel
+import numpy as np
+
+HOT_SCORE_BATCH_SIZE = 10000
+
+
+def hot_score(vote: int, created_at: datetime, now: datetime = None):
+    """
+    Calculates the "hot" ranking score of a post.
+
+    Votes are divided by the post's age in hours raised to HOT_SCORE_GRAVITY,
+    so new posts with a few votes outrank old posts with many.
+
+    Parameters
+    ----------
+    vote: int
+    created_at: datetime
+    now: datetime, optional
+
+    Returns
+    -------
+    float
+    """
+    now = now or datetime.now()
+    age_hours = max((now - created_at).total_seconds() / 3600, 0)
+    return vote / (age_hours + 2) ** HOT_SCORE_GRAVITY
+
+
+def hot_scores(votes, created_at, now: datetime = None):
+    """
+    Vectorized hot_score over arrays of votes and creation timestamps.
+
+    Parameters
+    ----------
+    votes: numpy.ndarray
+    created_at: numpy.ndarray
+        Creation times as POSIX timestamps.
+    now: datetime, optional
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+    now = now or datetime.now()
+    age_hours = np.maximum((now.timestamp() - created_at) / 3600, 0)
+    return votes / np.power(age_hours + 2, HOT_SCORE_GRAVITY)
+
+
+def _write_hot_scores(collection, batch, now):
+    ids = [post["_id"] for post in batch]
+    votes = np.fromiter((post.get("vote", 0) for post in batch), float, len(batch))
+    created_at = np.fromiter(
+        (post["created_at"].timestamp() for post in batch), float, len(batch)
+    )
+    scores = hot_scores(votes, created_at, now)
+    collection.bulk_write(
+        [
+            UpdateOne({"_id": post_id}, {"$set": {"hot_score": float(score)}})
+            for post_id, score in zip(ids, scores)
+        ],
+        ordered=False,
+    )
+
+
+def recompute_hot_scores(now: datetime = None):
+    """
+    Recomputes the decayed hot score of every post in the active window.
+
+    Posts are streamed in batches of HOT_SCORE_BATCH_SIZE with a projection,
+    scored with NumPy and written back with one bulk_write per batch.
+    Posts older than HOT_SCORE_WINDOW hours drop to a score of 0, so they
+    sink below every newer post with upvotes.
+
+    Parameters
+    ----------
+    now: datetime, optional
+
+    Returns
+    -------
+    int
+        Number of updated posts.
+    """
+    now = now or datetime.now()
+    window_start = now - timedelta(hours=HOT_SCORE_WINDOW)
+    collection = PostModel._get_collection()
+    # Votes cast after a post left the window move its score again, only
+    # the posts with a score are matched, on the hot_score index.
+    updated_count = collection.update_many(
+        {
+            "deleted_at": None,
+            "$or": [{"hot_score": {"$gt": 0}}, {"hot_score": {"$lt": 0}}],
+            "created_at": {"$lt": window_start},
+        },
+        {"$set": {"hot_score": 0}},
+    ).modified_count
+
+    posts = collection.find(
+        {"deleted_at": None, "created_at": {"$gte": window_start}},
+        {"vote": 1, "created_at": 1},
+    ).batch_size(HOT_SCORE_BATCH_SIZE)
+
+    batch = []
+    batch = []
+    for post in posts:
+        batch.append(post)
+        if len(batch) == HOT_SCORE_BATCH_SIZE:
+            _write_hot_scores(collection, batch, now)
+            updated_count += len(batch)
+            batch = []
+    if batch:
+        _write_hot_scores(collection, batch, now)
+        updated_count += len(batch)
+    return updated_count
@@ -1,12 +1,37 @@
 from flask_restful import Resource, request
 from bson import ObjectId
-from app.utils import paginate_query, create_audit_log
+from app.utils import (
+    paginate_query,
+    cursor_paginate,
+    create_audit_log,
+    COUNT_MODES,
+)
 
 from app.middleware.auth import auth_required
 from app.models.comment import CommentModel, AuthorEmbedded
 from app.models.post import PostModel
+from app.models.counter import CounterModel, POST_COMMENTS_COUNTER
 from app.schemas.comment import comment_schema
 
+COMMENT_PAGE_SIZE = 50
+COMMENT_SORT = ["created_at"]
+
+
+def get_comment_page(post_id, limit: int = COMMENT_PAGE_SIZE, cursor: str = None):
+    """
+    Returns one page of a post's comments, oldest first.
+
+    Parameters:
+        post_id (ObjectId): Post ID
+        limit (int): Page size.
+        cursor (str): next_cursor of the previous page, None for the first page.
+
+    Returns:
+        tuple: Comments and the next cursor, None on the last page.
+    """
+    query = CommentModel.objects(post_id=post_id, deleted_at=None)
+    return cursor_paginate(query, limit, COMMENT_SORT, cursor)
+
 
 class CommentResource(Resource):
     """
@@ -24,14 +49,40 @@ class CommentResource(Resource):
         Parameters:
             id (ObjectId): Post ID Value
 
+        Query Parameters:
+            - page (int, optional): Page number. Default is 1.
+            - limit (int, optional): Number of comments per page. Default is 50.
+            - count (str, optional): 'exact', 'estimate' or 'none' to leave the
+              total out. The stored comment counter is used when it exists.
+              Default is 'exact'.
+            - cursor (str, optional): Keyset pagination cursor, oldest first. Pass
+              an empty value for the first page and the returned next_cursor for
+              the following ones.
+
         Returns:
             JSON: List of comments with pagination as JSON
         """
         page = request.args.get("page", 1, type=int)
-        limit = request.args.get("limit", 50, type=int)
+        limit = request.args.get("limit", COMMENT_PAGE_SIZE, type=int)
+        count = request.args.get("count", "exact", type=str).lower()
+        cursor = request.args.get("cursor", None, type=str)
+        if count not in COUNT_MODES:
+            return {"error": "Invalid count mode."}, 400
 
         query = CommentModel.objects(post_id=id, deleted_at=None)
-        return paginate_query(query, page, limit, comment_schema)
+        total_count = None
+        if cursor is None and count != "none":
+            total_count = CounterModel.get_value(POST_COMMENTS_COUNTER.format(id))
+        return paginate_query(
+            query,
+            page,
+            limit,
+            comment_schema,
+            COMMENT_SORT,
+            total_count=total_count,
+            count=count,
+            cursor=cursor,
+        )
 
     @auth_required
     def post(self):
@@ -46,9 +97,11 @@ class CommentResource(Resource):
         if errors:
             return {"error": "Unallowed attribute."}, 400
 
-        try:
-            post = PostModel.objects(id=values["post_id"], deleted_at=None).get()
-        except PostModel.DoesNotExist:
+        if (
+            not PostModel.objects(id=values["post_id"], deleted_at=None)
+            .only("id")
+            .first()
+        ):
             return {"error": "Post not found."}, 404
 
         created_comment = CommentModel(
@@ -56,9 +109,6 @@ class CommentResource(Resource):
             post_id=values["post_id"],
             content=values["content"],
         ).save()
-
-        post.comments.append(created_comment.id)
-        post.save()
         create_audit_log(
             5,
             request.remote_addr,
@@ -93,6 +143,8 @@ class CommentResource(Resource):
         for key, value in data.items():
             setattr(comment, key, value)
         comment.save()
+        # Post details embed their comments, their ETag must change too.
+        PostModel.objects(id=comment.post_id).update_one(inc__version=1)
         create_audit_log(
             5,
             request.remote_addr,
@@ -120,13 +172,6 @@ class CommentResource(Resource):
                 return {"error": "You are not authorized for this event."}, 401
         except CommentModel.DoesNotExist:
             return {}, 204
-        try:
-            post = PostModel.objects(id=comment["post_id"], deleted_at=None).get()
-        except PostModel.DoesNotExist:
-            return {}, 204
-
-        post.comments.remove(comment.id)
-        post.save()
         comment.soft_delete()
         create_audit_log(
             5,
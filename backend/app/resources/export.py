@@ -0,0 +1,101 @@
+from flask import Response, json, stream_with_context
+from flask_restful import request
+from bson import ObjectId
+from datetime import datetime
+from app.middleware.auth import auth_required
+from app.models.post import PostModel
+from app.tag_registry import resolve_tag_id
+from app.schemas.post import PostSchema
+from app.loader import RelationLoader
+import logging
+
+EXPORT_BATCH_SIZE = 500
+EXPORT_EXCLUDED_FIELDS = ("deleted_at", "comments", "content_html")
+
+
+def _serialize_batch(posts, schema):
+    # A loader per batch keeps memory flat on exports with many authors.
+    loader = RelationLoader()
+    loader.queue_tags(tag_id for post in posts for tag_id in post["tags"])
+    author_data_map = loader.load_users(post["author"] for post in posts)
+    tag_data_map = loader.load_tags([])
+
+    lines = []
+    for post in posts:
+        author = author_data_map.get(post["author"])
+        post["author"] = {
+            "id": post["author"],
+            "name": author["name"] if author else "Anonymous",
+        }
+        post["tags"] = [
+            {
+                "id": tag_id,
+                "name": (
+                    tag_data_map[tag_id]["name"]
+                    if tag_id in tag_data_map
+                    else "Unknown"
+                ),
+            }
+            for tag_id in post["tags"]
+        ]
+        lines.append(json.dumps(schema.dump(post)) + "\n")
+    return "".join(lines)
+
+
+def _stream_posts(query):
+    schema = PostSchema(exclude=EXPORT_EXCLUDED_FIELDS)
+    batch = []
+    try:
+        for post in query:
+            batch.append(post)
+            if len(batch) == EXPORT_BATCH_SIZE:
+                yield _serialize_batch(batch, schema)
+                batch = []
+        if batch:
+            yield _serialize_batch(batch, schema)
+    except Exception as error:
+        # Headers are already sent, the client sees a truncated export.
+        logging.error(f"Post export failed: {error}")
+        raise
+
+
+@auth_required
+def export_posts_view():
+    """
+    Streams posts as newline delimited JSON, oldest first.
+
+    Endpoint:
+        GET /export/posts
+
+    Query Parameters:
+        - author (str, optional): Only posts of this user ID.
+        - since (str, optional): Only posts created at or after this ISO 8601 date.
+        - tag (str, optional): Only posts with this tag, given by id or name.
+
+    Returns:
+        application/x-ndjson: One post per line, serialized with PostSchema.
+    """
+    author = request.args.get("author", None, type=str)
+    since = request.args.get("since", None, type=str)
+    tag = request.args.get("tag", None, type=str)
+
+    query = PostModel.objects(deleted_at=None)
+    if author:
+        if not ObjectId.is_valid(author):
+            return {"error": "Invalid author."}, 400
+        query = query.filter(author=author)
+    if since:
+        try:
+            query = query.filter(created_at__gte=datetime.fromisoformat(since))
+        except ValueError:
+            return {"error": "Invalid since date."}, 400
+    if tag:
+        tag_id = resolve_tag_id(tag)
+        if tag_id is None:
+            return {"error": "Tag not found."}, 404
+        query = query.filter(tags=tag_id)
+
+    query = query.order_by("created_at", "id").no_cache().batch_size(EXPORT_BATCH_SIZE)
+    return Response(
+        stream_with_context(_stream_posts(query)), mimetype="application/x-ndjson"
+    )
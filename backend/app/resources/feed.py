@@ -1,10 +1,30 @@
 from flask_restful import Resource, request
 from app.models.post import PostModel
-from app.models.user import UserModel, UserFollowModel
-from app.models.tag import TagModel
+from app.models.counter import CounterModel, POSTS_COUNTER, AUTHOR_POSTS_COUNTER
 from app.schemas.post import PostSchema
-from app.models.tag import TagModel
 from app.middleware.auth import check_token
+from app.utils import (
+    apply_cursor,
+    clamp_limit,
+    decode_cursor,
+    sort_key,
+    split_cursor_page,
+    InvalidCursorError,
+)
+from app.config import FOLLOWED_FEED_CHUNK_SIZE
+from app.database import query_executor
+from app.cache import cached_response
+from app.loader import get_loader
+from app.tag_registry import resolve_tag_id
+from app.vote_buffer import get_pending_deltas, get_my_votes
+from app.vote_shards import get_shard_deltas
+from app.timeline import read_timeline, hydrate_posts, get_followee_ids
+from redis import RedisError
+from itertools import islice
+import heapq
+import logging
+
+FEED_EXCLUDED_FIELDS = ("deleted_at", "comments", "summary", "content_html")
 
 
 class FeedResource(Resource):
@@ -17,112 +37,261 @@ class FeedResource(Resource):
         - limit (int, optional): Number of posts per page. Default is 50.
         - vote (str, optional): Sorting order based on votes. Use 'asc' for ascending and 'desc' for descending.
         - date (str, optional): Sorting order based on creation date. Use 'asc' for ascending and 'desc' for descending.
+        - sort (str, optional): Use 'hot' to rank posts by the stored hot score,
+          vote and date are ignored.
+        - tag (str, optional): Only posts with this tag, given by id or name.
         - q (str, optional): Filter posts based on followed users. Use 'followed' to filter posts from followed users only.
+        - cursor (str, optional): Keyset pagination cursor. Pass an empty value for
+          the first page and the returned next_cursor for the following ones.
+          Replaces page and skips counting the collection.
 
     Returns:
         A paginated feed of posts based on the specified parameters.
+        Anonymous responses are served from the Redis response cache,
+        signed-in users get their vote on each post as my_vote.
     """
 
+    @cached_response
     def get(self):
         page = request.args.get("page", 1, type=int)
         limit = request.args.get("limit", 50, type=int)
         sort_vote = request.args.get("vote", None, type=str)
         sort_date = request.args.get("date", "desc", type=str)
         sort_tag = request.args.get("tag", None, type=str)
+        sort_by = request.args.get("sort", None, type=str)
         followed_only = request.args.get("q", None, type=str)
+        cursor = request.args.get("cursor", None, type=str)
+        limit = clamp_limit(limit)
 
         sort_values = []
 
-        if sort_vote:
+        if sort_by == "hot":
+            sort_values.append("-hot_score")
+        elif sort_vote:
             if sort_vote.lower() == "asc":
                 sort_values.append("vote")
             else:
                 sort_values.append("-vote")
-        if sort_date:
+        if sort_date and sort_by != "hot":
             if sort_date.lower() == "asc":
                 sort_values.append("created_at")
             else:
                 sort_values.append("-created_at")
 
+        if cursor:
+            try:
+                decode_cursor(cursor, sort_values)
+            except InvalidCursorError:
+                return {"error": "Invalid cursor."}, 400
+
+        tag_id = None
+        if sort_tag:
+            tag_id = resolve_tag_id(sort_tag)
+            if tag_id is None:
+                return {"error": "No results found."}, 404
+
         skip = (page - 1) * limit
-        if followed_only == "followed" and check_token(request) == True:
-            followed_users = UserFollowModel.objects.filter(
-                follower_id=request.user["id"]
-            ).only("followee_id")
-
-            if len(followed_users) == 0:
-                results = (
-                    PostModel.objects(deleted_at=None)
-                    .skip(skip)
-                    .limit(limit)
-                    .order_by(*sort_values)
-                )
-            else:
-                followed_users = [followed.followee_id for followed in followed_users]
-                results = (
-                    PostModel.objects(author__in=followed_users, deleted_at=None)
-                    .skip(skip)
-                    .limit(limit)
-                    .order_by(*sort_values)
-                )
-        else:
-            results = (
-                PostModel.objects(deleted_at=None)
-                .skip(skip)
-                .limit(limit)
-                .order_by(*sort_values)
+        # In cursor mode one extra post is fetched to detect the last page.
+        fetch_limit = limit + 1 if cursor is not None else limit
+        viewer_id = None
+        if request.headers.get("Authorization") and check_token(request) == True:
+            viewer_id = request.user["id"]
+        results = None
+        if followed_only == "followed" and viewer_id:
+            results = self.get_followed_posts(
+                viewer_id, sort_values, fetch_limit, skip, cursor, tag_id
             )
+        followed_feed = results is not None
 
-        author_ids = [post["author"] for post in results]
-        author_data = UserModel.objects(id__in=author_ids).only("id", "name")
-        author_data_map = {author.id: author.name for author in author_data}
-
-        for post in results:
-            author_id = post["author"]
-            author_name = author_data_map.get(author_id, "Anonymous")
-            post["author"] = {"id": author_id, "name": author_name}
-
-        nested_tag_ids = [post["tags"] for post in results]
-        tag_ids = []
-        [tag_ids.extend(inner_list) for inner_list in nested_tag_ids]
-        tag_data = TagModel.objects(id__in=tag_ids).only("id", "name")
-        tag_data_map = {tag["id"]: tag["name"] for tag in tag_data}
-
-        if sort_tag and sort_tag in tag_data_map.values():
-            new_results = []
-            outher_results = []
-            for post in results:
-                if sort_tag in [tag_data_map[tag] for tag in post["tags"]]:
-                    new_results.append(post)
-                else:
-                    outher_results.append(post)
-            results = new_results + outher_results
-
-        for post in results:
-            # Convert content to a summary
-            post["content"] = post["content"][:200] + "..."
-            post_tag_ids = post["tags"]
-            temp_tags = []
-            for id in post_tag_ids:
-                tag_name = tag_data_map.get(id, "Unknown")
-                temp_tags.append({"id": id, "name": tag_name})
-            post["tags"] = temp_tags
-
-        total_count = PostModel.objects(deleted_at=None).count()
-        total_pages = (total_count + limit - 1) // limit
+        if results is None:
+            query = PostModel.objects(deleted_at=None).only(*PostModel.LIST_FIELDS)
+            if tag_id:
+                query = query.filter(tags=tag_id)
+            if cursor is not None:
+                results = apply_cursor(query, sort_values, cursor).limit(fetch_limit)
+            else:
+                results = query.skip(skip).limit(limit).order_by(*sort_values)
+
+        next_cursor = None
+        if cursor is not None:
+            results, next_cursor = split_cursor_page(list(results), limit, sort_values)
 
-        feed_schema = PostSchema(exclude=("deleted_at", "comments"))
+        results = prepare_feed_posts(results, viewer_id)
 
-        if results:
+        if not results:
+            return {"error": "No results found."}, 404
+
+        feed_schema = PostSchema(exclude=FEED_EXCLUDED_FIELDS)
+        if cursor is not None:
             return {
                 "results": feed_schema.dump(results, many=True),
-                "pagination": {
-                    "current_page": page,
-                    "next_page": None if page == total_pages else page + 1,
-                    "prev_page": None if page == 1 else page - 1,
-                    "total_count": total_count,
-                    "total_pages": total_pages,
-                },
+                "pagination": {"next_cursor": next_cursor, "limit": limit},
             }, 200
-        else:
-            return {"error": "No results found."}, 404
+
+        total_count = self.get_total_count(followed_feed, tag_id)
+        total_pages = (total_count + limit - 1) // limit
+
+        return {
+            "results": feed_schema.dump(results, many=True),
+            "pagination": {
+                "current_page": page,
+                "next_page": None if page == total_pages else page + 1,
+                "prev_page": None if page == 1 else page - 1,
+                "total_count": total_count,
+                "total_pages": total_pages,
+            },
+        }, 200
+
+    @staticmethod
+    def get_total_count(followed_feed, tag_id=None):
+        """
+        Reads the number of posts in the feed from the materialized counters.
+        """
+        if tag_id:
+            query = PostModel.objects(tags=tag_id, deleted_at=None)
+            if followed_feed:
+                query = query.filter(author__in=get_followee_ids(request.user["id"]))
+            return query.count()
+
+        if followed_feed:
+            counter_names = [
+                AUTHOR_POSTS_COUNTER.format(followee_id)
+                for followee_id in get_followee_ids(request.user["id"])
+            ]
+            return sum(CounterModel.get_values(counter_names).values())
+
+        total_count = CounterModel.get_value(POSTS_COUNTER)
+        if total_count is None:
+            total_count = PostModel.objects(deleted_at=None).count()
+        return total_count
+
+    @staticmethod
+    def get_followed_posts(
+        user_id, sort_values, limit, skip=0, cursor=None, tag_id=None
+    ):
+        """
+        Returns one page of posts from the users followed by the given user.
+
+        Newest-first pages are read from the materialized home timeline,
+        other orderings and tag filtered pages query the followed authors directly.
+        Pages past the TIMELINE_MAX_LENGTH posts the timeline keeps are
+        queried directly too.
+
+        Returns:
+            List of posts, or None if the user follows nobody.
+        """
+        if sort_values == ["-created_at"] and tag_id is None:
+            try:
+                post_ids = read_timeline(user_id, limit, skip, cursor)
+                if post_ids:
+                    return hydrate_posts(post_ids, PostModel.LIST_FIELDS)
+            except RedisError as error:
+                logging.error(f"Timeline read failed for user {user_id}: {error}")
+
+        followed_users = get_followee_ids(user_id)
+        if len(followed_users) == 0:
+            return None
+
+        return merge_followed_posts(
+            followed_users,
+            sort_values,
+            limit,
+            0 if cursor is not None else skip,
+            cursor,
+            tag_id,
+        )
+
+
+def merge_followed_posts(
+    followee_ids, sort_values, limit, skip=0, cursor=None, tag_id=None
+):
+    """
+    Returns one page of posts written by the given authors.
+
+    Authors are split into chunks of FOLLOWED_FEED_CHUNK_SIZE, so long follow
+    lists never send one huge $in. Each chunk is queried on the author index
+    in parallel, and the sorted chunk results are merged with a heap. The
+    keyset cursor is shared by all chunks: it points right after the last
+    returned post, which is where every chunk stopped.
+
+    Parameters:
+        followee_ids (List[str]): Author ids.
+        sort_values (List[str]): Ordering, e.g. ["-created_at"].
+        limit (int): Page size.
+        skip (int): Posts to skip in page mode.
+        cursor (str): Keyset pagination cursor, None in page mode.
+        tag_id (ObjectId): Only posts with this tag.
+
+    Returns:
+        List[PostModel]: Posts loaded with PostModel.LIST_FIELDS.
+    """
+
+    def fetch_chunk(author_ids):
+        query = PostModel.objects(author__in=author_ids, deleted_at=None).only(
+            *PostModel.LIST_FIELDS
+        )
+        if tag_id:
+            query = query.filter(tags=tag_id)
+        return list(apply_cursor(query, sort_values, cursor).limit(skip + limit))
+
+    chunks = [
+        followee_ids[index : index + FOLLOWED_FEED_CHUNK_SIZE]
+        for index in range(0, len(followee_ids), FOLLOWED_FEED_CHUNK_SIZE)
+    ]
+    if len(chunks) == 1:
+        chunk_results = [fetch_chunk(chunks[0])]
+    else:
+        chunk_results = list(query_executor.map(fetch_chunk, chunks))
+
+    merged = heapq.merge(*chunk_results, key=sort_key(sort_values))
+    return list(islice(merged, skip, skip + limit))
+
+
+def prepare_feed_posts(posts, viewer_id=None):
+    """
+    Replaces author and tag ids with their names and content with the summary,
+    votes still buffered in Redis or on shards are added.
+
+    Parameters:
+        posts (Iterable[PostModel]): Posts of one page, loaded with
+            PostModel.LIST_FIELDS.
+        viewer_id (str, optional): Signed-in user, their votes are set as my_vote.
+
+    Returns:
+        List[PostModel]: The prepared posts, ready for PostSchema.
+    """
+    posts = list(posts)
+    loader = get_loader()
+    loader.queue_tags(tag_id for post in posts for tag_id in post["tags"])
+    author_data_map = loader.load_users(post["author"] for post in posts)
+    tag_data_map = loader.load_tags([])
+    vote_deltas = get_pending_deltas(post["id"] for post in posts)
+    shard_deltas = get_shard_deltas(posts)
+    my_votes = (
+        get_my_votes(viewer_id, (post["id"] for post in posts)) if viewer_id else {}
+    )
+
+    for post in posts:
+        post["vote"] += vote_deltas.get(post["id"], 0) + shard_deltas.get(post["id"], 0)
+        if viewer_id:
+            post.my_vote = my_votes[post["id"]]
+        author_id = post["author"]
+        author = author_data_map.get(author_id)
+        post["author"] = {
+            "id": author_id,
+            "name": author["name"] if author else "Anonymous",
+        }
+        # Lists show the summary stored at write time, content is not loaded.
+        post["content"] = post["summary"]
+        post["tags"] = [
+            {
+                "id": tag_id,
+                "name": (
+                    tag_data_map[tag_id]["name"]
+                    if tag_id in tag_data_map
+                    else "Unknown"
+                ),
+            }
+            for tag_id in post["tags"]
+        ]
+    return posts
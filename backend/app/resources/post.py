@@ -1,18 +1,56 @@
 from flask_restful import Resource, request
 from bson import ObjectId
-from app.utils import decode_token, create_audit_log
+from mongoengine import Q
+from app.utils import (
+    clamp_limit,
+    decode_token,
+    create_audit_log,
+    cursor_paginate,
+    InvalidCursorError,
+)
 from app.models.post import PostModel
 from app.models.user import UserModel, UserFollowModel
-from app.models.comment import CommentModel
 from app.models.vote import VoteModel
 from app.models.tag import TagModel
+from app.models.counter import (
+    CounterModel,
+    POSTS_COUNTER,
+    AUTHOR_POSTS_COUNTER,
+    FOLLOWERS_COUNTER,
+    FOLLOWING_COUNTER,
+)
 from app.schemas.post import post_schema, PostSchema
 from app.schemas.user import UserSchema
 from app.schemas.comment import comment_schema
+from app.resources.comment import get_comment_page, COMMENT_PAGE_SIZE
 from app.schemas.tag import tag_schema
-from app.config import FRONTEND_ROOT
 from app.middleware.auth import auth_required, check_token
+from app.timeline import fan_out_post, fan_out_posts, remove_post
+from app.search import index_posts, reindex_posts, unindex_posts
+from app.sanitizer import render_html, RENDER_VERSION
+from app.vote_buffer import get_pending_deltas, get_pending_vote, get_my_votes
+from app.vote_shards import get_shard_deltas
+from app.cache import invalidate_feed_cache, make_etag, etag_header, not_modified
+from app.loader import get_loader
+from app.database import query_executor
+from app.config import BULK_POST_LIMIT
 from jwt import PyJWTError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime
+from secrets import token_hex
+from collections import Counter
+
+PROFILE_POST_FIELDS = (
+    "id",
+    "title",
+    "summary",
+    "comment_count",
+    "slug",
+    "created_at",
+    "updated_at",
+)
+PROFILE_SORT = ["-updated_at"]
 
 
 class ShowPostResource(Resource):
@@ -24,31 +62,67 @@ class ShowPostResource(Resource):
         id (str): Post ID or URL slug.
 
     Returns:
-        JSON: Post details, including associated comments.
+        JSON: Post details, including the first page of comments and the
+        cursor of the next one, see CommentResource.get.
+        Answers 304 when If-None-Match matches the post's weak ETag.
     """
 
+    ETAG_FIELDS = (
+        "id",
+        "author",
+        "tags",
+        "version",
+        "updated_at",
+        "vote_shards",
+        "vote_shard_total",
+    )
+
     def get(self, id):
-        try:
-            if ObjectId.is_valid(id):
-                post = PostModel.objects(id=id, deleted_at=None).get()
+        viewer_id = None
+        if request.headers.get("Authorization"):
+            try:
+                viewer_id = decode_token(
+                    request.headers.get("Authorization").split(" ")[-1]
+                )["id"]
+            except PyJWTError:
+                return {"error": "Invalid token."}, 401
 
-            else:
-                url = (
-                    "http://" + FRONTEND_ROOT + "/post/" + id
-                )  # WARN(ahmet): in prod, we need more s'es, (https)
-                post = PostModel.objects(url=url, deleted_at=None).get()
-        except PostModel.DoesNotExist:
+        if request.if_none_match:
+            # Revalidation only reads the fields the ETag is built from.
+            post = self.find_post(id, self.ETAG_FIELDS)
+            if post is None:
+                return {"error": "Post not found"}, 404
+            response = not_modified(self.get_etag(post, viewer_id))
+            if response:
+                return response
+
+        # Reads that only need the post id run in parallel with the post itself,
+        # author and tags are resolved through the relation loader meanwhile.
+        post_future = query_executor.submit(lambda: self.find_post(id))
+        related_futures = None
+        if ObjectId.is_valid(id):
+            related_futures = self.fetch_related(id, viewer_id)
+
+        post = post_future.result()
+        if post is None:
             return {"error": "Post not found"}, 404
-        comments = CommentModel.objects.filter(
-            id__in=post.comments, deleted_at=None
-        ).limit(50)
-        comments = comment_schema.dump(comments, many=True)
-
-        if not comments:
-            comments = []
+        if related_futures is None:
+            related_futures = self.fetch_related(post.id, viewer_id)
+        comments_future, vote_future = related_futures
+
+        etag = self.get_etag(post, viewer_id)
+        loader = get_loader()
+        author = loader.load_users([post.author]).get(post.author)
+        if author is None or author["deleted"]:
+            author = {"id": None, "name": "Deleted User"}
 
         if post.tags != None:
-            tags = TagModel.objects.filter(id__in=post.tags, deleted_at=None).limit(10)
+            tag_data_map = loader.load_tags(post.tags)
+            tags = [
+                tag_data_map[tag_id]
+                for tag_id in post.tags
+                if tag_id in tag_data_map and not tag_data_map[tag_id]["deleted"]
+            ][:10]
             tags = tag_schema.dump(tags, many=True)
 
             if not tags:
@@ -56,30 +130,118 @@ class ShowPostResource(Resource):
             else:
                 post.tags = tags
 
-        try:
-            author = UserModel.objects(id=post.author, deleted_at=None).get()
-        except UserModel.DoesNotExist:
-            author = {"id": None, "name": "Deleted User"}
-            pass
+        comments, comments_next_cursor = comments_future.result()
+        comments = comment_schema.dump(comments, many=True)
+        if not comments:
+            comments = []
 
-        if request.headers.get("Authorization"):
-            try:
-                decoded_token = decode_token(
-                    request.headers.get("Authorization").split(" ")[-1]
-                )
-                recent_vote = VoteModel.objects(
-                    author=decoded_token["id"], post_id=post.id
-                ).get()
-                if recent_vote:
-                    setattr(author, "vote", recent_vote.vote_value)
-            except VoteModel.DoesNotExist:
-                pass
-            except PyJWTError:
-                return {"error": "Invalid token."}, 401
+        recent_vote = vote_future.result() if vote_future else None
+        if recent_vote:
+            author["vote"] = recent_vote.vote_value
+        if viewer_id:
+            pending_vote = get_pending_vote(viewer_id, post.id)
+            if pending_vote is not None:
+                author["vote"] = pending_vote
+        post.vote += get_pending_deltas([post.id]).get(post.id, 0)
+        post.vote += get_shard_deltas([post]).get(post.id, 0)
 
         post.author = author
         post.comments = comments
-        return post_schema.dump(post)
+        post_details = post_schema.dump(post)
+        post_details["comments_pagination"] = {
+            "next_cursor": comments_next_cursor,
+            "limit": COMMENT_PAGE_SIZE,
+        }
+        return post_details, 200, etag_header(etag)
+
+    @staticmethod
+    def find_post(id, fields=None):
+        """
+        Reads a live post by id or slug, or by the url stored before slugs.
+        """
+        if ObjectId.is_valid(id):
+            queries = [PostModel.objects(deleted_at=None, id=id)]
+        else:
+            # Posts not moved by backfill-post-slugs yet only have their old url.
+            queries = [
+                PostModel.objects(deleted_at=None, slug=id),
+                PostModel.objects(
+                    deleted_at=None, __raw__={"url": PostModel.create_url(id)}
+                ),
+            ]
+        for query in queries:
+            post = (query.only(*fields) if fields else query).first()
+            if post is not None:
+                return post
+        return None
+
+    @staticmethod
+    def get_etag(post, viewer_id=None):
+        """
+        Builds the ETag of a post detail from the versions of the post, its author
+        and tags.
+
+        Authors and tags come from the relation loader, so they are usually
+        served from the process cache.
+        """
+        loader = get_loader()
+        loader.queue_tags(post.tags or [])
+        author = loader.load_users([post.author]).get(post.author)
+        tag_data_map = loader.load_tags([])
+        return make_etag(
+            post.id,
+            post.version,
+            post.updated_at,
+            author["version"] if author else None,
+            *[
+                tag_data_map[tag_id]["version"]
+                for tag_id in post.tags
+                if tag_id in tag_data_map
+            ],
+            viewer_id,
+            # Buffered and shard votes have not changed the post's version yet.
+            get_pending_deltas([post.id]).get(post.id),
+            get_pending_vote(viewer_id, post.id) if viewer_id else None,
+            get_shard_deltas([post]).get(post.id),
+        )
+
+    @staticmethod
+    def fetch_related(post_id, viewer_id=None):
+        """
+        Starts loading the first comment page and the viewer's vote of a post.
+
+        Returns:
+            tuple: Futures of the comments and the vote, the latter is None for
+                anonymous viewers.
+        """
+        comments_future = query_executor.submit(get_comment_page, post_id)
+        vote_future = None
+        if viewer_id:
+            vote_future = query_executor.submit(
+                lambda: VoteModel.objects(author=viewer_id, post_id=post_id).first()
+            )
+        return comments_future, vote_future
+
+
+def validate_post_values(values):
+    """
+    Validates the body of a new post, tags are given as a list of tag ids.
+
+    Returns:
+        tuple: Error message or None, and the unique tag ids or None.
+    """
+    if not isinstance(values, dict):
+        return "Unallowed attribute.", None
+    errors = post_schema.validate(values)
+    if not errors:
+        return None, None
+    if (
+        list(errors) == ["tags"]
+        and isinstance(values["tags"], list)
+        and all(ObjectId.is_valid(item) for item in values["tags"])
+    ):
+        return None, list(set(values["tags"]))
+    return "Unallowed attribute.", None
 
 
 class PostResource(Resource):
@@ -99,18 +261,19 @@ class PostResource(Resource):
         Returns:
             JSON: List of user's posts.
         """
-        excluded_fields = ["content", "comments", "vote", "tags"]
         posts = (
             PostModel.objects.filter(author=request.user["id"], deleted_at=None)
             .order_by("-updated_at")
-            .exclude(*excluded_fields)
+            .only(*PROFILE_POST_FIELDS)
         )
 
         if not posts:
             return {"error": "No post found."}, 404
         for obj in posts:
             obj.author = {"id": request.user["id"], "name": request.user["name"]}
-        return PostSchema(exclude=excluded_fields).dump(posts, many=True)
+        return PostSchema(only=PROFILE_POST_FIELDS + ("url", "author")).dump(
+            posts, many=True
+        )
 
     @auth_required
     def post(self):
@@ -121,20 +284,13 @@ class PostResource(Resource):
             JSON: Message indicating successful post creation and post details.
         """
         values = request.get_json()
-        errors = post_schema.validate(values)
-        tag_ids = None
-        if errors:
-            if (
-                errors.get("tags")
-                and isinstance(values["tags"], list)
-                and all(ObjectId.is_valid(item) for item in values["tags"])
-            ):
-                tag_ids = list(set(values["tags"]))
-                tags = TagModel.objects(id__in=tag_ids, deleted_at=None)
-                if len(tags) != len(tag_ids):
-                    return {"error": "Invalid tag id."}, 400
-            else:
-                return {"error": "Unallowed attribute."}, 400
+        error, tag_ids = validate_post_values(values)
+        if error:
+            return {"error": error}, 400
+        if tag_ids:
+            tags = TagModel.objects(id__in=tag_ids, deleted_at=None)
+            if len(tags) != len(tag_ids):
+                return {"error": "Invalid tag id."}, 400
 
         created_post = PostModel(
             title=values["title"],
@@ -146,6 +302,9 @@ class PostResource(Resource):
             created_post.tags = tag_ids
 
         created_post.save()
+        fan_out_post(created_post)
+        index_posts([created_post])
+        invalidate_feed_cache()
 
         return {
             "message": "Post created successfully.",
@@ -176,6 +335,8 @@ class PostResource(Resource):
         for key, value in data.items():
             setattr(post, key, value)
         post.save()
+        index_posts([post])
+        invalidate_feed_cache()
         create_audit_log(
             5,
             request.remote_addr,
@@ -183,9 +344,8 @@ class PostResource(Resource):
             f"Post {post.id} updated.",
         )
 
-        comments = CommentModel.objects.filter(id__in=post.comments).limit(50)
-        comments = comment_schema.dump(comments, many=True)
-        post.comments = comments
+        comments, _ = get_comment_page(post.id)
+        post.comments = comment_schema.dump(comments, many=True)
 
         return post_schema.dump(post)
 
@@ -215,6 +375,9 @@ class PostResource(Resource):
             return {"error": "You are not authorized for this event."}, 401
 
         post.soft_delete()
+        remove_post(post)
+        unindex_posts([post.id])
+        invalidate_feed_cache()
         return {}, 204
 
 
@@ -249,12 +412,13 @@ class PostTagsView(Resource):
         per_page = request.args.get("limit", default=10, type=int)
         start_index = (page - 1) * per_page
 
-        tags = (
-            TagModel.objects.filter(id__in=post.tags, deleted_at=None)
-            .skip(start_index)
-            .limit(per_page)
-        )
-        return tag_schema.dump(tags, many=True)
+        tag_data_map = get_loader().load_tags(post.tags)
+        tags = [
+            tag_data_map[tag_id]
+            for tag_id in post.tags
+            if tag_id in tag_data_map and not tag_data_map[tag_id]["deleted"]
+        ]
+        return tag_schema.dump(tags[start_index : start_index + per_page], many=True)
 
     @auth_required
     def post(self, id):
@@ -270,29 +434,30 @@ class PostTagsView(Resource):
         params = request.get_json()
         try:
             if params["id"] != None and ObjectId.is_valid(params["id"]):
-                tag_id = params["id"]
+                tag_id = ObjectId(params["id"])
             else:
                 return {"error": "No tag found with this id."}, 400
         except KeyError:
             return {"error": "id field is required."}, 400
 
-        try:
-            post = PostModel.objects(
-                id=id, author=request.user["id"], deleted_at=None
-            ).get()
-        except PostModel.DoesNotExist:
-            return {"error": "Post not found"}, 404
-
-        try:
-            tag = TagModel.objects(id=tag_id, deleted_at=None).get()
-        except TagModel.DoesNotExist:
+        tag = get_loader().load_tags([tag_id]).get(tag_id)
+        if tag is None or tag["deleted"]:
             return {"error": "Tag not found"}, 404
 
-        for item in post.tags:
-            if item == tag.id:
-                return {"error": "Tag already exists."}, 400
-        post.tags.append(tag["id"])
-        post.save()
+        # Only matches when the tag is missing, so concurrent adds count once.
+        added = PostModel.objects(
+            id=id, author=request.user["id"], deleted_at=None, tags__ne=tag_id
+        ).update_one(
+            add_to_set__tags=tag_id, inc__version=1, set__updated_at=datetime.now()
+        )
+        if not added:
+            if not self.find_own_post(id):
+                return {"error": "Post not found"}, 404
+            return {"error": "Tag already exists."}, 400
+
+        TagModel.increment_post_count([tag_id], 1)
+        reindex_posts([id])
+        invalidate_feed_cache()
         return {"message": "Tag added successfully."}, 201
 
     @auth_required
@@ -315,59 +480,390 @@ class PostTagsView(Resource):
         except KeyError:
             return {"error": "id field is required."}, 400
 
-        try:
-            post = PostModel.objects(
-                id=id, author=request.user["id"], deleted_at=None
-            ).get()
-        except PostModel.DoesNotExist:
-            return {"error": "Post not found"}, 404
+        # Only matches when the tag is present, so concurrent removals count once.
+        removed = PostModel.objects(
+            id=id, author=request.user["id"], deleted_at=None, tags=tag_id
+        ).update_one(pull__tags=tag_id, inc__version=1, set__updated_at=datetime.now())
+        if not removed:
+            if not self.find_own_post(id):
+                return {"error": "Post not found"}, 404
+            return {"error": "No tag found with this id in post tags."}, 404
+
+        TagModel.increment_post_count([tag_id], -1)
+        reindex_posts([id])
+        invalidate_feed_cache()
+        return {"message": "Tag removed successfully."}, 204
+
+    @staticmethod
+    def find_own_post(id):
+        # Only read after a conditional update matched nothing, to pick the error.
+        return (
+            PostModel.objects(id=id, author=request.user["id"], deleted_at=None)
+            .only("id")
+            .first()
+        )
 
-        if post.tags == None:
-            return {"error": "No tags found."}, 404
-        else:
-            if ObjectId(tag_id) in post.tags:
-                post.tags.remove(ObjectId(tag_id))
-                post.save()
-                return {"message": "Tag removed successfully."}, 204
-            else:
-                return {"error": "No tag found with this id in post tags."}, 404
+
+def get_profile_etag(
+    user, counters, latest_post, page_posts, viewer_id=None, page=None, my_votes=None
+):
+    """
+    Builds the ETag of a user's profile page.
+
+    Follow and post counters catch follows and deleted posts, the latest
+    updated_at catches new posts, the versions of the page's posts catch
+    edits and comment counts, my_votes the viewer's votes.
+    """
+    return make_etag(
+        user.id,
+        user.version,
+        user.updated_at,
+        *[counters.get(name, 0) for name in sorted(counters)],
+        latest_post.updated_at if latest_post else None,
+        *[f"{post.id}:{post.version}" for post in page_posts],
+        viewer_id,
+        page,
+        *(my_votes or {}).values(),
+    )
+
+
+def get_follow_flags(viewer_id, user_id):
+    """
+    Returns (is_following, is_follower) of the viewer towards a user, from one query.
+    """
+    viewer_id, user_id = str(viewer_id), str(user_id)
+    follows = UserFollowModel.objects(
+        Q(follower_id=viewer_id, followee_id=user_id)
+        | Q(follower_id=user_id, followee_id=viewer_id),
+        deleted_at=None,
+    ).only("follower_id")
+    follower_ids = {follow.follower_id for follow in follows}
+    return viewer_id in follower_ids, user_id in follower_ids
+
+
+def get_latest_post(user_id):
+    return (
+        PostModel.objects(author=user_id, deleted_at=None)
+        .order_by("-updated_at")
+        .only("updated_at")
+        .first()
+    )
 
 
 def get_other_users_posts_with_user_id(id):
+    """
+    Shows a user's profile with their posts, last updated first.
+
+    Endpoint:
+        GET /user/<id>/post
+
+    Query Parameters:
+        - limit (int, optional): Number of posts per page. Default is 50.
+        - cursor (str, optional): next_cursor of the previous page.
+
+    Returns:
+        JSON: User details, one page of posts and the next cursor.
+        Signed-in users get their vote on each post as my_vote.
+        Answers 304 when If-None-Match matches the page's weak ETag.
+    """
+    viewer_id = request.user["id"] if check_token(request) == True else None
+    limit = request.args.get("limit", 50, type=int)
+    cursor = request.args.get("cursor", None, type=str)
+    limit = clamp_limit(limit)
+    page = f"{limit}:{cursor or ''}"
+    counter_names = [
+        FOLLOWERS_COUNTER.format(id),
+        FOLLOWING_COUNTER.format(id),
+        AUTHOR_POSTS_COUNTER.format(id),
+    ]
+    if request.if_none_match:
+        # Revalidation reads the user's version, the counters, the latest post
+        # and the ids and versions of the page's posts only.
+        user = (
+            UserModel.objects(id=id, deleted_at=None)
+            .only("id", "version", "updated_at")
+            .first()
+        )
+        if user is None:
+            return {"error": "User not found."}, 404
+        try:
+            page_posts, _ = cursor_paginate(
+                PostModel.objects(author=id, deleted_at=None).only(
+                    "id", "version", "updated_at"
+                ),
+                limit,
+                PROFILE_SORT,
+                cursor,
+            )
+        except InvalidCursorError:
+            return {"error": "Invalid cursor."}, 400
+        my_votes = None
+        if viewer_id:
+            my_votes = get_my_votes(viewer_id, (post.id for post in page_posts))
+        etag = get_profile_etag(
+            user,
+            CounterModel.get_values(counter_names),
+            get_latest_post(id),
+            page_posts,
+            viewer_id,
+            page,
+            my_votes,
+        )
+        response = not_modified(etag)
+        if response:
+            return response
+
     try:
         user = UserModel.objects.get(id=id, deleted_at=None)
     except UserModel.DoesNotExist:
         return {"error": "User not found."}, 404
 
-    excluded_fields = ["content", "comments", "vote", "tags", "author"]
-    posts = (
-        PostModel.objects.filter(author=id, deleted_at=None)
-        .order_by("-updated_at")
-        .exclude(*excluded_fields)
+    query = PostModel.objects(author=id, deleted_at=None).only(
+        *PROFILE_POST_FIELDS, "version"
     )
+    try:
+        posts, next_cursor = cursor_paginate(query, limit, PROFILE_SORT, cursor)
+    except InvalidCursorError:
+        return {"error": "Invalid cursor."}, 400
 
     user_details = UserSchema(exclude=["email"]).dump(user)
-    post_details = PostSchema(exclude=excluded_fields).dump(posts, many=True)
+    counters = CounterModel.get_values(counter_names)
+    user_details["followers_count"] = counters.get(FOLLOWERS_COUNTER.format(id), 0)
+    user_details["following_count"] = counters.get(FOLLOWING_COUNTER.format(id), 0)
+    my_votes = None
+    if viewer_id:
+        my_votes = get_my_votes(viewer_id, (post.id for post in posts))
+        for post in posts:
+            post.my_vote = my_votes[post.id]
+    post_details = PostSchema(only=PROFILE_POST_FIELDS + ("url", "my_vote")).dump(
+        posts, many=True
+    )
+    # The first page starts with the latest post, later pages read it.
+    latest_post = get_latest_post(id) if cursor else (posts[0] if posts else None)
+    etag = get_profile_etag(
+        user, counters, latest_post, posts, viewer_id, page, my_votes
+    )
 
-    if check_token(request) == True:
-        # check following
-        try:
-            UserFollowModel.objects.get(
-                follower_id=request.user["id"], followee_id=id, deleted_at=None
-            )
+    if viewer_id:
+        is_following, is_follower = get_follow_flags(viewer_id, id)
+        if is_following:
             user_details["is_following"] = True  # I'm following this person
-        except UserFollowModel.DoesNotExist:
-            pass
-        # check if user following request.user["id"]
-        try:
-            UserFollowModel.objects.get(
-                follower_id=id, followee_id=request.user["id"], deleted_at=None
-            )
+        if is_follower:
             user_details["is_follower"] = True  # This person following me
-        except UserFollowModel.DoesNotExist:
-            pass
 
+    return (
+        {
+            "user": user_details,
+            "posts": post_details,
+            "pagination": {"next_cursor": next_cursor, "limit": limit},
+        },
+        200,
+        etag_header(etag),
+    )
+
+
+def _insert_posts(posts):
+    # Unordered, so one failed post does not stop the rest of the batch.
+    collection = PostModel._get_collection()
+    failed = {}
+    try:
+        collection.insert_many([post.to_mongo() for post in posts], ordered=False)
+    except BulkWriteError as error:
+        failed = {item["index"]: item for item in error.details["writeErrors"]}
+    return failed
+
+
+@auth_required
+def bulk_posts_view():
+    """
+    Creates and updates up to BULK_POST_LIMIT posts of the authenticated user.
+
+    Endpoint:
+        POST /post/bulk
+
+    Body:
+        {
+            "posts": [
+                {"title": "string", "content": "string", "tags": ["TagID"]},
+                {"id": "PostID", "title": "string", "content": "string"}
+            ]
+        }
+        Items with an id update that post, the others create a new one.
+
+    Returns:
+        JSON: One result per item, in request order, with its own status code.
+    """
+    values = request.get_json()
+    items = values.get("posts") if isinstance(values, dict) else None
+    if not isinstance(items, list) or not items:
+        return {"error": "Unallowed attribute."}, 400
+    if len(items) > BULK_POST_LIMIT:
+        return {"error": f"At most {BULK_POST_LIMIT} posts are allowed."}, 400
+
+    results = [None] * len(items)
+    valid = {}
+    seen_ids = set()
+    for index, item in enumerate(items):
+        item = dict(item) if isinstance(item, dict) else None
+        post_id = item.pop("id", None) if item is not None else None
+        if post_id is not None and not ObjectId.is_valid(post_id):
+            results[index] = {"status": 404, "error": "Post not found"}
+            continue
+        if post_id is not None:
+            post_id = str(ObjectId(post_id))
+            if post_id in seen_ids:
+                results[index] = {"status": 400, "error": "Duplicate post id."}
+                continue
+            seen_ids.add(post_id)
+        error, tag_ids = validate_post_values(item)
+        if error:
+            results[index] = {"status": 400, "error": error}
+            continue
+        valid[index] = (post_id, item, tag_ids or [])
+
+    # Every referenced tag is checked with one query.
+    tag_ids = {tag_id for _, _, item_tags in valid.values() for tag_id in item_tags}
+    live_tag_ids = set()
+    if tag_ids:
+        live_tag_ids = {
+            str(tag_id)
+            for tag_id in TagModel.objects(
+                id__in=list(tag_ids), deleted_at=None
+            ).scalar("id")
+        }
+    for index, (_, _, item_tags) in list(valid.items()):
+        if not live_tag_ids.issuperset(item_tags):
+            results[index] = {"status": 400, "error": "Invalid tag id."}
+            del valid[index]
+
+    author_id = ObjectId(request.user["id"])
+    now = datetime.now()
+    creates = [(index, item) for index, item in valid.items() if item[0] is None]
+    updates = [(index, item) for index, item in valid.items() if item[0] is not None]
+
+    created_posts = []
+    tag_deltas = Counter()
+    if creates:
+        posts = [
+            PostModel(
+                title=item["title"],
+                author=author_id,
+                content=item["content"],
+                summary=PostModel.create_summary(item["content"]),
+                content_html=render_html(item["content"]),
+                content_html_version=RENDER_VERSION,
+                tags=[ObjectId(tag_id) for tag_id in tag_ids],
+                created_at=now,
+                updated_at=now,
+                version=1,
+            )
+            for _, (_, item, tag_ids) in creates
+        ]
+        slugs = PostModel.create_slugs(
+            [PostModel.create_base_slug(post.title, now) for post in posts]
+        )
+        for post, slug in zip(posts, slugs):
+            post.id = ObjectId()
+            post.slug = slug
+            post.validate()
+
+        failed = _insert_posts(posts)
+        # Slugs taken meanwhile by other writers get a random suffix, once.
+        retry = [
+            position for position, error in failed.items() if error["code"] == 11000
+        ]
+        if retry:
+            for position in retry:
+                posts[position].slug = f"{posts[position].slug}-{token_hex(3)}"
+                del failed[position]
+            retry_failed = _insert_posts([posts[position] for position in retry])
+            failed.update(
+                {retry[position]: error for position, error in retry_failed.items()}
+            )
+
+        for position, (index, _) in enumerate(creates):
+            if position in failed:
+                results[index] = {"status": 500, "error": "An error occurred."}
+                continue
+            created_posts.append(posts[position])
+            results[index] = {
+                "status": 201,
+                "post_id": str(posts[position].id),
+                "url": posts[position].url,
+            }
+
+        if created_posts:
+            CounterModel.increment(POSTS_COUNTER, len(created_posts))
+            CounterModel.increment(
+                AUTHOR_POSTS_COUNTER.format(author_id), len(created_posts)
+            )
+            fan_out_posts(created_posts)
+            index_posts(created_posts)
+            tag_deltas.update(tag_id for post in created_posts for tag_id in post.tags)
+
+    updated_ids = []
+    if updates:
+        owned_posts = {
+            str(post.id): post
+            for post in PostModel.objects(
+                id__in=[post_id for _, (post_id, _, _) in updates], deleted_at=None
+            ).only("id", "author")
+        }
+        operations = []
+        for index, (post_id, item, tag_ids) in updates:
+            if post_id not in owned_posts:
+                results[index] = {"status": 404, "error": "Post not found"}
+                continue
+            if owned_posts[post_id].author != author_id:
+                results[index] = {
+                    "status": 401,
+                    "error": "You are not authorized for this event.",
+                }
+                continue
+            changes = {
+                "title": item["title"],
+                "content": item["content"],
+                "summary": PostModel.create_summary(item["content"]),
+                "content_html": render_html(item["content"]),
+                "content_html_version": RENDER_VERSION,
+                "updated_at": now,
+            }
+            query = {"_id": ObjectId(post_id), "author": author_id, "deleted_at": None}
+            update = {"$set": changes, "$inc": {"version": 1}}
+            if "tags" in item:
+                # Tag counts move by the tags the update replaced, read with it.
+                changes["tags"] = [ObjectId(tag_id) for tag_id in tag_ids]
+                previous = PostModel._get_collection().find_one_and_update(
+                    query, update, projection={"tags": 1}
+                )
+                if previous is None:
+                    results[index] = {"status": 404, "error": "Post not found"}
+                    continue
+                tag_deltas.subtract(previous.get("tags", []))
+                tag_deltas.update(changes["tags"])
+            else:
+                operations.append(UpdateOne(query, update))
+            results[index] = {"status": 200, "post_id": post_id}
+            updated_ids.append(ObjectId(post_id))
+        if operations:
+            PostModel._get_collection().bulk_write(operations, ordered=False)
+        if updated_ids:
+            reindex_posts(updated_ids)
+
+    updated_count = len(updated_ids)
+
+    TagModel.apply_post_count_deltas(tag_deltas)
+    if created_posts or updated_count:
+        invalidate_feed_cache()
+    create_audit_log(
+        5,
+        request.remote_addr,
+        request.user_agent,
+        f"Bulk posts: {len(created_posts)} created, {updated_count} updated.",
+    )
     return {
-        "user": user_details,
-        "posts": post_details,
-    }
+        "results": results,
+        "created_count": len(created_posts),
+        "updated_count": updated_count,
+        "failed_count": len(items) - len(created_posts) - updated_count,
+    }, 200
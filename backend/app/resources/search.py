@@ -0,0 +1,75 @@
+from flask_restful import request
+from app.models.post import PostModel
+from app.schemas.post import PostSchema
+from app.search import search_index
+from app.utils import (
+    clamp_limit,
+    decode_cursor,
+    split_cursor_page,
+    InvalidCursorError,
+)
+from app.resources.feed import FEED_EXCLUDED_FIELDS, prepare_feed_posts
+
+SEARCH_SORT = ["-score"]
+
+
+def search_posts_view():
+    """
+    Full-text search over post titles and contents, best matches first.
+
+    Endpoint:
+        GET /search
+
+    Query Parameters:
+        - q (str): Search terms.
+        - tags (str, optional): Use 'true' to also match the terms against tag names.
+        - limit (int, optional): Number of posts per page. Default is 50.
+        - cursor (str, optional): next_cursor of the previous page.
+
+    Returns:
+        JSON: List of posts with their scores and the next cursor.
+    """
+    q = request.args.get("q", "", type=str).strip()
+    include_tags = request.args.get("tags", "false", type=str).lower() == "true"
+    limit = request.args.get("limit", 50, type=int)
+    cursor = request.args.get("cursor", None, type=str)
+    limit = clamp_limit(limit)
+
+    if not q:
+        return {"error": "q field is required."}, 400
+    if not search_index.ready:
+        return {"error": "Search index is not ready."}, 503
+
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, SEARCH_SORT)
+        except InvalidCursorError:
+            return {"error": "Invalid cursor."}, 400
+
+    hits = [
+        {"score": score, "id": id}
+        for score, id in search_index.search(q, limit + 1, after, include_tags)
+    ]
+    hits, next_cursor = split_cursor_page(hits, limit, SEARCH_SORT)
+    if not hits:
+        return {"error": "No results found."}, 404
+
+    posts = {
+        post.id: post
+        for post in PostModel.objects(
+            id__in=[hit["id"] for hit in hits], deleted_at=None
+        ).only(*PostModel.LIST_FIELDS)
+    }
+    # Posts deleted since the index was updated are skipped.
+    hits = [hit for hit in hits if hit["id"] in posts]
+    results = PostSchema(exclude=FEED_EXCLUDED_FIELDS).dump(
+        prepare_feed_posts(posts[hit["id"]] for hit in hits), many=True
+    )
+    for result, hit in zip(results, hits):
+        result["score"] = round(hit["score"], 4)
+
+    return {
+        "results": results,
+        "pagination": {"next_cursor": next_cursor, "limit": limit},
+    }, 200
@@ -1,11 +1,33 @@
 from flask_restful import Resource, request
 from bson import ObjectId
+from datetime import datetime
 
-from app.utils import create_audit_log
+from app.utils import (
+    clamp_limit,
+    create_audit_log,
+    cursor_paginate,
+    paginate_query,
+    InvalidCursorError,
+    COUNT_MODES,
+)
 from app.middleware.auth import auth_required
 from app.models.tag import TagModel
 from app.schemas.tag import tag_schema
 from app.models.post import PostModel
+from app.schemas.post import PostSchema
+from app.resources.feed import prepare_feed_posts, FEED_EXCLUDED_FIELDS
+from app.search import reindex_posts
+from app.cache import (
+    cached_response,
+    invalidate_feed_cache,
+    make_etag,
+    etag_header,
+    not_modified,
+)
+from app.loader import forget_tag
+from app.tag_registry import publish_tag_change, resolve_tag_id
+
+TAG_SORTS = {"name": ["name"], "popular": ["-post_count"]}
 
 
 class TagResource(Resource):
@@ -20,25 +42,82 @@ class TagResource(Resource):
 
     def get(self, id=None):
         """
-        Lists the tags.
+        Lists the tags, or shows one.
 
         Parameters:
             id (ObjectId, optional): Tag ID Value
 
+        Query Parameters:
+            - sort (str, optional): 'name' or 'popular' for the most used tags
+              first. Default is 'name'.
+            - page (int, optional): Page number. Default is 1.
+            - limit (int, optional): Number of tags per page. Default is 50.
+            - count (str, optional): 'exact', 'estimate' or 'none' to leave the
+              total out.
+            - cursor (str, optional): Keyset pagination cursor, replaces page.
+
         Returns:
             JSON: List of tags with pagination as JSON
+            Answers 304 when If-None-Match matches the weak ETag.
         """
-        if id is None:
-            tags = TagModel.objects.filter(deleted_at=None)
-        else:
-            tags = TagModel.objects(id=id, deleted_at=None).get()
+        if id is not None:
+            return self.get_tag(id)
+
+        sort = request.args.get("sort", "name", type=str).lower()
+        page = request.args.get("page", 1, type=int)
+        limit = request.args.get("limit", 50, type=int)
+        count = request.args.get("count", "exact", type=str).lower()
+        cursor = request.args.get("cursor", None, type=str)
+        if sort not in TAG_SORTS:
+            return {"error": "Invalid sort."}, 400
+        if count not in COUNT_MODES:
+            return {"error": "Invalid count mode."}, 400
+
+        body, status = paginate_query(
+            TagModel.objects(deleted_at=None),
+            page,
+            limit,
+            tag_schema,
+            TAG_SORTS[sort],
+            count=count,
+            cursor=cursor,
+        )
+        if status != 200:
+            return body, status
+        etag = self.get_list_etag(body, sort, page, limit, count, cursor)
+        response = not_modified(etag)
+        if response:
+            return response
+        return body, status, etag_header(etag)
+
+    @staticmethod
+    def get_tag(id):
+        tag = TagModel.objects(id=id, deleted_at=None).only("id", "version").first()
+        if tag is None:
+            return {"error": "Tags not found."}, 404
+        etag = make_etag(tag.id, tag.version)
+        response = not_modified(etag)
+        if response:
+            return response
 
-        if tags is None or len(list(tags)) == 0:
+        tag = TagModel.objects(id=id, deleted_at=None).first()
+        if tag is None:
             return {"error": "Tags not found."}, 404
-        else:
-            if type(tags) == TagModel:
-                return tag_schema.dump(tags), 200
-            return tag_schema.dump(tags, many=True), 200
+        return tag_schema.dump(tag), 200, etag_header(etag)
+
+    @staticmethod
+    def get_list_etag(body, *page):
+        """
+        Builds the ETag of a tag list page from the tags it shows and its pagination.
+        """
+        return make_etag(
+            *page,
+            *[
+                f"{tag['id']}:{tag['updated_at']}:{tag['post_count']}"
+                for tag in body["results"]
+            ],
+            *sorted(body["pagination"].items()),
+        )
 
     @auth_required
     def post(self):
@@ -53,7 +132,7 @@ class TagResource(Resource):
         if errors:
             return {"error": "Unallowed attribute."}, 400
 
-        tag_name = str(values["name"]).lower().capitalize()
+        tag_name = TagModel.normalize_name(values["name"])
 
         try:
             current_tag = TagModel.objects(name=tag_name, deleted_at=None).get()
@@ -67,6 +146,8 @@ class TagResource(Resource):
             pass
 
         created_tag = TagModel.objects.create(name=tag_name, author=request.user["id"])
+        publish_tag_change(created_tag.id)
+        invalidate_feed_cache()
         return {
             "id": str(created_tag.id),
             "name": created_tag.name,
@@ -99,6 +180,10 @@ class TagResource(Resource):
 
         tag.name = data["name"]
         tag.save()
+        forget_tag(tag.id)
+        publish_tag_change(tag.id)
+        reindex_posts(PostModel.objects(tags=tag.id, deleted_at=None).scalar("id"))
+        invalidate_feed_cache()
         create_audit_log(
             5,
             request.remote_addr,
@@ -122,15 +207,59 @@ class TagResource(Resource):
             tag = TagModel.objects(id=id, deleted_at=None).get()
             if tag.author != ObjectId(request.user["id"]):
                 return {"error": "You are not authorized for this event."}, 401
-            try:
-                posts = PostModel.objects(tags=tag.id, deleted_at=None)
-                for post in posts:
-                    post.tags.remove(tag.id)
-                    post.save()
-            except PostModel.DoesNotExist:
-                pass
+            tagged_post_ids = list(
+                PostModel.objects(tags=tag.id, deleted_at=None).scalar("id")
+            )
+            PostModel.objects(tags=tag.id, deleted_at=None).update(
+                pull__tags=tag.id, inc__version=1, set__updated_at=datetime.now()
+            )
         except TagModel.DoesNotExist:
             return {}, 204
 
         tag.soft_delete()
+        forget_tag(tag.id)
+        publish_tag_change(tag.id)
+        reindex_posts(tagged_post_ids)
+        invalidate_feed_cache()
         return {}, 204
+
+
+@cached_response
+def get_tag_posts_view(id):
+    """
+    Lists the posts of a tag, newest first, with cursor pagination.
+
+    Endpoint:
+        GET /tag/<id>/posts
+
+    Parameters:
+        id (str): Tag ID or tag name
+
+    Query Parameters:
+        - limit (int, optional): Number of posts per page. Default is 50.
+        - cursor (str, optional): next_cursor of the previous page.
+
+    Returns:
+        JSON: List of posts with the next cursor.
+    """
+    limit = clamp_limit(request.args.get("limit", 50, type=int))
+    cursor = request.args.get("cursor", None, type=str)
+
+    tag_id = resolve_tag_id(id)
+    if tag_id is None:
+        return {"error": "Tag not found."}, 404
+
+    query = PostModel.objects(tags=tag_id, deleted_at=None).only(*PostModel.LIST_FIELDS)
+    try:
+        posts, next_cursor = cursor_paginate(query, limit, ["-created_at"], cursor)
+    except InvalidCursorError:
+        return {"error": "Invalid cursor."}, 400
+    if not posts:
+        return {"error": "No results found."}, 404
+
+    return {
+        "results": PostSchema(exclude=FEED_EXCLUDED_FIELDS).dump(
+            prepare_feed_posts(posts), many=True
+        ),
+        "pagination": {"next_cursor": next_cursor, "limit": limit},
+    }, 200
@@ -3,6 +3,8 @@ from app.models.user import UserModel, UserFollowModel
 from app.schemas.user import user_schema, user_follow_schema
 from app.middleware.auth import auth_required, check_token
 from app.utils import create_audit_log, create_token, decode_token
+from app.timeline import backfill_followee, prune_followee, forget_followee_ids
+from app.loader import get_loader, forget_user
 from bson import ObjectId
 
 
@@ -58,6 +60,7 @@ class UserResource(Resource):
         for key, value in data.items():
             setattr(user, key, value)
         user.save()
+        forget_user(user.id)
         create_audit_log(
             5,
             request.remote_addr,
@@ -87,6 +90,7 @@ class UserResource(Resource):
                 return {"error": "Invalid verification token."}, 400
 
             authenticated_user.soft_delete()
+            forget_user(authenticated_user.id)
             return {"message": "Your account has been deleted."}, 200
 
         # TODO(ahmet): send email for account deletion confirment,
@@ -121,8 +125,9 @@ class UserFollowResource(Resource):
                 follower_id=request.user["id"], followee_id=id, deleted_at__ne=None
             ).get()
             if user_follow != None:
-                user_follow.deleted_at = None
-                user_follow.save()
+                user_follow.restore()
+                forget_followee_ids(request.user["id"])
+                backfill_followee(request.user["id"], id)
                 return {"message": "You are now following this user."}, 201
         except UserFollowModel.DoesNotExist:
             pass
@@ -130,6 +135,8 @@ class UserFollowResource(Resource):
         user_follow = UserFollowModel(
             follower_id=request.user["id"], followee_id=id
         ).save()
+        forget_followee_ids(request.user["id"])
+        backfill_followee(request.user["id"], id)
         return {"message": "You are now following this user."}, 201
 
     @auth_required
@@ -144,6 +151,8 @@ class UserFollowResource(Resource):
             return {"error": "You are not following this user."}, 404
 
         user_follow.soft_delete()
+        forget_followee_ids(request.user["id"])
+        prune_followee(request.user["id"], id)
         return {"message": "You are not following this user anymore."}, 202
 
 
@@ -158,14 +167,15 @@ def get_users_followers_view():
     except UserFollowModel.DoesNotExist:
         return {"error": "Nobody following you."}, 404
 
-    user_ids = [data["follower_id"] for data in user_followers]
-    user_data = UserModel.objects(id__in=user_ids).only("id", "name")
-    user_data_map = {user.id: user.name for user in user_data}
+    user_data_map = get_loader().load_users(
+        data["follower_id"] for data in user_followers
+    )
     followers = []
 
     for data in user_followers:
         follower_id = data["follower_id"]
-        user_name = user_data_map.get(ObjectId(follower_id), "Deleted user")
+        user = user_data_map.get(ObjectId(follower_id))
+        user_name = user["name"] if user else "Deleted user"
         followers.append({"id": follower_id, "name": user_name})
 
     return user_follow_schema.dump(followers, many=True)
@@ -182,14 +192,15 @@ def get_users_followings_view():
     except UserFollowModel.DoesNotExist:
         return {"error": "You are not following anyone."}, 404
 
-    user_ids = [data["followee_id"] for data in user_followings]
-    user_data = UserModel.objects(id__in=user_ids).only("id", "name")
-    user_data_map = {user.id: user.name for user in user_data}
+    user_data_map = get_loader().load_users(
+        data["followee_id"] for data in user_followings
+    )
     followings = []
 
     for data in user_followings:
         followee_id = data["followee_id"]
-        user_name = user_data_map.get(ObjectId(followee_id), "Deleted user")
+        user = user_data_map.get(ObjectId(followee_id))
+        user_name = user["name"] if user else "Deleted user"
         followings.append({"id": followee_id, "name": user_name})
 
     return user_follow_schema.dump(followings, many=True)
@@ -207,6 +218,8 @@ def remove_users_followers_view(id):
         return {"error": "User are not following you."}, 404
 
     user_follow.soft_delete()
+    forget_followee_ids(id)
+    prune_followee(id, request.user["id"])
     return {"message": "User are not following you anymore."}, 202
 
 
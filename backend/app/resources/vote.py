@@ -1,9 +1,16 @@
 from flask_restful import Resource, request
+from bson import ObjectId
+from datetime import datetime
 from app.models.vote import VoteModel
 from app.models.post import PostModel
 from app.schemas.vote import vote_schema
 from app.middleware.auth import auth_required
 from app.utils import create_audit_log
+from app.ranking import hot_score
+from app.cache import invalidate_feed_cache
+from app.config import VOTE_LOOKUP_LIMIT
+from app.vote_buffer import buffer_vote, get_my_votes, write_behind_enabled
+from app.vote_shards import track_vote, increment_shard
 
 
 class VoteResource(Resource):
@@ -39,42 +46,123 @@ class VoteResource(Resource):
         if values["vote_value"] > 1 or values["vote_value"] < -1:
             return {"error": "Unallowed vote value."}, 400
 
-        try:
-            post = PostModel.objects(id=values["post_id"], deleted_at=None).get()
-        except PostModel.DoesNotExist:
+        post_id = values["post_id"]
+        if not ObjectId.is_valid(post_id):
             return {"error": "Post not found."}, 404
+        if write_behind_enabled():
+            return self.buffer(post_id, values["vote_value"])
 
-        try:
-            recent_vote = VoteModel.objects(
-                author=request.user["id"], post_id=values["post_id"]
-            ).get()
-            if recent_vote:
-                if recent_vote.vote_value == values["vote_value"]:
-                    return {"message": "You have already voted for this."}, 202
-
-                post.vote += (-1) * recent_vote.vote_value
-                post.vote += values["vote_value"]
-                recent_vote.vote_value = values["vote_value"]
-                recent_vote.save()
-                post.save()
-                return {"message": "Vote saved successfully."}, 201
-        except VoteModel.DoesNotExist:
-            pass
-
-        if values["vote_value"] == 0:
+        previous_value = VoteModel.set_value(
+            request.user["id"], post_id, values["vote_value"]
+        )
+        if previous_value == values["vote_value"]:
+            return {"message": "You have already voted for this."}, 202
+        if previous_value is None and values["vote_value"] == 0:
             return {"error": "You cannot cast a blank vote."}, 400
 
-        VoteModel(
-            author=request.user["id"],
-            post_id=values["post_id"],
-            vote_value=values["vote_value"],
-        ).save()
-        create_audit_log(
-            5,
-            request.remote_addr,
-            request.user_agent,
-            f"User {request.user['id']} voted on post {values['post_id']}",
+        delta = values["vote_value"] - (previous_value or 0)
+        if not self.apply_delta(post_id, delta):
+            VoteModel.restore_value(request.user["id"], post_id, previous_value)
+            return {"error": "Post not found."}, 404
+
+        if previous_value is None:
+            create_audit_log(
+                5,
+                request.remote_addr,
+                request.user_agent,
+                f"User {request.user['id']} voted on post {post_id}",
+            )
+        invalidate_feed_cache()
+        return {"message": "Vote saved successfully."}, 201
+
+    @staticmethod
+    def apply_delta(post_id, delta):
+        """
+        Adds a vote change to the post, or to one of its shards when the post
+        is promoted, see app.vote_shards. Returns False if the post does not exist.
+        """
+        shard_count = track_vote(post_id)
+        if shard_count:
+            # The post is only read, fold_vote_shards writes the shards to it.
+            if not PostModel.objects(id=post_id, deleted_at=None).only("id").first():
+                return False
+            increment_shard(post_id, shard_count, delta)
+            return True
+
+        # Post ids carry their creation time, the post is not read. The hot
+        # score is off by the age of its last recompute until the next one.
+        created_at = datetime.fromtimestamp(
+            ObjectId(post_id).generation_time.timestamp()
+        )
+        return bool(
+            PostModel.objects(id=post_id, deleted_at=None).update_one(
+                inc__vote=delta,
+                inc__hot_score=hot_score(delta, created_at),
+                inc__version=1,
+            )
         )
-        post.vote += values["vote_value"]
-        post.save()
+
+    @staticmethod
+    def buffer(post_id, vote_value):
+        """
+        Write-behind vote, only Redis is written, see flush_vote_buffer.
+        """
+        user_id = request.user["id"]
+        if not PostModel.objects(id=post_id, deleted_at=None).only("id").first():
+            return {"error": "Post not found."}, 404
+
+        def get_persisted_value():
+            vote = (
+                VoteModel.objects(author=user_id, post_id=post_id)
+                .only("vote_value")
+                .first()
+            )
+            return vote.vote_value if vote else None
+
+        previous_value = buffer_vote(user_id, post_id, vote_value, get_persisted_value)
+        if previous_value == vote_value:
+            return {"message": "You have already voted for this."}, 202
+        if previous_value is None and vote_value == 0:
+            return {"error": "You cannot cast a blank vote."}, 400
+
+        if previous_value is None:
+            create_audit_log(
+                5,
+                request.remote_addr,
+                request.user_agent,
+                f"User {user_id} voted on post {post_id}",
+            )
+        invalidate_feed_cache()
         return {"message": "Vote saved successfully."}, 201
+
+
+@auth_required
+def lookup_votes_view():
+    """
+    Returns the authenticated user's votes on up to VOTE_LOOKUP_LIMIT posts,
+    for clients that cache pages without vote state.
+
+    Endpoint:
+        POST /vote/lookup
+
+    Body:
+        {
+            "post_ids": ["PostID"]
+        }
+
+    Returns:
+        JSON: Post id -> vote value, 0 for posts the user has not voted on.
+    """
+    values = request.get_json()
+    post_ids = values.get("post_ids") if isinstance(values, dict) else None
+    if (
+        not isinstance(post_ids, list)
+        or not post_ids
+        or not all(isinstance(id, str) and ObjectId.is_valid(id) for id in post_ids)
+    ):
+        return {"error": "Unallowed attribute."}, 400
+    if len(post_ids) > VOTE_LOOKUP_LIMIT:
+        return {"error": f"At most {VOTE_LOOKUP_LIMIT} posts are allowed."}, 400
+
+    votes = get_my_votes(request.user["id"], dict.fromkeys(post_ids))
+    return {"votes": {str(post_id): value for post_id, value in votes.items()}}, 200
@@ -0,0 +1,113 @@
+from html import escape
+from html.parser import HTMLParser
+from hashlib import sha1
+from app.config import ALLOWED_TAGS, ALLOWED_ATTRIBUTES
+import json
+
+# Bump when the output of render_html changes for the same allow-lists.
+SANITIZER_REVISION = 1
+# Stored next to rendered HTML, a different value means it must be rendered again.
+RENDER_VERSION = sha1(
+    json.dumps(
+        [SANITIZER_REVISION, sorted(ALLOWED_TAGS), ALLOWED_ATTRIBUTES], sort_keys=True
+    ).encode("utf-8")
+).hexdigest()[:12]
+VOID_TAGS = frozenset(["br", "hr", "img", "wbr"])
+# Opening one of these closes an open one right before it, like browsers do.
+SELF_CLOSING_SIBLINGS = frozenset(["li", "p"])
+# Dropped together with their content, other unknown tags keep their text.
+DROPPED_CONTENT_TAGS = frozenset(
+    ["script", "style", "iframe", "object", "embed", "template", "noscript", "title"]
+)
+URL_ATTRIBUTES = frozenset(["href", "src"])
+SAFE_URL_SCHEMES = ("http:", "https:", "mailto:")
+
+
+def _is_safe_url(value: str):
+    value = "".join(value.split()).lower()
+    if ":" not in value.split("/", 1)[0].split("?", 1)[0].split("#", 1)[0]:
+        return True  # Relative url
+    return value.startswith(SAFE_URL_SCHEMES)
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.output = []
+        self.open_tags = []
+        self.dropped_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_CONTENT_TAGS:
+            self.dropped_depth += 1
+            return
+        if self.dropped_depth or tag not in ALLOWED_TAGS:
+            return
+        allowed_attributes = ALLOWED_ATTRIBUTES.get(tag, [])
+        rendered_attributes = "".join(
+            f' {name}="{escape(value, quote=True)}"'
+            for name, value in attrs
+            if name in allowed_attributes
+            and value is not None
+            and (name not in URL_ATTRIBUTES or _is_safe_url(value))
+        )
+        if (
+            tag in SELF_CLOSING_SIBLINGS
+            and self.open_tags
+            and self.open_tags[-1] == tag
+        ):
+            self.handle_endtag(tag)
+        self.output.append(f"<{tag}{rendered_attributes}>")
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.open_tags and self.open_tags[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_CONTENT_TAGS:
+            self.dropped_depth = max(self.dropped_depth - 1, 0)
+            return
+        if self.dropped_depth or tag not in self.open_tags:
+            return
+        # Tags left open inside this one are closed with it.
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.output.append(f"</{open_tag}>")
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropped_depth:
+            self.output.append(escape(data, quote=False))
+
+    def render(self, content: str):
+        self.feed(content)
+        self.close()
+        while self.open_tags:
+            self.output.append(f"</{self.open_tags.pop()}>")
+        return "".join(self.output)
+
+
+def render_html(content: str):
+    """
+    Sanitizes user HTML with the ALLOWED_TAGS and ALLOWED_ATTRIBUTES allow-lists.
+
+    Tags outside the allow-list are removed and their text is kept, except for
+    scripts and other active content which are removed with their text.
+    Comments, event handlers and javascript: urls never pass.
+
+    Parameters
+    ----------
+    content: str
+
+    Returns
+    -------
+    str
+        Well-formed HTML, safe to insert in a page.
+    """
+    if not content:
+        return ""
+    return _Sanitizer().render(content)
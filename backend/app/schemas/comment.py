@@ -14,6 +14,7 @@ class CommentSchema(Schema):
     post_id = fields.String()
     author = fields.Nested(AuthorEmbeddedSchema)
     content = fields.String(required=True)
+    content_html = fields.String(dump_only=True)
     created_at = fields.DateTime(dump_only=True)
     updated_at = fields.DateTime(dump_only=True)
     deleted_at = fields.DateTime(dump_only=True)
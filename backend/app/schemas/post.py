@@ -14,6 +14,7 @@ class CommentEmbeddedSchema(Schema):
     id = fields.String(dump_only=True)
     author = fields.Nested(AuthorEmbeddedSchema)
     content = fields.String(required=True, max_length=1024)
+    content_html = fields.String(dump_only=True)
     vote = fields.Integer(required=True, dump_only=True)
     created_at = fields.String(dump_only=True)  # fields.DateTime(dump_only=True)
 
@@ -28,10 +29,16 @@ class PostSchema(Schema):
     title = fields.String(required=True)
     author = fields.Nested(AuthorEmbeddedSchema)
     content = fields.String(required=True)
+    content_html = fields.String(dump_only=True)
+    summary = fields.String(dump_only=True)
     tags = fields.Nested(TagEmbeddedSchema, many=True)
     vote = fields.Integer(dump_only=True)
+    # Vote of the signed-in user, only set on feed and profile pages.
+    my_vote = fields.Integer(dump_only=True)
     comments = fields.Nested(CommentEmbeddedSchema, many=True)
-    url = fields.String(required=True, dump_only=True)
+    comment_count = fields.Integer(dump_only=True)
+    slug = fields.String(dump_only=True)
+    url = fields.String(dump_only=True)
     created_at = fields.DateTime(dump_only=True)
     updated_at = fields.DateTime(dump_only=True)
     deleted_at = fields.DateTime(dump_only=True)
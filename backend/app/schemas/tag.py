@@ -8,6 +8,7 @@ class TagSchema(Schema):
     id = fields.String(dump_only=True)
     author = fields.String(dump_only=True)
     name = fields.String(required=True)
+    post_count = fields.Integer(dump_only=True)
     created_at = fields.DateTime(dump_only=True)
     updated_at = fields.DateTime(dump_only=True)
     deleted_at = fields.DateTime(dump_only=True)
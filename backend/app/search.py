@@ -0,0 +1,555 @@
+from flask_restful import current_app
+from redis import RedisError
+from threading import RLock, Thread
+from collections import Counter
+from bson import ObjectId
+from app.config import SEARCH_BM25_K1, SEARCH_BM25_B, SEARCH_TITLE_WEIGHT
+from app.database import decode_redis
+from app.models.post import PostModel
+from app.models.tag import TagModel
+import numpy as np
+import logging
+import math
+import re
+import time
+
+SEARCH_LOAD_BATCH_SIZE = 10000
+# Redis channel, carries the comma separated ids of posts indexed, updated or deleted.
+SEARCH_CHANGES_CHANNEL = "search:changed"
+SEARCH_LISTENER_RETRY_DELAY = 5  # In seconds
+# Tag name terms are kept apart from title and content terms with this prefix.
+TAG_TERM_PREFIX = "#"
+MAX_TERM_LENGTH = 40
+FLOOR_SAMPLE_FACTOR = 64
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i if in into is it "
+    "its me my no not of on or our she so that the their them there they this to "
+    "was we were what when which who will with you your".split()
+)
+TOKEN_PATTERN = re.compile(r"\w+")
+MARKUP_PATTERN = re.compile(r"<[^>]*>")
+
+
+def tokenize(text: str):
+    """
+    Splits text into lowercase search terms, markup and stop words are dropped.
+
+    Parameters
+    ----------
+    text: str
+
+    Returns
+    -------
+    List[str]
+    """
+    if not text:
+        return []
+    return [
+        term
+        for term in TOKEN_PATTERN.findall(MARKUP_PATTERN.sub(" ", text).casefold())
+        if 1 < len(term) <= MAX_TERM_LENGTH and term not in STOP_WORDS
+    ]
+
+
+def _kth_largest(values, k: int):
+    if len(values) < k:
+        return 0
+    return values[np.argpartition(values, len(values) - k)[len(values) - k]]
+
+
+def _grow(array, size: int):
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, len(array) * 2), dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+class _Postings:
+    """
+    Append-only postings list of a term: document slots and term frequencies.
+    """
+
+    __slots__ = ("slots", "frequencies", "size")
+
+    def __init__(self):
+        self.slots = np.zeros(4, dtype=np.int32)
+        self.frequencies = np.zeros(4, dtype=np.uint16)
+        self.size = 0
+
+    def extend(self, slots, frequencies):
+        size = self.size + len(slots)
+        self.slots = _grow(self.slots, size)
+        self.frequencies = _grow(self.frequencies, size)
+        self.slots[self.size : size] = slots
+        self.frequencies[self.size : size] = frequencies
+        self.size = size
+
+    def view(self):
+        return self.slots[: self.size], self.frequencies[: self.size]
+
+
+class SearchIndex:
+    """
+    In-process inverted index over post titles, contents and tag names, ranked
+    with BM25.
+
+    Every document gets a slot in the document arrays. Updating a post kills its
+    slot and appends the new version to a new one, postings are never edited in
+    place, dead slots are skipped at query time and dropped by compact once they
+    outnumber the live ones.
+
+    Attributes
+    ----------
+    k1: float
+    b: float
+    ready: bool
+        False until the first load from MongoDB has finished.
+
+    Methods
+    -------
+    add(documents)
+        Indexes (id, version, title, content, tag_names) tuples, replacing older
+        versions.
+    remove(ids)
+        Drops documents from the index.
+    ids()
+        Returns the ids of the indexed documents.
+    search(query, limit, after, include_tags)
+        Returns up to limit (score, id) pairs, best first.
+    start_load()
+        Remembers removals until finish_load, so a running load skips them.
+    finish_load()
+        Marks the index ready.
+    compact()
+        Rewrites the postings without dead slots.
+    """
+
+    def __init__(self, k1: float = SEARCH_BM25_K1, b: float = SEARCH_BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.ready = False
+        self._lock = RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._postings = {}
+            self._documents = {}  # id -> (slot, version)
+            self._ids = []
+            self._lengths = np.zeros(1024, dtype=np.float32)
+            self._alive = np.zeros(1024, dtype=bool)
+            self._norms = np.zeros(1024, dtype=np.float32)
+            self._norms_count = 0
+            self._norms_average = 0.0
+            self._live_count = 0
+            self._total_length = 0.0
+            self._loading = False
+            self._removed = set()
+
+    def start_load(self):
+        with self._lock:
+            self._loading = True
+
+    def finish_load(self):
+        with self._lock:
+            self._loading = False
+            self._removed = set()
+            self.ready = True
+
+    def __len__(self):
+        return self._live_count
+
+    def ids(self):
+        with self._lock:
+            return set(self._documents)
+
+    @staticmethod
+    def _terms(title: str, content: str, tag_names):
+        terms = Counter(tokenize(content))
+        title_terms = tokenize(title)
+        for _ in range(SEARCH_TITLE_WEIGHT):
+            terms.update(title_terms)
+        for name in tag_names or []:
+            terms.update(TAG_TERM_PREFIX + term for term in tokenize(name))
+        return terms
+
+    def _refresh_norms(self):
+        # BM25 length norms of every slot, rebuilt once the average length moved by 1%.
+        average = self._total_length / self._live_count or 1.0
+        count = len(self._ids)
+        if abs(average - self._norms_average) > self._norms_average * 0.01:
+            self._norms_average = average
+            self._norms_count = 0
+        if self._norms_count < count:
+            self._norms = _grow(self._norms, count)
+            self._norms[self._norms_count : count] = self.k1 * (
+                1
+                - self.b
+                + self.b
+                * self._lengths[self._norms_count : count]
+                / self._norms_average
+            )
+            self._norms_count = count
+        return self._norms
+
+    def _kill(self, slot: int):
+        self._alive[slot] = False
+        self._live_count -= 1
+        self._total_length -= float(self._lengths[slot])
+
+    def add(self, documents):
+        # Tokenizing is the slow part, it runs before taking the lock.
+        prepared = [
+            (id, version, self._terms(title, content, tag_names))
+            for id, version, title, content, tag_names in documents
+        ]
+        with self._lock:
+            new_postings = {}
+            for id, version, terms in prepared:
+                if id in self._removed:
+                    continue
+                current = self._documents.get(id)
+                if current is not None:
+                    if current[1] > version:
+                        continue
+                    self._kill(current[0])
+
+                slot = len(self._ids)
+                self._ids.append(id)
+                self._lengths = _grow(self._lengths, slot + 1)
+                self._alive = _grow(self._alive, slot + 1)
+                length = sum(terms.values())
+                self._lengths[slot] = length
+                self._alive[slot] = True
+                self._live_count += 1
+                self._total_length += length
+                self._documents[id] = (slot, version)
+                for term, frequency in terms.items():
+                    new_postings.setdefault(term, ([], []))
+                    new_postings[term][0].append(slot)
+                    new_postings[term][1].append(min(frequency, 65535))
+
+            for term, (slots, frequencies) in new_postings.items():
+                if term not in self._postings:
+                    self._postings[term] = _Postings()
+                self._postings[term].extend(slots, frequencies)
+
+            if len(self._ids) - self._live_count > max(self._live_count, 10000):
+                self.compact()
+
+    def remove(self, ids):
+        with self._lock:
+            for id in ids:
+                if self._loading:
+                    # A load that read the post before it was deleted must skip it.
+                    self._removed.add(id)
+                current = self._documents.pop(id, None)
+                if current is not None:
+                    self._kill(current[0])
+
+    def compact(self):
+        with self._lock:
+            count = len(self._ids)
+            alive = self._alive[:count]
+            new_slots = np.cumsum(alive, dtype=np.int32) - 1
+            postings = {}
+            for term, term_postings in self._postings.items():
+                slots, frequencies = term_postings.view()
+                mask = alive[slots]
+                if not mask.any():
+                    continue
+                compacted = _Postings()
+                compacted.extend(new_slots[slots[mask]], frequencies[mask])
+                postings[term] = compacted
+
+            live_slots = np.flatnonzero(alive)
+            self._postings = postings
+            self._ids = [self._ids[slot] for slot in live_slots]
+            self._lengths = _grow(self._lengths[live_slots], 1024)
+            self._alive = np.zeros(len(self._lengths), dtype=bool)
+            self._alive[: len(self._ids)] = True
+            self._norms_count = 0
+            self._documents = {
+                id: (int(new_slots[slot]), self._documents[id][1])
+                for id, slot in zip(self._ids, live_slots)
+            }
+
+    def search(self, query: str, limit: int, after=None, include_tags: bool = False):
+        """
+        Ranks the indexed documents against a query.
+
+        Parameters
+        ----------
+        query: str
+        limit: int
+        after: tuple, optional
+            (score, id) of the last result of the previous page.
+        include_tags: bool
+            Also match the query terms against tag names.
+
+        Returns
+        -------
+        List[tuple]
+            (score, id) pairs ordered by score, then id, descending.
+        """
+        terms = set(tokenize(query))
+        if include_tags:
+            terms |= {TAG_TERM_PREFIX + term for term in terms}
+
+        with self._lock:
+            if not self._live_count:
+                return []
+            norms = self._refresh_norms()
+            has_dead = len(self._ids) > self._live_count
+            contributions = []
+            # Sorted, so sums are added in the same order and cursors compare equal.
+            for term in sorted(terms):
+                if term not in self._postings:
+                    continue
+                slots, frequencies = self._postings[term].view()
+                if has_dead:
+                    mask = self._alive[slots]
+                    slots, frequencies = slots[mask], frequencies[mask]
+                if not len(slots):
+                    continue
+                frequencies = frequencies.astype(np.float32)
+                idf = math.log(
+                    1 + (self._live_count - len(slots) + 0.5) / (len(slots) + 0.5)
+                )
+                contributions.append(
+                    (
+                        slots,
+                        np.float32(idf * (self.k1 + 1))
+                        * frequencies
+                        / (frequencies + norms[slots]),
+                    )
+                )
+            if not contributions:
+                return []
+
+            if len(contributions) == 1:
+                candidates, candidate_scores = contributions[0]
+            else:
+                scores = np.zeros(len(self._ids), dtype=np.float32)
+                for slots, term_scores in contributions:
+                    np.add.at(scores, slots, term_scores)
+                floor = 0
+                if after is None:
+                    # Sums only grow, so the limit-th best score of one term, even over
+                    # a prefix of its postings, is a lower bound for the page.
+                    floor = max(
+                        _kth_largest(term_scores[: limit * FLOOR_SAMPLE_FACTOR], limit)
+                        for _, term_scores in contributions
+                    )
+                candidates = (
+                    np.flatnonzero(scores >= floor) if floor else np.flatnonzero(scores)
+                )
+                candidate_scores = scores[candidates]
+
+            if after is not None:
+                after_score = np.float32(after[0])
+                ties = candidates[candidate_scores == after_score]
+                keep = candidate_scores < after_score
+                candidates = np.concatenate(
+                    (
+                        candidates[keep],
+                        [slot for slot in ties if self._ids[slot] < after[1]],
+                    )
+                ).astype(np.int64)
+                candidate_scores = np.concatenate(
+                    (
+                        candidate_scores[keep],
+                        np.full(len(candidates) - keep.sum(), after_score),
+                    )
+                ).astype(np.float32)
+
+            if len(candidates) > limit:
+                # Everything scoring like the limit-th best is kept, ties are
+                # ordered by id below.
+                selected = candidate_scores >= _kth_largest(candidate_scores, limit)
+                candidates, candidate_scores = (
+                    candidates[selected],
+                    candidate_scores[selected],
+                )
+
+            hits = [
+                (float(score), self._ids[slot])
+                for slot, score in zip(candidates, candidate_scores)
+            ]
+        hits.sort(key=lambda hit: (hit[0], hit[1]), reverse=True)
+        return hits[:limit]
+
+
+search_index = SearchIndex()
+
+
+def _documents(posts):
+    posts = list(posts)
+    tag_ids = {ObjectId(tag_id) for post in posts for tag_id in post.tags}
+    tag_names = {}
+    if tag_ids:
+        tag_names = {
+            tag.id: tag.name
+            for tag in TagModel.objects(id__in=list(tag_ids), deleted_at=None).only(
+                "id", "name"
+            )
+        }
+    return [
+        (
+            post.id,
+            post.version or 0,
+            post.title,
+            post.content,
+            [
+                tag_names[ObjectId(tag_id)]
+                for tag_id in post.tags
+                if ObjectId(tag_id) in tag_names
+            ],
+        )
+        for post in posts
+    ]
+
+
+def _refresh_posts(post_ids):
+    # Reads posts again, deleted and missing posts are dropped.
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    live_posts = list(
+        PostModel.objects(id__in=post_ids, deleted_at=None).only(
+            "id", "title", "content", "tags", "version"
+        )
+    )
+    live_ids = {post.id for post in live_posts}
+    search_index.remove([id for id in post_ids if id not in live_ids])
+    search_index.add(_documents(live_posts))
+
+
+def _publish_search_change(post_ids):
+    post_ids = [str(id) for id in post_ids]
+    try:
+        for start in range(0, len(post_ids), SEARCH_LOAD_BATCH_SIZE):
+            current_app.config["redis"].publish(
+                SEARCH_CHANGES_CHANNEL,
+                ",".join(post_ids[start : start + SEARCH_LOAD_BATCH_SIZE]),
+            )
+    except RedisError as error:
+        logging.error(f"Search change publish failed: {error}")
+
+
+def index_posts(posts):
+    """
+    Adds new or updated posts to the search index and announces them to the
+    other processes.
+
+    Parameters
+    ----------
+    posts: Iterable[PostModel]
+        Saved posts, with title, content, tags and version loaded.
+    """
+    documents = _documents(posts)
+    search_index.add(documents)
+    _publish_search_change([document[0] for document in documents])
+
+
+def reindex_posts(post_ids):
+    """
+    Reads posts again and refreshes them in the search index, deleted posts are dropped.
+
+    Parameters
+    ----------
+    post_ids: Iterable[ObjectId]
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    _refresh_posts(post_ids)
+    _publish_search_change(post_ids)
+
+
+def unindex_posts(post_ids):
+    """
+    Drops deleted posts from the search index.
+
+    Parameters
+    ----------
+    post_ids: Iterable[ObjectId]
+    """
+    post_ids = list(post_ids)
+    search_index.remove(post_ids)
+    _publish_search_change(post_ids)
+
+
+def _load_posts():
+    search_index.start_load()
+    loaded_ids = set()
+    try:
+        query = (
+            PostModel.objects(deleted_at=None)
+            .only("id", "title", "content", "tags", "version")
+            .no_cache()
+            .batch_size(SEARCH_LOAD_BATCH_SIZE)
+        )
+        batch = []
+        for post in query:
+            batch.append(post)
+            loaded_ids.add(post.id)
+            if len(batch) == SEARCH_LOAD_BATCH_SIZE:
+                search_index.add(_documents(batch))
+                batch = []
+        if batch:
+            search_index.add(_documents(batch))
+    except Exception as error:
+        logging.error(f"Search index load failed: {error}")
+        raise
+    search_index.finish_load()
+    return loaded_ids
+
+
+def load_search_index():
+    """
+    Indexes every live post, it is scheduled once in create_app.
+
+    Writes made while loading are applied as they come, the version stored
+    with each post keeps the load from overwriting them with older reads.
+
+    Returns
+    -------
+    int
+        Number of indexed posts.
+    """
+    _load_posts()
+    return len(search_index)
+
+
+def _listen_search_changes(redis_client):
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(SEARCH_CHANGES_CHANNEL)
+            # Changes published while disconnected are lost, read everything
+            # again and recheck the indexed posts the load did not see.
+            if search_index.ready:
+                indexed_ids = search_index.ids()
+                _refresh_posts(indexed_ids - _load_posts())
+            for message in pubsub.listen():
+                post_ids = decode_redis(message["data"])
+                _refresh_posts(
+                    ObjectId(id) for id in post_ids.split(",") if ObjectId.is_valid(id)
+                )
+        except RedisError as error:
+            logging.error(f"Search change listener failed: {error}")
+        except Exception as error:
+            logging.error(f"Search change could not be applied: {error}")
+        time.sleep(SEARCH_LISTENER_RETRY_DELAY)
+
+
+def start_search_listener(redis_client):
+    """
+    Keeps the search index of this process current with the writes of the
+    others, in a daemon thread.
+    """
+    thread = Thread(target=_listen_search_changes, args=[redis_client], daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,158 @@
+from flask_restful import current_app
+from redis import RedisError
+from bson import ObjectId
+from threading import Lock, Thread
+from app.models.tag import TagModel
+from app.database import decode_redis
+import logging
+import time
+
+# Redis channel, carries the id of a tag that was created, renamed or deleted.
+TAG_CHANGES_CHANNEL = "tags:changed"
+TAG_LISTENER_RETRY_DELAY = 5  # In seconds
+
+
+def tag_to_dict(tag):
+    return {
+        "id": tag.id,
+        "author": tag.author,
+        "name": tag.name,
+        "created_at": tag.created_at,
+        "updated_at": tag.updated_at,
+        "version": tag.version,
+        "deleted": tag.deleted_at is not None,
+    }
+
+
+class TagRegistry:
+    """
+    Process-local map of the live tags, id -> tag and name -> id.
+
+    It is loaded once on startup and kept current by the tag change messages
+    every process receives on TAG_CHANGES_CHANNEL. Until it is loaded, tags
+    are read from MongoDB.
+
+    Methods
+    -------
+    load()
+        Replaces the registry with the live tags.
+    refresh(tag_id)
+        Reads one tag again after it changed.
+    get_many(ids)
+        Returns an id -> tag map of the known tags.
+    set_many(tags)
+        Adds tags read from MongoDB.
+    get_id(name)
+        Returns the id of the live tag with this normalized name.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._tags = {}
+        self._ids_by_name = {}
+        self._lock = Lock()
+
+    def load(self):
+        tags = {tag.id: tag_to_dict(tag) for tag in TagModel.objects(deleted_at=None)}
+        with self._lock:
+            self._tags = tags
+            self._ids_by_name = {tag["name"]: id for id, tag in tags.items()}
+            self.ready = True
+        return len(tags)
+
+    def refresh(self, tag_id):
+        tag_id = ObjectId(tag_id)
+        tag = TagModel.objects(id=tag_id).first()
+        with self._lock:
+            previous = self._tags.pop(tag_id, None)
+            if previous and self._ids_by_name.get(previous["name"]) == tag_id:
+                del self._ids_by_name[previous["name"]]
+            if tag is not None and tag.deleted_at is None:
+                self._add(tag_to_dict(tag))
+
+    def _add(self, tag: dict):
+        self._tags[tag["id"]] = tag
+        if not tag["deleted"]:
+            self._ids_by_name[tag["name"]] = tag["id"]
+
+    def get_many(self, ids):
+        with self._lock:
+            return {id: self._tags[id] for id in ids if id in self._tags}
+
+    def set_many(self, tags: dict):
+        with self._lock:
+            for tag in tags.values():
+                self._add(tag)
+
+    def get_id(self, name: str):
+        with self._lock:
+            return self._ids_by_name.get(name)
+
+    def clear(self):
+        with self._lock:
+            self._tags = {}
+            self._ids_by_name = {}
+            self.ready = False
+
+
+tag_registry = TagRegistry()
+
+
+def resolve_tag_id(value: str):
+    """
+    Resolves a tag id or tag name to a tag id from the registry, see
+    TagModel.resolve_id.
+
+    Returns None if no tag is named so.
+    """
+    tag_id = None
+    if tag_registry.ready and not ObjectId.is_valid(value):
+        tag_id = tag_registry.get_id(TagModel.normalize_name(value))
+    # Tags created by another process may not be announced yet, names
+    # missing from the registry are read from MongoDB and never cached.
+    return tag_id or TagModel.resolve_id(value)
+
+
+def publish_tag_change(tag_id):
+    """
+    Applies a tag change to this process's registry and announces it to the others.
+    """
+    tag_registry.refresh(tag_id)
+    try:
+        current_app.config["redis"].publish(TAG_CHANGES_CHANNEL, str(tag_id))
+    except RedisError as error:
+        logging.error(f"Tag change publish failed for tag {tag_id}: {error}")
+
+
+def load_tag_registry():
+    count = tag_registry.load()
+    logging.info(f"Tag registry loaded with {count} tags.")
+    return count
+
+
+def _listen_tag_changes(redis_client):
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(TAG_CHANGES_CHANNEL)
+            # Changes published while disconnected are lost, read everything again.
+            if tag_registry.ready:
+                tag_registry.load()
+            for message in pubsub.listen():
+                tag_id = decode_redis(message["data"])
+                if ObjectId.is_valid(tag_id):
+                    tag_registry.refresh(tag_id)
+        except RedisError as error:
+            logging.error(f"Tag change listener failed: {error}")
+        except Exception as error:
+            logging.error(f"Tag change could not be applied: {error}")
+        time.sleep(TAG_LISTENER_RETRY_DELAY)
+
+
+def start_tag_listener(redis_client):
+    """
+    Keeps the registry of this process current in a daemon thread.
+    """
+    thread = Thread(target=_listen_tag_changes, args=[redis_client], daemon=True)
+    thread.start()
+    return thread
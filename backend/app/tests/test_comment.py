@@ -6,6 +6,7 @@ from fakeredis import FakeStrictRedis
 from app import create_app
 from app.models.comment import CommentModel
 from app.models.post import PostModel
+from app.models.counter import CounterModel, POST_COMMENTS_COUNTER
 from app.utils import create_token
 
 # Mock MongoDB and Redis connections
@@ -31,7 +32,6 @@ def create_comment(post_id=ObjectId(), author=ObjectId(), content=uuid4().hex):
     comment = CommentModel.objects.create(
         post_id=post_id, content=content, author={"id": author, "name": "Test User"}
     )
-    PostModel.objects(id=post_id).update_one(push__comments=comment.id)
     return comment
 
 
@@ -52,6 +52,20 @@ def test_get_comments(client):
     assert response.json["results"][1]["content"] == comment2.content
 
 
+def test_get_comments_total_count_from_counter(client):
+    post_id = ObjectId()
+    create_comment(post_id=post_id)
+    comment = create_comment(post_id=post_id)
+    comment.soft_delete()
+
+    assert CounterModel.get_value(POST_COMMENTS_COUNTER.format(post_id)) == 1
+
+    response = client.get(f"/comment/{post_id}")
+
+    assert response.status_code == 200
+    assert response.json["pagination"]["total_count"] == 1
+
+
 def test_create_comment(client):
     post_id = create_post().id
     token = create_token({"id": str(ObjectId()), "name": "Test User", "email": "test@test.com"})
@@ -64,9 +78,7 @@ def test_create_comment(client):
     assert "comment_id" in response.json
     assert "message" in response.json
     assert len(CommentModel.objects(post_id=post_id)) == 1
-    assert PostModel.objects.get(id=post_id).comments == [
-        ObjectId(response.json["comment_id"])
-    ]
+    assert PostModel.objects.get(id=post_id).comment_count == 1
 
     invalid_post_id = ObjectId()
     data = {"post_id": str(invalid_post_id), "content": "New Comment"}
@@ -174,3 +186,75 @@ def test_delete_comment_unauthorized(client):
     response = client.delete(f"/comment/{comment.id}", headers=headers)
 
     assert response.status_code == 401 or response.status_code == 204
+
+
+def test_get_comments_cursor_pagination(client):
+    post_id = create_post().id
+    comments = [
+        create_comment(post_id=post_id, content=f"Comment {i}") for i in range(3)
+    ]
+
+    response = client.get(f"/comment/{post_id}?limit=2&cursor=")
+    seen = [comment["id"] for comment in response.json["results"]]
+    cursor = response.json["pagination"]["next_cursor"]
+    response = client.get(f"/comment/{post_id}?limit=2&cursor={cursor}")
+    seen += [comment["id"] for comment in response.json["results"]]
+
+    assert seen == [str(comment.id) for comment in comments]
+    assert response.json["pagination"]["next_cursor"] is None
+    assert client.get(f"/comment/{post_id}?cursor=invalid").status_code == 400
+
+
+def test_comment_count(client):
+    post_id = create_post().id
+    create_comment(post_id=post_id)
+    comment = create_comment(post_id=post_id)
+
+    assert PostModel.objects.get(id=post_id).comment_count == 2
+
+    comment.soft_delete()
+
+    assert PostModel.objects.get(id=post_id).comment_count == 1
+
+    # A second request holding the same comment does not count it again.
+    comment = create_comment(post_id=post_id)
+    stale_copy = CommentModel.objects.get(id=comment.id)
+    assert comment.soft_delete()
+    assert not stale_copy.soft_delete()
+    assert PostModel.objects.get(id=post_id).comment_count == 1
+    assert CounterModel.get_value(POST_COMMENTS_COUNTER.format(post_id)) == 1
+
+
+def test_get_comments_count_modes(client):
+    post_id = create_post().id
+    comments = [
+        create_comment(post_id=post_id, content=f"Comment {i}") for i in range(3)
+    ]
+    # Without the counter the total is counted with the page.
+    CounterModel.objects(name=POST_COMMENTS_COUNTER.format(post_id)).delete()
+
+    response = client.get(f"/comment/{post_id}?limit=2")
+
+    assert [comment["id"] for comment in response.json["results"]] == [
+        str(comment.id) for comment in comments[:2]
+    ]
+    assert response.json["pagination"]["total_count"] == 3
+    assert response.json["pagination"]["total_pages"] == 2
+    assert response.json["pagination"]["next_page"] == 2
+
+    response = client.get(f"/comment/{post_id}?limit=2&count=none")
+    assert response.json["pagination"]["total_count"] is None
+    assert response.json["pagination"]["next_page"] == 2
+
+    response = client.get(f"/comment/{post_id}?limit=2&page=2&count=none")
+    assert [comment["id"] for comment in response.json["results"]] == [
+        str(comments[2].id)
+    ]
+    assert response.json["pagination"]["next_page"] is None
+
+    response = client.get(f"/comment/{post_id}?limit=2&count=estimate")
+    assert response.json["pagination"]["total_count"] == 3
+    assert response.json["pagination"]["estimated"] is True
+
+    assert client.get(f"/comment/{post_id}?limit=2&page=3").status_code == 404
+    assert client.get(f"/comment/{post_id}?count=invalid").status_code == 400
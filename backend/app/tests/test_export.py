@@ -0,0 +1,94 @@
+from app.models.post import PostModel
+from app.models.tag import TagModel
+from app.models.user import UserModel
+from app.schemas.user import user_schema
+from app.resources import export
+from app import create_app
+from app.utils import create_token
+from mongomock import MongoClient
+from fakeredis import FakeStrictRedis
+from bcrypt import hashpw, gensalt
+from datetime import datetime, timedelta
+from uuid import uuid4
+import pytest
+import json
+
+# Mock MongoDB and Redis connections
+mongo_client = MongoClient()
+redis_client = FakeStrictRedis()
+
+app = create_app(
+    db="mongoenginetest",
+    mongodb_uri="mongodb://localhost",
+    mongo_client_class=MongoClient,
+    redis_client=redis_client,
+    TESTING=True,
+)
+
+
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+
+def create_user():
+    user = UserModel(
+        name="Test User",
+        email=f"{uuid4()}@example.com",
+        password=hashpw("test_pass".encode("utf-8"), gensalt(rounds=12)),
+    ).save()
+    return user_schema.dump(user)
+
+
+def test_export_posts(client, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+    user = create_user()
+    token = create_token(user)
+    tag = TagModel(name="export", author=user["id"]).save()
+    posts = [
+        PostModel(
+            title=f"Post {i}", content="Content", author=user["id"], tags=[tag.id]
+        ).save()
+        for i in range(5)
+    ]
+
+    response = client.get(
+        f"/export/posts?author={user['id']}",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [line["id"] for line in lines] == [str(post.id) for post in posts]
+    assert lines[0]["author"]["name"] == "Test User"
+    assert lines[0]["tags"] == [{"id": str(tag.id), "name": "export"}]
+    assert lines[0]["content"] == "Content"
+    assert "comments" not in lines[0]
+
+
+def test_export_posts_filters(client):
+    user = create_user()
+    token = create_token(user)
+    old_post = PostModel(title="Old", content="Content", author=user["id"]).save()
+    old_post.created_at = datetime.now() - timedelta(days=3)
+    old_post.save()
+    new_post = PostModel(title="New", content="Content", author=user["id"]).save()
+
+    since = (datetime.now() - timedelta(days=1)).isoformat()
+    response = client.get(
+        f"/export/posts?author={user['id']}&since={since}",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    lines = response.data.decode().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [str(new_post.id)]
+
+    response = client.get(
+        "/export/posts?since=yesterday", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 400
+
+    response = client.get("/export/posts")
+    assert response.status_code == 401
@@ -1,4 +1,6 @@
 import pytest
+from bson import json_util, ObjectId
+from base64 import urlsafe_b64encode
 from uuid import uuid4
 from mongomock import MongoClient
 from fakeredis import FakeStrictRedis
@@ -6,8 +8,18 @@ from bcrypt import hashpw, gensalt
 from app import create_app
 from app.models.post import PostModel
 from app.models.comment import CommentModel
+from app.models.tag import TagModel
 from app.models.user import UserModel
 from app.schemas.user import user_schema
+from app.utils import create_token
+from app.counters import reconcile_counters
+from app.ranking import recompute_hot_scores
+from app.config import HOT_SCORE_WINDOW
+from datetime import datetime, timedelta
+from app.models.counter import CounterModel, POSTS_COUNTER, AUTHOR_POSTS_COUNTER
+from app import timeline
+from app import cache
+from app.resources import feed
 
 mongo_client = MongoClient()
 redis_client = FakeStrictRedis()
@@ -94,12 +106,6 @@ def test_get_feed(client):
         author={"id": str(user1["id"]), "name": "Test User"},
     ).save()
 
-    post1.comments.append(comment1.id)
-    post2.comments.append(comment2.id)
-
-    post1.save()
-    post2.save()
-
     response = client.get("/feed?date=asc")
 
     assert response.status_code == 200
@@ -111,3 +117,473 @@ def test_get_feed(client):
     assert response.json["results"][1]["title"] == post2.title
     assert response.json["results"][1]["content"] == post2.content[:200] + "..."
     assert response.json["results"][1]["author"]["id"] == str(user1["id"])
+
+
+def test_get_feed_followed_timeline(client):
+    author = create_user()
+    reader = create_user()
+    author_token = create_token(author)
+    reader_token = create_token(reader)
+    old_post = PostModel(
+        title="Old post", content="Content", author=author["id"]
+    ).save()
+
+    client.post(
+        f"/user/{author['id']}/follow",
+        headers={"Authorization": f"Bearer {reader_token}"},
+    )
+    response = client.get(
+        "/feed?q=followed", headers={"Authorization": f"Bearer {reader_token}"}
+    )
+
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json["results"]] == [str(old_post.id)]
+
+    response = client.post(
+        "/post",
+        json={"title": "New post", "content": "Content"},
+        headers={"Authorization": f"Bearer {author_token}"},
+    )
+    new_post_id = response.json["post_id"]
+    response = client.get(
+        "/feed?q=followed", headers={"Authorization": f"Bearer {reader_token}"}
+    )
+
+    assert [post["id"] for post in response.json["results"]] == [
+        new_post_id,
+        str(old_post.id),
+    ]
+
+    client.delete(
+        f"/user/{author['id']}/follow",
+        headers={"Authorization": f"Bearer {reader_token}"},
+    )
+
+    assert not redis_client.zscore(
+        timeline.TIMELINE_KEY.format(reader["id"]), new_post_id
+    )
+
+
+def test_get_feed_followed_fanout_on_read(client, monkeypatch):
+    monkeypatch.setattr(timeline, "TIMELINE_FANOUT_LIMIT", 0)
+    author = create_user()
+    reader = create_user()
+    author_token = create_token(author)
+    reader_token = create_token(reader)
+
+    client.post(
+        f"/user/{author['id']}/follow",
+        headers={"Authorization": f"Bearer {reader_token}"},
+    )
+    response = client.post(
+        "/post",
+        json={"title": "Celebrity post", "content": "Content"},
+        headers={"Authorization": f"Bearer {author_token}"},
+    )
+    post_id = response.json["post_id"]
+
+    assert redis_client.sismember(timeline.FANOUT_ON_READ_KEY, author["id"])
+    assert not redis_client.zscore(timeline.TIMELINE_KEY.format(reader["id"]), post_id)
+
+    response = client.get(
+        "/feed?q=followed", headers={"Authorization": f"Bearer {reader_token}"}
+    )
+
+    assert response.status_code == 200
+    assert response.json["results"][0]["id"] == post_id
+
+
+def test_get_feed_cursor_pagination(client):
+    user1 = create_user()
+    PostModel.objects().all().delete()
+    posts = [
+        PostModel(title=f"Post {i}", content="Content", author=user1["id"]).save()
+        for i in range(5)
+    ]
+
+    seen = []
+    cursor = ""
+    while cursor is not None:
+        response = client.get(f"/feed?limit=2&cursor={cursor}")
+        assert response.status_code == 200
+        assert "total_count" not in response.json["pagination"]
+        seen.extend(post["id"] for post in response.json["results"])
+        cursor = response.json["pagination"]["next_cursor"]
+
+    assert seen == [str(post.id) for post in reversed(posts)]
+
+    for url in ["/feed?limit=0&cursor=", "/feed?limit=-3&cursor=", "/feed?limit=0"]:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert len(response.json["results"]) == 5
+
+
+def test_get_feed_max_limit(client, monkeypatch):
+    monkeypatch.setattr("app.utils.PAGINATION_MAX_LIMIT", 2)
+    user1 = create_user()
+    tag = TagModel(name=f"Limit {uuid4().hex[:6]}", author=user1["id"]).save()
+    for i in range(3):
+        PostModel(
+            title=f"Post {i}", content="Content", author=user1["id"], tags=[tag.id]
+        ).save()
+
+    for url in [
+        "/feed?limit=100000&cursor=",
+        "/feed?limit=100000",
+        f"/tag/{tag.id}/posts?limit=100000",
+        f"/user/{user1['id']}/post?limit=100000",
+    ]:
+        response = client.get(url)
+        assert response.status_code == 200
+        results = response.json.get("results", response.json.get("posts"))
+        assert len(results) == 2
+
+
+def test_get_feed_cursor_pagination_by_vote(client):
+    user1 = create_user()
+    PostModel.objects().all().delete()
+    for vote in [3, 1, 3, 2]:
+        PostModel(title="Post", content="Content", author=user1["id"], vote=vote).save()
+
+    response = client.get("/feed?vote=desc&limit=3&cursor=")
+    votes = [post["vote"] for post in response.json["results"]]
+    cursor = response.json["pagination"]["next_cursor"]
+    response = client.get(f"/feed?vote=desc&limit=3&cursor={cursor}")
+    votes += [post["vote"] for post in response.json["results"]]
+
+    assert votes == [3, 3, 2, 1]
+    assert response.json["pagination"]["next_cursor"] is None
+
+
+def test_get_feed_followed_cursor_pagination(client):
+    author = create_user()
+    reader = create_user()
+    reader_token = create_token(reader)
+    client.post(
+        f"/user/{author['id']}/follow",
+        headers={"Authorization": f"Bearer {reader_token}"},
+    )
+    posts = [
+        PostModel(title=f"Post {i}", content="Content", author=author["id"]).save()
+        for i in range(3)
+    ]
+
+    response = client.get(
+        "/feed?q=followed&limit=2&cursor=",
+        headers={"Authorization": f"Bearer {reader_token}"},
+    )
+    seen = [post["id"] for post in response.json["results"]]
+    cursor = response.json["pagination"]["next_cursor"]
+    response = client.get(
+        f"/feed?q=followed&limit=2&cursor={cursor}",
+        headers={"Authorization": f"Bearer {reader_token}"},
+    )
+    seen += [post["id"] for post in response.json["results"]]
+
+    assert seen == [str(post.id) for post in reversed(posts)]
+    assert response.json["pagination"]["next_cursor"] is None
+
+
+def test_get_feed_followed_chunked_merge(client, monkeypatch):
+    monkeypatch.setattr(feed, "FOLLOWED_FEED_CHUNK_SIZE", 1)
+    authors = [create_user() for _ in range(3)]
+    reader = create_user()
+    reader_token = create_token(reader)
+    for author in authors:
+        client.post(
+            f"/user/{author['id']}/follow",
+            headers={"Authorization": f"Bearer {reader_token}"},
+        )
+    for index, vote in enumerate([4, 9, 1, 7, 3, 8]):
+        PostModel(
+            title="Post", content="Content", author=authors[index % 3]["id"], vote=vote
+        ).save()
+
+    votes = []
+    cursor = ""
+    while cursor is not None:
+        response = client.get(
+            f"/feed?q=followed&vote=desc&limit=4&cursor={cursor}",
+            headers={"Authorization": f"Bearer {reader_token}"},
+        )
+        votes += [post["vote"] for post in response.json["results"]]
+        cursor = response.json["pagination"]["next_cursor"]
+
+    assert votes == [9, 8, 7, 4, 3, 1]
+
+    response = client.get(
+        "/feed?q=followed&vote=desc&limit=2&page=2",
+        headers={"Authorization": f"Bearer {reader_token}"},
+    )
+
+    assert [post["vote"] for post in response.json["results"]] == [7, 4]
+
+
+def test_followee_ids_cache(client):
+    author = create_user()
+    reader = create_user()
+    reader_token = create_token(reader)
+
+    with app.app_context():
+        assert timeline.get_followee_ids(reader["id"]) == []
+        client.post(
+            f"/user/{author['id']}/follow",
+            headers={"Authorization": f"Bearer {reader_token}"},
+        )
+        assert timeline.get_followee_ids(reader["id"]) == [author["id"]]
+        assert redis_client.get(timeline.FOLLOWEE_IDS_KEY.format(reader["id"]))
+
+        client.delete(
+            f"/user/{author['id']}/follow",
+            headers={"Authorization": f"Bearer {reader_token}"},
+        )
+        assert timeline.get_followee_ids(reader["id"]) == []
+
+
+def test_get_feed_invalid_cursor(client):
+    response = client.get("/feed?cursor=invalid")
+
+    assert response.status_code == 400
+    assert response.json["error"] == "Invalid cursor."
+
+    # Well-formed JSON with tampered values.
+    for values in [5, "values", [None, None], ["2024-01-01", str(ObjectId())]]:
+        payload = json_util.dumps({"sort": ["-created_at"], "values": values})
+        cursor = urlsafe_b64encode(payload.encode("utf-8")).decode("utf-8")
+        response = client.get(f"/feed?cursor={cursor}")
+        assert response.status_code == 400
+
+
+def test_reconcile_counters(client):
+    user1 = create_user()
+    PostModel.objects().all().delete()
+    post = PostModel(title="Post", content="Content", author=user1["id"]).save()
+    PostModel(title="Post", content="Content", author=user1["id"]).save()
+    post.soft_delete()
+
+    assert CounterModel.get_value(AUTHOR_POSTS_COUNTER.format(user1["id"])) == 1
+
+    reconcile_counters()
+
+    assert CounterModel.get_value(POSTS_COUNTER) == 1
+    assert CounterModel.get_value(AUTHOR_POSTS_COUNTER.format(user1["id"])) == 1
+
+    response = client.get("/feed")
+
+    assert response.json["pagination"]["total_count"] == 1
+
+
+def test_get_feed_hot(client):
+    user1 = create_user()
+    PostModel.objects().all().delete()
+    now = datetime.now()
+    old_popular = PostModel(
+        title="Old", content="Content", author=user1["id"], vote=50
+    ).save()
+    new_post = PostModel(
+        title="New", content="Content", author=user1["id"], vote=5
+    ).save()
+    old_popular.created_at = now - timedelta(days=2)
+    old_popular.save()
+
+    assert recompute_hot_scores(now) == 2
+
+    response = client.get("/feed?sort=hot")
+
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json["results"]] == [
+        str(new_post.id),
+        str(old_popular.id),
+    ]
+
+    # Leaving the window drops the score, a stale one would keep it on top.
+    stale = PostModel(
+        title="Stale", content="Content", author=user1["id"], vote=50
+    ).save()
+    PostModel.objects(id=stale.id).update_one(
+        set__created_at=now - timedelta(hours=HOT_SCORE_WINDOW + 24),
+        set__hot_score=1.0,
+    )
+    recompute_hot_scores(now)
+
+    stale.reload()
+    assert stale.hot_score == 0
+    response = client.get("/feed?sort=hot&limit=10")
+    assert response.json["results"][-1]["id"] == str(stale.id)
+
+
+def test_get_feed_response_cache(client):
+    user1 = create_user()
+    token = create_token(user1)
+    PostModel(title="Cached", content="Content", author=user1["id"]).save()
+
+    response = client.get("/feed?limit=3&date=desc")
+    assert response.headers["X-Cache"] == "MISS"
+    response = client.get("/feed?date=desc&limit=3")
+    assert response.headers["X-Cache"] == "HIT"
+    response = client.get(
+        "/feed?date=desc&limit=3", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert "X-Cache" not in response.headers
+
+    created = client.post(
+        "/post",
+        json={"title": "Fresh", "content": "Content"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    response = client.get("/feed?limit=3&date=desc")
+
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.json["results"][0]["id"] == created.json["post_id"]
+
+    cache.invalidate_feed_cache()
+    request_hash = cache.sha1(b"/feed?date=desc&limit=3").hexdigest()
+    redis_client.set(cache.FEED_CACHE_LOCK_KEY.format(request_hash), 1)
+    response = client.get("/feed?limit=3&date=desc")
+
+    assert response.headers["X-Cache"] == "STALE"
+    assert response.json["results"][0]["id"] == created.json["post_id"]
+
+
+def test_reconcile_tag_post_counts(client):
+    user1 = create_user()
+    tag = TagModel(name=f"Drift {uuid4().hex[:6]}", author=user1["id"]).save()
+    PostModel(title="Post", content="Content", author=user1["id"], tags=[tag.id]).save()
+    TagModel.objects(id=tag.id).update_one(set__post_count=5)
+
+    reconcile_counters()
+
+    assert TagModel.objects(id=tag.id).get().post_count == 1
+
+
+def test_reconcile_post_comment_counts(client):
+    user1 = create_user()
+    post = PostModel(title="Post", content="Content", author=user1["id"]).save()
+    for _ in range(2):
+        CommentModel.objects.create(
+            post_id=post.id,
+            content="Comment",
+            author={"id": user1["id"], "name": user1["name"]},
+        )
+    PostModel.objects(id=post.id).update_one(set__comment_count=5)
+
+    reconcile_counters()
+
+    assert PostModel.objects(id=post.id).get().comment_count == 2
+
+
+def test_get_feed_my_vote(client):
+    author = create_user()
+    reader = create_user()
+    headers = {"Authorization": f"Bearer {create_token(reader)}"}
+    voted = PostModel(title="Voted", content="Content", author=author["id"]).save()
+    PostModel(title="Not voted", content="Content", author=author["id"]).save()
+    client.post(f"/user/{author['id']}/follow", headers=headers)
+    client.post(
+        "/vote", json={"post_id": str(voted.id), "vote_value": 1}, headers=headers
+    )
+
+    response = client.get("/feed?q=followed&cursor=", headers=headers)
+
+    assert {post["title"]: post["my_vote"] for post in response.json["results"]} == {
+        "Voted": 1,
+        "Not voted": 0,
+    }
+    assert "my_vote" not in client.get("/feed").json["results"][0]
+
+
+def test_get_feed_followed_author_flagged_after_build(client, monkeypatch):
+    author = create_user()
+    reader = create_user()
+    author_token = create_token(author)
+    reader_headers = {"Authorization": f"Bearer {create_token(reader)}"}
+    client.post(f"/user/{author['id']}/follow", headers=reader_headers)
+    post_ids = [
+        client.post(
+            "/post",
+            json={"title": f"Post {i}", "content": "Content"},
+            headers={"Authorization": f"Bearer {author_token}"},
+        ).json["post_id"]
+        for i in range(2)
+    ]
+    client.get("/feed?q=followed", headers=reader_headers)
+    timeline_key = timeline.TIMELINE_KEY.format(reader["id"])
+    assert redis_client.zscore(timeline_key, post_ids[0])
+
+    # Flagged elsewhere, the stored entries are still in the timeline.
+    redis_client.sadd(timeline.FANOUT_ON_READ_KEY, author["id"])
+    response = client.get("/feed?q=followed", headers=reader_headers)
+
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json["results"]] == post_ids[::-1]
+
+    redis_client.srem(timeline.FANOUT_ON_READ_KEY, author["id"])
+    monkeypatch.setattr(timeline, "TIMELINE_FANOUT_LIMIT", 0)
+    new_post_id = client.post(
+        "/post",
+        json={"title": "Post 2", "content": "Content"},
+        headers={"Authorization": f"Bearer {author_token}"},
+    ).json["post_id"]
+
+    # Flagging removes the author's fanned out posts from the timelines.
+    assert not redis_client.zscore(timeline_key, post_ids[0])
+    response = client.get("/feed?q=followed", headers=reader_headers)
+    assert [post["id"] for post in response.json["results"]] == [
+        new_post_id
+    ] + post_ids[::-1]
+    redis_client.srem(timeline.FANOUT_ON_READ_KEY, author["id"])
+
+
+def test_get_feed_followed_past_timeline_length(client, monkeypatch):
+    monkeypatch.setattr(timeline, "TIMELINE_MAX_LENGTH", 5)
+    author = create_user()
+    reader = create_user()
+    headers = {"Authorization": f"Bearer {create_token(reader)}"}
+    client.post(f"/user/{author['id']}/follow", headers=headers)
+    posts = [
+        PostModel(title=f"Post {i}", content="Content", author=author["id"]).save()
+        for i in range(12)
+    ]
+    expected = [str(post.id) for post in reversed(posts)]
+
+    seen = []
+    cursor = ""
+    while cursor is not None:
+        response = client.get(
+            f"/feed?q=followed&limit=4&cursor={cursor}", headers=headers
+        )
+        assert response.status_code == 200
+        seen.extend(post["id"] for post in response.json["results"])
+        cursor = response.json["pagination"]["next_cursor"]
+    assert seen == expected
+    assert redis_client.zcard(timeline.TIMELINE_KEY.format(reader["id"])) == 5
+
+    response = client.get("/feed?q=followed&limit=4&page=3", headers=headers)
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json["results"]] == expected[8:]
+    assert response.json["pagination"]["total_count"] == 12
+
+
+def test_fan_out_skips_unbuilt_timelines(client):
+    author = create_user()
+    reader = create_user()
+    author_headers = {"Authorization": f"Bearer {create_token(author)}"}
+    client.post(
+        f"/user/{author['id']}/follow",
+        headers={"Authorization": f"Bearer {create_token(reader)}"},
+    )
+    timeline_key = timeline.TIMELINE_KEY.format(reader["id"])
+
+    client.post(
+        "/post", json={"title": "Post", "content": "Content"}, headers=author_headers
+    )
+    assert not redis_client.exists(timeline_key)
+
+    with app.app_context():
+        timeline.rebuild_timeline(reader["id"])
+    redis_client.persist(timeline_key)
+    client.post(
+        "/post", json={"title": "Post", "content": "Content"}, headers=author_headers
+    )
+    assert redis_client.zcard(timeline_key) == 2
+    assert redis_client.ttl(timeline_key) > 0
@@ -6,8 +6,18 @@ from fakeredis import FakeStrictRedis
 from app import create_app
 from app.models.post import PostModel
 from app.models.user import UserModel
+from app.models.tag import TagModel
 from app.schemas.user import user_schema
 from app.utils import create_token
+from app.models.comment import CommentModel
+from app.models.counter import CounterModel, AUTHOR_POSTS_COUNTER
+from app.migrations import (
+    backfill_post_list_fields,
+    backfill_post_slugs,
+    drain_post_comments,
+    rerender_content_html,
+)
+from app.loader import get_loader
 from bcrypt import hashpw, gensalt
 
 # Mock MongoDB and Redis connections
@@ -189,3 +199,495 @@ def test_delete_post(client):
     )
 
     assert response.status_code == 204
+
+
+def test_post_list_fields(client):
+    post = PostModel.objects.create(title="Post", content="x" * 500, author=user["id"])
+    CommentModel.objects.create(
+        post_id=post.id,
+        content="Comment",
+        author={"id": user["id"], "name": "Test User"},
+    )
+    post.reload()
+
+    assert post.summary == "x" * 200 + "..."
+    assert post.comment_count == 1
+
+
+def test_backfill_post_list_fields(client):
+    post = PostModel.objects.create(title="Post", content="Content", author=user["id"])
+    PostModel.objects(id=post.id).update_one(unset__summary=True)
+
+    assert backfill_post_list_fields() >= 1
+
+    post.reload()
+    assert post.summary == "Content..."
+
+
+def test_relation_loader(client):
+    author = create_user()
+    post = PostModel.objects.create(
+        title="Post", content="Content", author=author["id"]
+    )
+
+    with app.test_request_context():
+        loader = get_loader()
+        loader.queue_users([post.author])
+        users = loader.load_users([ObjectId()])
+        UserModel.objects(id=author["id"]).delete()
+
+        # Memoized for the rest of the request, unknown ids are skipped.
+        assert list(users) == [post.author]
+        assert (
+            get_loader().load_users([author["id"]])[post.author]["name"] == "Test User"
+        )
+
+
+def test_get_post_author_renamed(client):
+    author = create_user()
+    author_token = create_token(author)
+    post = PostModel.objects.create(
+        title="Post", content="Content", author=author["id"]
+    )
+
+    response = client.get(f"/post/{post.id}")
+    assert response.json["author"]["name"] == "Test User"
+
+    client.put(
+        f"/user/{author['id']}",
+        json={"name": "Renamed User"},
+        headers={"Authorization": f"Bearer {author_token}"},
+    )
+    response = client.get(f"/post/{post.id}")
+
+    assert response.json["author"]["name"] == "Renamed User"
+
+
+def test_get_post_details(client):
+    author = create_user()
+    author_token = create_token(author)
+    response = client.post(
+        "/post",
+        json={"title": "Detail post", "content": "Content"},
+        headers={"Authorization": f"Bearer {author_token}"},
+    )
+    post_id = response.json["post_id"]
+    slug = response.json["url"].split("/")[-1]
+    client.post(
+        "/comment",
+        json={"post_id": post_id, "content": "First comment"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    client.post(
+        "/vote",
+        json={"post_id": post_id, "vote_value": 1},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    response = client.get(
+        f"/post/{post_id}", headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response.status_code == 200
+    assert [comment["content"] for comment in response.json["comments"]] == [
+        "First comment"
+    ]
+    assert response.json["author"]["name"] == "Test User"
+    assert response.json["author"]["vote"] == 1
+
+    response = client.get(f"/post/{slug}")
+
+    assert response.json["id"] == post_id
+    assert "vote" not in response.json["author"]
+
+
+def test_post_slug(client):
+    first = PostModel.objects.create(
+        title="Same Title!", content="Content", author=user["id"]
+    )
+    second = PostModel.objects.create(
+        title="Same title", content="Content", author=user["id"]
+    )
+    third = PostModel.objects.create(
+        title="Same title", content="Content", author=user["id"]
+    )
+
+    date = first.created_at.strftime("%Y%m%d")
+    assert first.slug == f"same-title-{date}"
+    assert second.slug == f"same-title-{date}-2"
+    assert third.slug == f"same-title-{date}-3"
+    assert second.url.endswith(f"/post/same-title-{date}-2")
+
+    response = client.get(f"/post/{second.slug}")
+
+    assert response.json["id"] == str(second.id)
+    assert response.json["url"] == second.url
+
+
+def test_backfill_post_slugs(client):
+    post = PostModel.objects.create(
+        title="Old post", content="Content", author=user["id"]
+    )
+    PostModel._get_collection().update_one(
+        {"_id": post.id},
+        {"$unset": {"slug": ""}, "$set": {"url": PostModel.create_url("old-post-1")}},
+    )
+    taken = PostModel.objects.create(
+        title="Taken", content="Content", author=user["id"]
+    )
+    PostModel._get_collection().update_one(
+        {"_id": taken.id},
+        {"$unset": {"slug": ""}, "$set": {"url": PostModel.create_url("old-post-1")}},
+    )
+
+    response = client.get(f"/post/{post.id}")
+    assert response.json["url"] == PostModel.create_url("old-post-1")
+    # Served by the stored url until the migration runs.
+    assert client.get("/post/old-post-1").json["id"] == str(post.id)
+
+    assert backfill_post_slugs() >= 2
+
+    post.reload()
+    taken.reload()
+    assert post.slug == "old-post-1"
+    assert taken.slug == "old-post-1-2"
+    assert "url" not in PostModel._get_collection().find_one({"_id": post.id})
+    assert client.get("/post/old-post-1").json["id"] == str(post.id)
+
+
+def test_get_post_etag(client):
+    post = PostModel.objects.create(
+        title="Etag post", content="Content", author=user["id"]
+    )
+
+    response = client.get(f"/post/{post.id}")
+    etag = response.headers["ETag"]
+    response = client.get(f"/post/{post.id}", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+
+    response = client.get(
+        f"/post/{post.id}",
+        headers={"If-None-Match": etag, "Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+
+    client.put(
+        f"/post/{post.id}",
+        json={"title": "Etag post", "content": "Edited"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    response = client.get(f"/post/{post.id}", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.json["content"] == "Edited"
+
+
+def test_get_user_posts_etag(client):
+    author = create_user()
+    PostModel.objects.create(
+        title="Profile post", content="Content", author=author["id"]
+    )
+
+    etag = client.get(f"/user/{author['id']}/post").headers["ETag"]
+    response = client.get(f"/user/{author['id']}/post", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    PostModel.objects.create(
+        title="Another post", content="Content", author=author["id"]
+    )
+    response = client.get(f"/user/{author['id']}/post", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert len(response.json["posts"]) == 2
+
+
+def test_drain_post_comments(client):
+    post = PostModel.objects.create(
+        title="Old post", content="Content", author=user["id"]
+    )
+    comments = [
+        CommentModel.objects.create(
+            post_id=post.id,
+            content="Comment",
+            author={"id": user["id"], "name": "Test User"},
+        )
+        for _ in range(2)
+    ]
+    PostModel._get_collection().update_one(
+        {"_id": post.id},
+        {
+            "$set": {
+                "comments": [comment.id for comment in comments],
+                "comment_count": 0,
+            }
+        },
+    )
+
+    assert drain_post_comments() >= 1
+
+    stored = PostModel._get_collection().find_one({"_id": post.id})
+    assert "comments" not in stored
+    assert stored["comment_count"] == 2
+
+
+def test_bulk_posts(client):
+    author = create_user()
+    author_token = create_token(author)
+    headers = {"Authorization": f"Bearer {author_token}"}
+    tag = TagModel(name=f"Bulk {uuid4().hex[:6]}", author=author["id"]).save()
+    others_post = PostModel.objects.create(
+        title="Other", content="Content", author=user["id"]
+    )
+    own_post = PostModel.objects.create(
+        title="Own", content="Content", author=author["id"]
+    )
+
+    response = client.post(
+        "/post/bulk",
+        json={
+            "posts": [
+                {"title": "Bulk post", "content": "Content", "tags": [str(tag.id)]},
+                {"title": "Bulk post", "content": "Content"},
+                {"title": "Missing content"},
+                {"title": "Bad tag", "content": "Content", "tags": [str(ObjectId())]},
+                {"id": str(own_post.id), "title": "Own", "content": "Edited"},
+                {"id": str(others_post.id), "title": "Other", "content": "Edited"},
+            ]
+        },
+        headers=headers,
+    )
+
+    assert response.status_code == 200
+    statuses = [result["status"] for result in response.json["results"]]
+    assert statuses == [201, 201, 400, 400, 200, 401]
+    assert response.json["created_count"] == 2
+    assert response.json["failed_count"] == 3
+
+    first, second = [
+        PostModel.objects.get(id=result["post_id"])
+        for result in response.json["results"][:2]
+    ]
+    assert first.tags == [tag.id]
+    assert first.summary == "Content..."
+    assert second.slug == f"{first.slug}-2"
+    own_post.reload()
+    assert own_post.content == "Edited"
+    assert own_post.summary == "Edited..."
+
+    response = client.post("/post/bulk", json={"posts": []}, headers=headers)
+    assert response.status_code == 400
+
+
+def test_bulk_posts_tag_counts(client):
+    author = create_user()
+    headers = {"Authorization": f"Bearer {create_token(author)}"}
+    old_tag, new_tag = [
+        TagModel(name=f"Bulk {name} {uuid4().hex[:6]}", author=author["id"]).save()
+        for name in ["old", "new"]
+    ]
+    post = PostModel(
+        title="Retagged", content="Content", author=author["id"], tags=[old_tag.id]
+    ).save()
+    item = {"id": str(post.id), "title": "Retagged", "content": "Content"}
+
+    response = client.post(
+        "/post/bulk",
+        json={"posts": [{**item, "tags": [str(new_tag.id)]}, {**item, "tags": []}]},
+        headers=headers,
+    )
+
+    assert [result["status"] for result in response.json["results"]] == [200, 400]
+    assert TagModel.objects.get(id=old_tag.id).post_count == 0
+    assert TagModel.objects.get(id=new_tag.id).post_count == 1
+
+    # The tags replaced are read with the update, not from an earlier read.
+    response = client.post(
+        "/post/bulk", json={"posts": [{**item, "tags": []}]}, headers=headers
+    )
+    assert response.json["results"][0]["status"] == 200
+    assert TagModel.objects.get(id=old_tag.id).post_count == 0
+    assert TagModel.objects.get(id=new_tag.id).post_count == 0
+
+
+def test_post_tags_attach_detach(client):
+    owner = create_user()
+    owner_token = create_token(owner)
+    tag = TagModel(name=f"Attach {uuid4().hex[:6]}", author=owner["id"]).save()
+    post = PostModel(title="Tagged", content="Content", author=owner["id"]).save()
+    headers = {"Authorization": f"Bearer {owner_token}"}
+
+    response = client.post(
+        f"/post/{post.id}/tag", json={"id": str(tag.id)}, headers=headers
+    )
+    assert response.status_code == 201
+    response = client.post(
+        f"/post/{post.id}/tag", json={"id": str(tag.id)}, headers=headers
+    )
+    assert response.status_code == 400
+    assert PostModel.objects(id=post.id).get().tags == [tag.id]
+    assert TagModel.objects(id=tag.id).get().post_count == 1
+
+    response = client.post(f"/post/{post.id}/tag", json={"id": str(tag.id)})
+    assert response.status_code == 401
+    response = client.post(
+        f"/post/{post.id}/tag",
+        json={"id": str(tag.id)},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 404
+
+    response = client.delete(
+        f"/post/{post.id}/tag", json={"id": str(tag.id)}, headers=headers
+    )
+    assert response.status_code == 204
+    response = client.delete(
+        f"/post/{post.id}/tag", json={"id": str(tag.id)}, headers=headers
+    )
+    assert response.status_code == 404
+    assert PostModel.objects(id=post.id).get().tags == []
+    assert TagModel.objects(id=tag.id).get().post_count == 0
+
+
+def test_post_content_html(client):
+    response = client.post(
+        "/post",
+        json={
+            "title": "Html post",
+            "content": '<p onclick="x()">Hi <a href="javascript:x()">there</a>'
+            "<script>alert(1)</script>",
+        },
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    post_id = response.json["post_id"]
+    client.post(
+        "/comment",
+        json={"post_id": post_id, "content": "<b>Bold</b> <i>move"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    response = client.get(f"/post/{post_id}")
+
+    assert response.json["content_html"] == "<p>Hi <a>there</a></p>"
+    assert response.json["comments"][0]["content_html"] == "<b>Bold</b> <i>move</i>"
+    assert "content_html" not in client.get("/feed").json["results"][0]
+
+
+def test_rerender_content_html(client):
+    post = PostModel(title="Old html", content="<em>Old</em>", author=user["id"]).save()
+    comment = CommentModel(
+        author={"id": user["id"], "name": user["name"]},
+        post_id=post.id,
+        content="<em>Old</em><style>p {}</style>",
+    ).save()
+    PostModel.objects(id=post.id).update_one(
+        set__content_html="<em>Old</em>", set__content_html_version="old"
+    )
+    CommentModel.objects(id=comment.id).update_one(set__content_html_version="old")
+    version = PostModel.objects(id=post.id).get().version
+
+    assert rerender_content_html() >= 2
+
+    post = PostModel.objects(id=post.id).get()
+    assert post.content_html == "<em>Old</em>"
+    assert post.version == version + 1
+    assert CommentModel.objects(id=comment.id).get().content_html == "<em>Old</em>"
+    assert rerender_content_html() == 0
+
+
+def test_get_user_posts_pages(client):
+    author = create_user()
+    author_token = create_token(author)
+    posts = [
+        PostModel(title=f"Profile {i}", content="Content", author=author["id"]).save()
+        for i in range(3)
+    ]
+    client.post(
+        f"/user/{author['id']}/follow", headers={"Authorization": f"Bearer {token}"}
+    )
+
+    response = client.get(
+        f"/user/{author['id']}/post?limit=2",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert [post["id"] for post in response.json["posts"]] == [
+        str(posts[2].id),
+        str(posts[1].id),
+    ]
+    assert response.json["user"]["is_following"] is True
+    assert "is_follower" not in response.json["user"]
+
+    cursor = response.json["pagination"]["next_cursor"]
+    response = client.get(f"/user/{author['id']}/post?limit=2&cursor={cursor}")
+
+    assert [post["id"] for post in response.json["posts"]] == [str(posts[0].id)]
+    assert response.json["pagination"]["next_cursor"] is None
+
+    response = client.get(
+        f"/user/{user['id']}/post", headers={"Authorization": f"Bearer {author_token}"}
+    )
+    assert response.json["user"]["is_follower"] is True
+    assert "is_following" not in response.json["user"]
+
+    response = client.get(f"/user/{author['id']}/post?cursor=invalid")
+    assert response.status_code == 400
+
+
+def test_get_user_posts_my_vote(client):
+    author = create_user()
+    post = PostModel(title="Voted", content="Content", author=author["id"]).save()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get(f"/user/{author['id']}/post", headers=headers)
+    assert response.json["posts"][0]["my_vote"] == 0
+    etag = response.headers["ETag"]
+
+    client.post(
+        "/vote", json={"post_id": str(post.id), "vote_value": -1}, headers=headers
+    )
+    response = client.get(
+        f"/user/{author['id']}/post", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json["posts"][0]["my_vote"] == -1
+
+    response = client.get(f"/user/{author['id']}/post")
+    assert "my_vote" not in response.json["posts"][0]
+
+
+def test_get_user_posts_etag_follows_comments(client):
+    author = create_user()
+    post = PostModel(title="Commented", content="Content", author=author["id"]).save()
+    etag = client.get(f"/user/{author['id']}/post").headers["ETag"]
+
+    client.post(
+        "/comment",
+        json={"post_id": str(post.id), "content": "First comment"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    response = client.get(f"/user/{author['id']}/post", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.json["posts"][0]["comment_count"] == 1
+    response = client.get(
+        f"/user/{author['id']}/post",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == 304
+
+
+def test_post_soft_delete_counts_once(client):
+    author = create_user()
+    tag = TagModel(name=f"Delete {uuid4().hex[:6]}", author=author["id"]).save()
+    post = PostModel(
+        title="Deleted twice", content="Content", author=author["id"], tags=[tag.id]
+    ).save()
+    stale_copy = PostModel.objects.get(id=post.id)
+
+    assert post.soft_delete()
+    assert not stale_copy.soft_delete()
+
+    assert CounterModel.get_value(AUTHOR_POSTS_COUNTER.format(author["id"])) == 0
+    assert TagModel.objects.get(id=tag.id).post_count == 0
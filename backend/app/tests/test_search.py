@@ -0,0 +1,177 @@
+from app.models.post import PostModel
+from app.models.tag import TagModel
+from app.models.user import UserModel
+from app.schemas.user import user_schema
+from app.search import (
+    SEARCH_CHANGES_CHANNEL,
+    SearchIndex,
+    search_index,
+    load_search_index,
+    start_search_listener,
+)
+from app import create_app
+from app.utils import create_token
+from mongomock import MongoClient
+from fakeredis import FakeStrictRedis
+from bcrypt import hashpw, gensalt
+from bson import ObjectId
+from uuid import uuid4
+import pytest
+import time
+
+# Mock MongoDB and Redis connections
+mongo_client = MongoClient()
+redis_client = FakeStrictRedis()
+
+app = create_app(
+    db="mongoenginetest",
+    mongodb_uri="mongodb://localhost",
+    mongo_client_class=MongoClient,
+    redis_client=redis_client,
+    TESTING=True,
+)
+
+
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+
+def create_user():
+    user = UserModel(
+        name="Test User",
+        email=f"{uuid4()}@example.com",
+        password=hashpw("test_pass".encode("utf-8"), gensalt(rounds=12)),
+    ).save()
+    return user_schema.dump(user)
+
+
+def unique_word():
+    return f"w{uuid4().hex[:10]}"
+
+
+def test_search_posts(client):
+    user = create_user()
+    word = unique_word()
+    in_title = PostModel(
+        title=f"All about {word}", content="Content", author=user["id"]
+    ).save()
+    in_content = PostModel(
+        title="Something else", content=f"Mentions {word} once", author=user["id"]
+    ).save()
+    PostModel(title="Unrelated", content="Content", author=user["id"]).save()
+    search_index.clear()
+    load_search_index()
+
+    response = client.get(f"/search?q={word}&limit=1")
+
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json["results"]] == [str(in_title.id)]
+    assert response.json["results"][0]["author"]["name"] == "Test User"
+
+    cursor = response.json["pagination"]["next_cursor"]
+    response = client.get(f"/search?q={word}&limit=1&cursor={cursor}")
+
+    assert [post["id"] for post in response.json["results"]] == [str(in_content.id)]
+    assert response.json["pagination"]["next_cursor"] is None
+
+    response = client.get(f"/search?q={unique_word()}")
+    assert response.status_code == 404
+
+    response = client.get("/search")
+    assert response.status_code == 400
+
+    response = client.get(f"/search?q={word}&cursor=invalid")
+    assert response.status_code == 400
+
+
+def test_search_index_follows_writes(client):
+    user = create_user()
+    token = create_token(user)
+    headers = {"Authorization": f"Bearer {token}"}
+    word, new_word = unique_word(), unique_word()
+    tag = TagModel(name=f"Tag {unique_word()}", author=user["id"]).save()
+    load_search_index()
+
+    response = client.post(
+        "/post",
+        json={"title": "Indexed", "content": f"About {word}", "tags": [str(tag.id)]},
+        headers=headers,
+    )
+    post_id = response.json["post_id"]
+
+    assert client.get(f"/search?q={word}").json["results"][0]["id"] == post_id
+    tag_term = tag.name.split()[-1]
+    assert client.get(f"/search?q={tag_term}").status_code == 404
+    response = client.get(f"/search?q={tag_term}&tags=true")
+    assert response.json["results"][0]["id"] == post_id
+
+    client.put(
+        f"/post/{post_id}",
+        json={"title": "Indexed", "content": f"About {new_word}"},
+        headers=headers,
+    )
+    assert client.get(f"/search?q={word}").status_code == 404
+    assert client.get(f"/search?q={new_word}").status_code == 200
+
+    client.delete(f"/post/{post_id}", headers=headers)
+    assert client.get(f"/search?q={new_word}").status_code == 404
+
+
+def test_search_index_follows_other_processes(client):
+    user = create_user()
+    headers = {"Authorization": f"Bearer {create_token(user)}"}
+    word, new_word = unique_word(), unique_word()
+    load_search_index()
+
+    # Writes are announced to the other processes.
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(SEARCH_CHANGES_CHANNEL)
+    response = client.post(
+        "/post", json={"title": "Shared", "content": f"About {word}"}, headers=headers
+    )
+    post_id = response.json["post_id"]
+    messages = [pubsub.get_message(timeout=1) for _ in range(2)]
+    assert [message["data"].decode("utf-8") for message in messages if message] == [
+        post_id
+    ]
+    pubsub.close()
+
+    # Another process announces its write on the channel.
+    start_search_listener(redis_client)
+    post = PostModel.objects(id=post_id).first()
+    post.update(set__content=f"About {new_word}", inc__version=1)
+    for _ in range(100):
+        redis_client.publish(SEARCH_CHANGES_CHANNEL, post_id)
+        if client.get(f"/search?q={new_word}").status_code == 200:
+            break
+        time.sleep(0.05)
+    assert client.get(f"/search?q={new_word}").json["results"][0]["id"] == post_id
+    assert client.get(f"/search?q={word}").status_code == 404
+
+    post.delete()
+    redis_client.publish(SEARCH_CHANGES_CHANNEL, post_id)
+    for _ in range(100):
+        if client.get(f"/search?q={new_word}").status_code == 404:
+            break
+        time.sleep(0.05)
+    assert client.get(f"/search?q={new_word}").status_code == 404
+
+
+def test_search_index_versions_and_compaction():
+    index = SearchIndex()
+    ids = [ObjectId() for _ in range(3)]
+    index.add([(id, 1, "apple", "banana", []) for id in ids])
+    index.add([(ids[0], 0, "cherry", "", [])])
+
+    assert {id for _, id in index.search("apple", 10)} == set(ids)
+    assert index.search("cherry", 10) == []
+
+    index.add([(ids[0], 2, "cherry", "", [])])
+    index.remove([ids[1]])
+    index.compact()
+
+    assert [id for _, id in index.search("apple", 10)] == [ids[2]]
+    assert [id for _, id in index.search("cherry", 10)] == [ids[0]]
+    assert len(index) == 2
@@ -1,13 +1,24 @@
 from app.models.tag import TagModel
+from app.models.post import PostModel
 from app.models.user import UserModel
 from app.schemas.user import user_schema
 from app import create_app
 from app.utils import create_token
+from app.loader import get_loader
+from app.tag_registry import (
+    tag_registry,
+    load_tag_registry,
+    resolve_tag_id,
+    start_tag_listener,
+    TAG_CHANGES_CHANNEL,
+)
 from mongomock import MongoClient
 from fakeredis import FakeStrictRedis
 from bcrypt import hashpw, gensalt
+from bson import ObjectId
 from uuid import uuid4
 import pytest
+import time
 
 
 # Mock MongoDB and Redis connections
@@ -96,3 +107,170 @@ def test_tag_resource_post_unallowed_attribute(client):
     assert response.status_code == 400
     assert "error" in response.json
     assert response.json["error"] == "Unallowed attribute."
+
+
+def test_get_tag_posts(client):
+    user = create_user()
+    tag = TagModel.objects.create(name=f"Tag{uuid4().hex}", author=user["id"])
+    tagged = [
+        PostModel(
+            title=f"Tagged {i}", content="Content", author=user["id"], tags=[tag.id]
+        ).save()
+        for i in range(3)
+    ]
+    PostModel(title="Untagged", content="Content", author=user["id"]).save()
+
+    response = client.get(f"/tag/{tag.name}/posts?limit=2")
+
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json["results"]] == [
+        str(tagged[2].id),
+        str(tagged[1].id),
+    ]
+    assert response.json["results"][0]["tags"][0]["name"] == tag.name
+
+    cursor = response.json["pagination"]["next_cursor"]
+    response = client.get(f"/tag/{tag.id}/posts?limit=2&cursor={cursor}")
+
+    assert [post["id"] for post in response.json["results"]] == [str(tagged[0].id)]
+    assert response.json["pagination"]["next_cursor"] is None
+
+    response = client.get(f"/feed?tag={tag.name}")
+
+    assert response.status_code == 200
+    assert response.json["pagination"]["total_count"] == 3
+    assert len(response.json["results"]) == 3
+
+
+def test_get_tag_posts_unknown_tag(client):
+    response = client.get(f"/tag/{uuid4().hex}/posts")
+
+    assert response.status_code == 404
+
+
+def test_tag_resource_get_etag(client):
+    user = create_user()
+    token = create_token(user)
+    tag = TagModel(name=f"Etag {uuid4().hex[:6]}", author=user["id"]).save()
+
+    response = client.get("/tag")
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    response = client.get("/tag", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    client.put(
+        f"/tag/{tag.id}",
+        json={"name": f"Renamed {uuid4().hex[:6]}"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    response = client.get("/tag", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    etag = client.get(f"/tag/{tag.id}").headers["ETag"]
+    response = client.get(f"/tag/{tag.id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_tag_resource_get_pages(client):
+    user = create_user()
+    prefix = uuid4().hex[:6]
+    tags = [
+        TagModel(
+            name=f"Popular {prefix} {i}", author=user["id"], post_count=10**9 + i
+        ).save()
+        for i in range(3)
+    ]
+
+    response = client.get("/tag?sort=popular&limit=2")
+
+    assert response.status_code == 200
+    assert [tag["id"] for tag in response.json["results"]] == [
+        str(tags[2].id),
+        str(tags[1].id),
+    ]
+    assert response.json["results"][0]["post_count"] == 10**9 + 2
+    assert response.json["pagination"]["next_page"] == 2
+
+    response = client.get("/tag?sort=popular&limit=2&cursor=")
+    cursor = response.json["pagination"]["next_cursor"]
+    response = client.get(f"/tag?sort=popular&limit=2&cursor={cursor}")
+    assert response.json["results"][0]["id"] == str(tags[0].id)
+
+    names = [tag["name"] for tag in client.get("/tag?limit=1000").json["results"]]
+    assert names == sorted(names)
+
+    etag = client.get("/tag?sort=popular&limit=2").headers["ETag"]
+    TagModel.increment_post_count([tags[0].id], 5)
+    response = client.get("/tag?sort=popular&limit=2", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json["results"][0]["id"] == str(tags[0].id)
+
+    # Tags past an uncounted page leave its ETag alone.
+    etag = client.get("/tag?sort=popular&limit=2&count=none").headers["ETag"]
+    TagModel(name=f"Unpopular {prefix}", author=user["id"]).save()
+    response = client.get(
+        "/tag?sort=popular&limit=2&count=none", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    assert client.get("/tag?sort=invalid").status_code == 400
+
+
+def test_tag_resource_get_limit(client, monkeypatch):
+    user = create_user()
+    for i in range(3):
+        TagModel(name=f"Limit {uuid4().hex[:6]} {i}", author=user["id"]).save()
+    monkeypatch.setattr("app.utils.PAGINATION_MAX_LIMIT", 2)
+
+    response = client.get("/tag?limit=100000")
+    assert len(response.json["results"]) == 2
+    assert response.json["pagination"]["next_page"] == 2
+
+    response = client.get("/tag?limit=100000&cursor=")
+    assert len(response.json["results"]) == 2
+    assert response.json["pagination"]["limit"] == 2
+
+
+def test_tag_registry(client):
+    user = create_user()
+    headers = {"Authorization": f"Bearer {create_token(user)}"}
+    load_tag_registry()
+    try:
+        response = client.post(
+            "/tag", json={"name": f"Registry {uuid4().hex[:6]}"}, headers=headers
+        )
+        tag_id = ObjectId(response.json["id"])
+        name = response.json["name"]
+        assert tag_registry.get_id(name) == tag_id
+
+        # Names and tags are served from the registry, MongoDB is not read.
+        TagModel.objects(id=tag_id).update_one(set__name="Changed elsewhere")
+        with app.test_request_context():
+            assert get_loader().load_tags([tag_id])[tag_id]["name"] == name
+        assert resolve_tag_id(name) == tag_id
+
+        # Another process announces its change on the channel.
+        start_tag_listener(redis_client)
+        for _ in range(100):
+            redis_client.publish(TAG_CHANGES_CHANNEL, str(tag_id))
+            if tag_registry.get_id("Changed elsewhere") == tag_id:
+                break
+            time.sleep(0.05)
+        assert tag_registry.get_id("Changed elsewhere") == tag_id
+        assert tag_registry.get_id(name) is None
+
+        client.delete(f"/tag/{tag_id}", headers=headers)
+        assert tag_registry.get_many([tag_id]) == {}
+        assert resolve_tag_id("Changed elsewhere") is None
+
+        # Misses are not cached, a tag not announced yet resolves at once.
+        unannounced = f"Unannounced {uuid4().hex[:6]}"
+        assert resolve_tag_id(unannounced) is None
+        tag = TagModel(
+            name=TagModel.normalize_name(unannounced), author=user["id"]
+        ).save()
+        assert resolve_tag_id(unannounced) == tag.id
+    finally:
+        tag_registry.clear()
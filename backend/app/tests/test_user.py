@@ -144,3 +144,41 @@ def test_get_users_followings_deleted_user(client):
     assert isinstance(response.json, list)
     assert len(response.json) > 0
     assert all("id" in user and "name" in user for user in response.json)
+
+
+def test_follow_counters(client):
+    followee = create_user()
+    follower_token = create_token(create_user())
+
+    client.post(
+        f"/user/{followee['id']}/follow",
+        headers={"Authorization": f"Bearer {follower_token}"},
+    )
+    response = client.get(f"/user/{followee['id']}/post")
+
+    assert response.json["user"]["followers_count"] == 1
+
+    client.delete(
+        f"/user/{followee['id']}/follow",
+        headers={"Authorization": f"Bearer {follower_token}"},
+    )
+    client.post(
+        f"/user/{followee['id']}/follow",
+        headers={"Authorization": f"Bearer {follower_token}"},
+    )
+    response = client.get(f"/user/{followee['id']}/post")
+
+    assert response.json["user"]["followers_count"] == 1
+    assert response.json["user"]["following_count"] == 0
+
+    # Concurrent unfollows and follows hold copies of the same document.
+    user_follow = UserFollowModel.objects.get(followee_id=followee["id"])
+    stale_copy = UserFollowModel.objects.get(id=user_follow.id)
+    assert user_follow.soft_delete()
+    assert not stale_copy.soft_delete()
+    user_follow = UserFollowModel.objects.get(id=user_follow.id)
+    stale_copy = UserFollowModel.objects.get(id=user_follow.id)
+    assert user_follow.restore()
+    assert not stale_copy.restore()
+    response = client.get(f"/user/{followee['id']}/post?limit=2")
+    assert response.json["user"]["followers_count"] == 1
@@ -7,8 +7,20 @@ from app import create_app
 from app.models.user import UserModel
 from app.schemas.user import user_schema
 from app.utils import create_token
+from app.vote_buffer import flush_vote_buffer
+from app.vote_shards import (
+    fold_vote_shards,
+    promote_post,
+    shard_total_cache,
+    VOTE_SHARD_DIRTY_KEY,
+)
+from app.models.counter import CounterModel, POST_VOTE_SHARD_COUNTER
+from app.counters import reconcile_counters
+from app.config import VOTE_SHARD_COUNT
 from bcrypt import hashpw, gensalt
 from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
+from redis import RedisError
 import pytest
 
 # Mock MongoDB and Redis connections
@@ -61,6 +73,21 @@ def test_vote_resource_post(client):
     assert response.json["message"] == "Vote saved successfully."
 
 
+def test_vote_updates_hot_score(client):
+    post = PostModel.objects.create(
+        title="Test Post", content="Test Content", author=user["id"]
+    )
+
+    client.post(
+        "/vote",
+        json={"post_id": str(post.id), "vote_value": 1},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    post.reload()
+
+    assert post.hot_score > 0
+
+
 def test_vote_resource_post_unallowed_attribute(client):
     values = {"post_id": str(ObjectId()), "vote_value": 1, "extra_attribute": "Extra"}
 
@@ -222,3 +249,273 @@ def test_two_users_vote_and_check_vote_value(client):
     assert response.status_code == 200
     assert "vote" in response.json
     assert response.json["vote"] == -2
+
+
+def test_vote_changes_use_deltas(client):
+    post = PostModel.objects.create(
+        title="Test Post", content="Test Content", author=user["id"]
+    )
+    voter_token = create_token(create_user())
+
+    for vote_value, expected in [(1, 1), (-1, -1), (0, 0), (1, 1)]:
+        response = client.post(
+            "/vote",
+            json={"post_id": str(post.id), "vote_value": vote_value},
+            headers={"Authorization": f"Bearer {voter_token}"},
+        )
+        assert response.status_code == 201
+        assert PostModel.objects(id=post.id).get().vote == expected
+
+    assert VoteModel.objects(post_id=post.id).count() == 1
+
+
+def test_concurrent_votes(client):
+    post = PostModel.objects.create(
+        title="Test Post", content="Test Content", author=user["id"]
+    )
+    tokens = [create_token(create_user()) for _ in range(10)]
+
+    def vote(voter_token):
+        with app.test_client() as voter_client:
+            return voter_client.post(
+                "/vote",
+                json={"post_id": str(post.id), "vote_value": 1},
+                headers={"Authorization": f"Bearer {voter_token}"},
+            ).status_code
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        statuses = list(executor.map(vote, tokens + tokens))
+
+    assert statuses.count(201) == 10
+    assert statuses.count(202) == 10
+    assert PostModel.objects(id=post.id).get().vote == 10
+
+
+def test_vote_deleted_post_is_rolled_back(client):
+    post = PostModel.objects.create(
+        title="Test Post", content="Test Content", author=user["id"]
+    )
+    post.soft_delete()
+
+    response = client.post(
+        "/vote",
+        json={"post_id": str(post.id), "vote_value": 1},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 404
+    assert VoteModel.objects(post_id=post.id).count() == 0
+
+
+def clear_vote_buffer():
+    for key in redis_client.scan_iter("votes:*"):
+        redis_client.delete(key)
+
+
+def test_write_behind_votes(client, monkeypatch):
+    monkeypatch.setattr("app.vote_buffer.VOTE_WRITE_BEHIND", True)
+    clear_vote_buffer()
+    voter = create_user()
+    voter_token = create_token(voter)
+    post = PostModel.objects.create(
+        title="Test Post", content="Test Content", author=user["id"]
+    )
+    VoteModel(author=voter["id"], post_id=post.id, vote_value=-1).save()
+    PostModel.objects(id=post.id).update_one(set__vote=-1)
+
+    response = client.post(
+        "/vote",
+        json={"post_id": str(post.id), "vote_value": 1},
+        headers={"Authorization": f"Bearer {voter_token}"},
+    )
+    assert response.status_code == 201
+    response = client.post(
+        "/vote",
+        json={"post_id": str(post.id), "vote_value": 1},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 201
+    response = client.post(
+        "/vote",
+        json={"post_id": str(post.id), "vote_value": 1},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 202
+
+    # Nothing is written yet, reads add the buffered votes.
+    assert PostModel.objects.get(id=post.id).vote == -1
+    response = client.get(
+        f"/post/{post.id}", headers={"Authorization": f"Bearer {voter_token}"}
+    )
+    assert response.json["vote"] == 2
+    assert response.json["author"]["vote"] == 1
+
+    assert flush_vote_buffer(redis_client) == 1
+    assert PostModel.objects.get(id=post.id).vote == 2
+    assert VoteModel.objects.get(author=voter["id"], post_id=post.id).vote_value == 1
+    assert VoteModel.objects.get(author=user["id"], post_id=post.id).vote_value == 1
+    assert client.get(f"/post/{post.id}").json["vote"] == 2
+    assert flush_vote_buffer(redis_client) == 0
+
+
+def test_write_behind_flush_recovery(client, monkeypatch):
+    monkeypatch.setattr("app.vote_buffer.VOTE_WRITE_BEHIND", True)
+    clear_vote_buffer()
+    post = PostModel.objects.create(
+        title="Test Post", content="Test Content", author=user["id"]
+    )
+    client.post(
+        "/vote",
+        json={"post_id": str(post.id), "vote_value": 1},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    # A flush that crashed after writing to MongoDB leaves its buffer behind.
+    original_pipeline = redis_client.pipeline
+    calls = []
+
+    def failing_pipeline(*args, **kwargs):
+        calls.append(kwargs)
+        if kwargs.get("transaction", True) and len(calls) > 1:
+            raise RedisError("Connection lost")
+        return original_pipeline(*args, **kwargs)
+
+    monkeypatch.setattr(redis_client, "pipeline", failing_pipeline)
+    with pytest.raises(RedisError):
+        flush_vote_buffer(redis_client)
+    monkeypatch.setattr(redis_client, "pipeline", original_pipeline)
+    assert PostModel.objects.get(id=post.id).vote == 1
+
+    assert flush_vote_buffer(redis_client) == 1
+    post.reload()
+    assert post.vote == 1
+    assert len(post.vote_flushes) == 1
+    assert VoteModel.objects.get(author=user["id"], post_id=post.id).vote_value == 1
+
+
+def test_vote_lookup(client, monkeypatch):
+    monkeypatch.setattr("app.vote_buffer.VOTE_WRITE_BEHIND", True)
+    clear_vote_buffer()
+    posts = [
+        PostModel.objects.create(
+            title="Test Post", content="Test Content", author=user["id"]
+        )
+        for _ in range(3)
+    ]
+    headers = {"Authorization": f"Bearer {token}"}
+    VoteModel(author=user["id"], post_id=posts[0].id, vote_value=1).save()
+    client.post(
+        "/vote", json={"post_id": str(posts[1].id), "vote_value": -1}, headers=headers
+    )
+
+    response = client.post(
+        "/vote/lookup",
+        json={"post_ids": [str(post.id) for post in posts]},
+        headers=headers,
+    )
+
+    assert response.status_code == 200
+    assert response.json["votes"] == {
+        str(posts[0].id): 1,
+        str(posts[1].id): -1,
+        str(posts[2].id): 0,
+    }
+
+    response = client.post(
+        "/vote/lookup", json={"post_ids": ["invalid"]}, headers=headers
+    )
+    assert response.status_code == 400
+    response = client.post("/vote/lookup", json={"post_ids": []}, headers=headers)
+    assert response.status_code == 400
+    response = client.post("/vote/lookup", json={"post_ids": [str(posts[0].id)]})
+    assert response.status_code == 401
+    clear_vote_buffer()
+
+
+def test_vote_shards(client, monkeypatch):
+    monkeypatch.setattr("app.vote_shards.VOTE_SHARDING", True)
+    monkeypatch.setattr("app.vote_shards.VOTE_SHARD_THRESHOLD", 2)
+    clear_vote_buffer()
+    post = PostModel.objects.create(
+        title="Test Post", content="Test Content", author=user["id"]
+    )
+    voters = [create_user() for _ in range(5)]
+    for voter in voters:
+        response = client.post(
+            "/vote",
+            json={"post_id": str(post.id), "vote_value": 1},
+            headers={"Authorization": f"Bearer {create_token(voter)}"},
+        )
+        assert response.status_code == 201
+
+    # The third vote promoted the post, the following ones went to shards.
+    post.reload()
+    assert post.vote_shards == VOTE_SHARD_COUNT
+    assert post.vote == 2
+    shard_total_cache.clear()
+    assert client.get(f"/post/{post.id}").json["vote"] == 5
+
+    client.post(
+        "/vote",
+        json={"post_id": str(post.id), "vote_value": -1},
+        headers={"Authorization": f"Bearer {create_token(voters[0])}"},
+    )
+    assert fold_vote_shards(redis_client) == 1
+    assert fold_vote_shards(redis_client) == 0
+    post.reload()
+    assert post.vote == 3
+    assert post.vote_shard_total == 1
+    shard_total_cache.clear()
+    assert client.get(f"/post/{post.id}").json["vote"] == 3
+    clear_vote_buffer()
+
+
+def test_vote_shards_survive_reconcile(client, monkeypatch):
+    monkeypatch.setattr("app.vote_shards.VOTE_SHARDING", True)
+    clear_vote_buffer()
+    post = PostModel.objects.create(
+        title="Test Post", content="Test Content", author=user["id"]
+    )
+    with app.app_context():
+        promote_post(str(post.id))
+    for voter in [create_user() for _ in range(3)]:
+        client.post(
+            "/vote",
+            json={"post_id": str(post.id), "vote_value": 1},
+            headers={"Authorization": f"Bearer {create_token(voter)}"},
+        )
+    assert fold_vote_shards(redis_client) == 1
+
+    reconcile_counters()
+    client.post(
+        "/vote",
+        json={"post_id": str(post.id), "vote_value": 1},
+        headers={"Authorization": f"Bearer {create_token(create_user())}"},
+    )
+    assert fold_vote_shards(redis_client) == 1
+
+    post.reload()
+    assert post.vote == 4
+    assert post.vote_shard_total == 4
+    clear_vote_buffer()
+
+
+def test_vote_shards_fold_dirty_posts(client, monkeypatch):
+    monkeypatch.setattr("app.vote_shards.VOTE_SHARDING", True)
+    clear_vote_buffer()
+    post = PostModel.objects.create(
+        title="Test Post", content="Test Content", author=user["id"]
+    )
+    with app.app_context():
+        promote_post(str(post.id))
+
+    # Shards changed without a marked post are left for later.
+    CounterModel.increment(POST_VOTE_SHARD_COUNTER.format(post.id, 0), 2)
+    assert fold_vote_shards(redis_client) == 0
+
+    redis_client.sadd(VOTE_SHARD_DIRTY_KEY, str(post.id))
+    assert fold_vote_shards(redis_client) == 1
+    assert not redis_client.exists(VOTE_SHARD_DIRTY_KEY)
+    post.reload()
+    assert post.vote == 2
+    clear_vote_buffer()
@@ -0,0 +1,422 @@
+from redis import RedisError
+from app.config import (
+    TIMELINE_MAX_LENGTH,
+    TIMELINE_FANOUT_LIMIT,
+    TIMELINE_TTL,
+    FOLLOWEE_CACHE_TTL,
+)
+from app.models.post import PostModel
+from app.models.user import UserFollowModel
+from app.utils import apply_cursor, decode_cursor
+from app.database import decode_redis, get_redis
+import logging
+
+# Redis keys:
+# timeline:<user_id>          Sorted set of post ids scored by created_at.
+# timeline:<user_id>:built    Marker, set once the timeline has been filled.
+# timeline:<user_id>:following  Comma separated ids of the users followed by the user.
+# timeline:fanout_on_read     Set of author ids whose posts are read on demand.
+TIMELINE_KEY = "timeline:{}"
+TIMELINE_BUILT_KEY = "timeline:{}:built"
+FOLLOWEE_IDS_KEY = "timeline:{}:following"
+FANOUT_ON_READ_KEY = "timeline:fanout_on_read"
+TIMELINE_PURGE_BATCH_SIZE = 1000  # Follower timelines per Redis round trip
+
+
+def _score(post):
+    # MongoDB truncates datetimes to millisecond precision.
+    created_at = post.created_at
+    return created_at.replace(
+        microsecond=created_at.microsecond // 1000 * 1000
+    ).timestamp()
+
+
+def get_followee_ids(user_id: str):
+    """
+    Returns the ids of the users followed by the given user.
+
+    The list is cached in Redis for FOLLOWEE_CACHE_TTL seconds and dropped
+    by forget_followee_ids when the user follows or unfollows someone.
+
+    Parameters
+    ----------
+    user_id: str
+
+    Returns
+    -------
+    List[str]
+    """
+    key = FOLLOWEE_IDS_KEY.format(user_id)
+    try:
+        cached = get_redis().get(key)
+        if cached is not None:
+            cached = decode_redis(cached)
+            return cached.split(",") if cached else []
+    except RedisError as error:
+        logging.error(f"Followee cache read failed for user {user_id}: {error}")
+
+    followee_ids = list(
+        UserFollowModel.objects(follower_id=user_id, deleted_at=None).scalar(
+            "followee_id"
+        )
+    )
+    try:
+        get_redis().set(key, ",".join(followee_ids), ex=FOLLOWEE_CACHE_TTL)
+    except RedisError as error:
+        logging.error(f"Followee cache write failed for user {user_id}: {error}")
+    return followee_ids
+
+
+def forget_followee_ids(user_id: str):
+    """
+    Drops the cached followee ids of the given user.
+
+    Parameters
+    ----------
+    user_id: str
+
+    Returns
+    -------
+    None
+    """
+    try:
+        get_redis().delete(FOLLOWEE_IDS_KEY.format(user_id))
+    except RedisError as error:
+        logging.error(f"Followee cache invalidation failed for user {user_id}: {error}")
+
+
+def get_fanout_on_read_authors():
+    return {decode_redis(author) for author in get_redis().smembers(FANOUT_ON_READ_KEY)}
+
+
+def fan_out_post(post):
+    """
+    Pushes a newly created post into the timelines of the author's followers.
+
+    Only built timelines are written. Authors with more than
+    TIMELINE_FANOUT_LIMIT followers are not fanned out, they are flagged and
+    their posts are merged into timelines on read.
+
+    Parameters
+    ----------
+    post: PostModel
+
+    Returns
+    -------
+    None
+    """
+    fan_out_posts([post])
+
+
+def fan_out_posts(posts):
+    """
+    fan_out_post for several new posts of the same author, with one follower query.
+
+    Parameters
+    ----------
+    posts: List[PostModel]
+
+    Returns
+    -------
+    None
+    """
+    if not posts:
+        return
+    author_id = str(posts[0].author)
+    try:
+        redis_client = get_redis()
+        if redis_client.sismember(FANOUT_ON_READ_KEY, author_id):
+            return
+
+        follower_ids = list(
+            UserFollowModel.objects(followee_id=author_id, deleted_at=None)
+            .limit(TIMELINE_FANOUT_LIMIT + 1)
+            .scalar("follower_id")
+        )
+        if len(follower_ids) > TIMELINE_FANOUT_LIMIT:
+            redis_client.sadd(FANOUT_ON_READ_KEY, author_id)
+            _purge_author(redis_client, author_id)
+            return
+
+        # Timelines that were never built are filled completely on their
+        # first read, a partial one would be read as complete.
+        pipeline = redis_client.pipeline(transaction=False)
+        for follower_id in follower_ids:
+            pipeline.exists(TIMELINE_BUILT_KEY.format(follower_id))
+        built = pipeline.execute()
+
+        scores = {str(post.id): _score(post) for post in posts}
+        pipeline = redis_client.pipeline(transaction=False)
+        for follower_id, is_built in zip(follower_ids, built):
+            if not is_built:
+                continue
+            key = TIMELINE_KEY.format(follower_id)
+            pipeline.zadd(key, scores)
+            pipeline.zremrangebyrank(key, 0, -(TIMELINE_MAX_LENGTH + 1))
+            pipeline.expire(key, TIMELINE_TTL)
+        pipeline.execute()
+    except RedisError as error:
+        logging.error(f"Timeline fan-out failed for author {author_id}: {error}")
+
+
+def _purge_author(redis_client, author_id: str):
+    # Posts fanned out before the author was flagged would be merged on read again.
+    post_ids = [
+        str(post.id) for post in _recent_posts([author_id], TIMELINE_MAX_LENGTH)
+    ]
+    if not post_ids:
+        return
+    follower_ids = UserFollowModel.objects(
+        followee_id=author_id, deleted_at=None
+    ).scalar("follower_id")
+    pipeline = redis_client.pipeline(transaction=False)
+    for index, follower_id in enumerate(follower_ids, 1):
+        pipeline.zrem(TIMELINE_KEY.format(follower_id), *post_ids)
+        if index % TIMELINE_PURGE_BATCH_SIZE == 0:
+            pipeline.execute()
+    pipeline.execute()
+
+
+def remove_post(post):
+    """
+    Removes a deleted post from the timelines of the author's followers.
+
+    Parameters
+    ----------
+    post: PostModel
+
+    Returns
+    -------
+    None
+    """
+    author_id = str(post.author)
+    try:
+        redis_client = get_redis()
+        if redis_client.sismember(FANOUT_ON_READ_KEY, author_id):
+            return
+
+        follower_ids = UserFollowModel.objects(
+            followee_id=author_id, deleted_at=None
+        ).scalar("follower_id")
+        pipeline = redis_client.pipeline(transaction=False)
+        for follower_id in follower_ids:
+            pipeline.zrem(TIMELINE_KEY.format(follower_id), str(post.id))
+        pipeline.execute()
+    except RedisError as error:
+        logging.error(f"Timeline removal failed for post {post.id}: {error}")
+
+
+def _recent_posts(author_ids, limit: int):
+    return (
+        PostModel.objects(author__in=author_ids, deleted_at=None)
+        .order_by("-created_at")
+        .limit(limit)
+        .only("id", "created_at")
+    )
+
+
+def backfill_followee(follower_id: str, followee_id: str):
+    """
+    Adds the recent posts of a newly followed user to the follower's timeline.
+
+    Timelines that were never built are left alone, they are filled
+    completely on their first read.
+
+    Parameters
+    ----------
+    follower_id: str
+    followee_id: str
+
+    Returns
+    -------
+    None
+    """
+    try:
+        redis_client = get_redis()
+        if not redis_client.exists(TIMELINE_BUILT_KEY.format(follower_id)):
+            return
+        if redis_client.sismember(FANOUT_ON_READ_KEY, followee_id):
+            return
+
+        posts = {
+            str(post.id): _score(post)
+            for post in _recent_posts([followee_id], TIMELINE_MAX_LENGTH)
+        }
+        if not posts:
+            return
+        key = TIMELINE_KEY.format(follower_id)
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.zadd(key, posts)
+        pipeline.zremrangebyrank(key, 0, -(TIMELINE_MAX_LENGTH + 1))
+        pipeline.execute()
+    except RedisError as error:
+        logging.error(f"Timeline backfill failed for user {follower_id}: {error}")
+
+
+def prune_followee(follower_id: str, followee_id: str):
+    """
+    Removes the posts of an unfollowed user from the follower's timeline.
+
+    Parameters
+    ----------
+    follower_id: str
+    followee_id: str
+
+    Returns
+    -------
+    None
+    """
+    try:
+        redis_client = get_redis()
+        if not redis_client.exists(TIMELINE_BUILT_KEY.format(follower_id)):
+            return
+
+        post_ids = [
+            str(post.id) for post in _recent_posts([followee_id], TIMELINE_MAX_LENGTH)
+        ]
+        if post_ids:
+            redis_client.zrem(TIMELINE_KEY.format(follower_id), *post_ids)
+    except RedisError as error:
+        logging.error(f"Timeline prune failed for user {follower_id}: {error}")
+
+
+def rebuild_timeline(user_id: str, fanout_on_read_authors=None):
+    """
+    Fills a user's timeline from MongoDB.
+
+    Parameters
+    ----------
+    user_id: str
+    fanout_on_read_authors: Set[str], optional
+        Authors that are merged on read and must not be stored.
+
+    Returns
+    -------
+    None
+    """
+    if fanout_on_read_authors is None:
+        fanout_on_read_authors = get_fanout_on_read_authors()
+    followee_ids = [
+        followee_id
+        for followee_id in get_followee_ids(user_id)
+        if followee_id not in fanout_on_read_authors
+    ]
+    posts = {}
+    if followee_ids:
+        posts = {
+            str(post.id): _score(post)
+            for post in _recent_posts(followee_ids, TIMELINE_MAX_LENGTH)
+        }
+
+    key = TIMELINE_KEY.format(user_id)
+    pipeline = get_redis().pipeline()
+    pipeline.delete(key)
+    if posts:
+        pipeline.zadd(key, posts)
+        pipeline.expire(key, TIMELINE_TTL)
+    pipeline.set(TIMELINE_BUILT_KEY.format(user_id), 1, ex=TIMELINE_TTL)
+    pipeline.execute()
+
+
+def read_timeline(user_id: str, limit: int, offset: int = 0, cursor: str = None):
+    """
+    Returns one page of post ids from a user's home timeline, newest first.
+
+    The stored timeline is merged with the recent posts of followed
+    fan-out-on-read authors.
+
+    Parameters
+    ----------
+    user_id: str
+    limit: int
+    offset: int, optional
+        Number of entries to skip, used by page number pagination.
+    cursor: str, optional
+        Feed cursor for ["-created_at"], the page starts right after it.
+
+    Returns
+    -------
+    List[str]
+        None when the page runs past the TIMELINE_MAX_LENGTH stored entries,
+        its posts are only found in MongoDB.
+    """
+    redis_client = get_redis()
+    fanout_on_read_authors = get_fanout_on_read_authors()
+    if not redis_client.exists(TIMELINE_BUILT_KEY.format(user_id)):
+        rebuild_timeline(user_id, fanout_on_read_authors)
+
+    followed_authors = []
+    if fanout_on_read_authors:
+        followed_authors = list(
+            UserFollowModel.objects(
+                follower_id=user_id,
+                followee_id__in=list(fanout_on_read_authors),
+                deleted_at=None,
+            ).scalar("followee_id")
+        )
+
+    key = TIMELINE_KEY.format(user_id)
+    start = offset
+    if cursor:
+        created_at, post_id = decode_cursor(cursor, ["-created_at"])
+        rank = redis_client.zrevrank(key, str(post_id))
+        if rank is None:
+            rank = redis_client.zcount(key, f"({created_at.timestamp()}", "+inf") - 1
+        start = rank + 1
+    elif followed_authors:
+        # Merging needs every stored entry above the requested page.
+        start, limit = 0, offset + limit
+
+    pipeline = redis_client.pipeline(transaction=False)
+    pipeline.zrevrange(key, start, start + limit - 1, withscores=True)
+    pipeline.zcard(key)
+    pipeline.expire(key, TIMELINE_TTL)
+    pipeline.expire(TIMELINE_BUILT_KEY.format(user_id), TIMELINE_TTL)
+    stored, stored_count, _, _ = pipeline.execute()
+    if len(stored) < limit and stored_count >= TIMELINE_MAX_LENGTH:
+        # Older posts were trimmed from the timeline.
+        return None
+    entries = [(score, decode_redis(post_id)) for post_id, score in stored]
+
+    if followed_authors:
+        posts = apply_cursor(
+            PostModel.objects(author__in=followed_authors, deleted_at=None),
+            ["-created_at"],
+            cursor,
+        )
+        entries.extend(
+            (_score(post), str(post.id))
+            for post in posts.limit(limit).only("id", "created_at")
+        )
+        # Entries stored before the author was flagged are read from both sides.
+        unique_entries = {post_id: score for score, post_id in entries}
+        entries = sorted(
+            ((score, post_id) for post_id, score in unique_entries.items()),
+            reverse=True,
+        )
+        entries = entries[:limit] if cursor else entries[offset:limit]
+
+    return [post_id for _, post_id in entries]
+
+
+def hydrate_posts(post_ids, fields=None):
+    """
+    Loads the given posts with a single query, keeping the given order.
+
+    Parameters
+    ----------
+    post_ids: List[str]
+    fields: List[str], optional
+        Fields to load, all fields when None.
+
+    Returns
+    -------
+    List[PostModel]
+    """
+    posts = PostModel.objects(id__in=post_ids, deleted_at=None)
+    if fields:
+        posts = posts.only(*fields)
+    post_map = {str(post.id): post for post in posts}
+    return [
+        post_map[post_id] for post_id in dict.fromkeys(post_ids) if post_id in post_map
+    ]
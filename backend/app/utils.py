@@ -1,9 +1,17 @@
 from flask_restful import current_app
-from app.config import SECRET_KEY, MAX_BLOCKED_USER, JWT_ALGORITHM
+from app.config import (
+    SECRET_KEY,
+    MAX_BLOCKED_USER,
+    JWT_ALGORITHM,
+    PAGINATION_COUNT_LIMIT,
+    PAGINATION_MAX_LIMIT,
+)
 from datetime import datetime, timedelta
 from app.models.audit import AuditModel
+from mongoengine import Q
+from bson import json_util, ObjectId
 from io import BytesIO
-from base64 import b64encode
+from base64 import b64encode, urlsafe_b64encode, urlsafe_b64decode
 import logging
 import math
 import jwt
@@ -119,10 +127,33 @@ def decode_token(token: str):
     return jwt.decode(token, SECRET_KEY, algorithms=[JWT_ALGORITHM])
 
 
-def paginate_query(query, page: int, limit: int, schema, sort: [str] = []):
+COUNT_MODES = ("exact", "estimate", "none")
+
+
+def _db_sort(document, sort: [str]):
+    # Sort keys with their database field names, the id breaks ties.
+    return {
+        ("_id" if key == "id" else document._fields[key].db_field): order
+        for key, order in _cursor_keys(sort)
+    }
+
+
+def paginate_query(
+    query,
+    page: int,
+    limit: int,
+    schema,
+    sort: [str] = [],
+    total_count: int = None,
+    count: str = "exact",
+    cursor: str = None,
+):
     """
     Paginates a query and returns results along with pagination information.
 
+    The page and its count are read with one aggregation, a $facet runs both
+    over the same $match.
+
     Parameters
     ----------
     query: QuerySet
@@ -130,44 +161,276 @@ def paginate_query(query, page: int, limit: int, schema, sort: [str] = []):
     page: int
         Current page number.
     limit: int
-        Number of items per page.
+        Number of items per page, at most PAGINATION_MAX_LIMIT.
     schema: Schema
         Schematic of the query model.
     sort: List[String] -> Example: ["-created_at", "vote"]
-
+    total_count: int, optional
+        Materialized count of the query, nothing is counted when it is given.
+    count: str, optional
+        How the total is found when total_count is None, one of COUNT_MODES.
+        "exact" counts every match, "estimate" reads the collection's metadata
+        count for unfiltered queries and counts up to PAGINATION_COUNT_LIMIT
+        matches otherwise, "none" leaves the total out. The last two fetch one
+        more item to tell whether there is a next page.
+    cursor: str, optional
+        Keyset pagination cursor, see cursor_paginate. page and count are
+        ignored when it is given, an empty value asks for the first page.
 
     Returns
     -------
     dict
         Paginated results with pagination information.
     """
+    limit = clamp_limit(limit)
+    if cursor is not None:
+        try:
+            results, next_cursor = cursor_paginate(query, limit, sort, cursor)
+        except InvalidCursorError:
+            return {"error": "Invalid cursor."}, 400
+        return {
+            "results": schema.dump(results, many=True),
+            "pagination": {"next_cursor": next_cursor, "limit": limit},
+        }, 200
+
+    if count not in COUNT_MODES:
+        raise ValueError(f"Unknown count mode: {count}")
     page = 1 if page < 1 else page
-    limit = 50 if limit < 1 else limit
-    # WARN(ahmet): If page greater than total_page we should not run the query
     offset = (page - 1) * limit
-    results = query.skip(offset).limit(limit)
-
-    if sort:
-        results = results.order_by(*sort)
+    probe = total_count is None and count != "exact"
+    document = query._document
+    collection = document._get_collection()
+
+    page_pipeline = [
+        {"$sort": _db_sort(document, sort)},
+        {"$skip": offset},
+        {"$limit": limit + 1 if probe else limit},
+    ]
+    projection = query._loaded_fields.as_dict()
+    if projection:
+        page_pipeline.append({"$project": projection})
+    facets = {"results": page_pipeline}
+    if total_count is None and count == "exact":
+        facets["total_count"] = [{"$count": "value"}]
+    estimated = total_count is None and count == "estimate"
+    if estimated:
+        if query._query:
+            facets["total_count"] = [
+                {"$limit": PAGINATION_COUNT_LIMIT},
+                {"$count": "value"},
+            ]
+        else:
+            total_count = collection.estimated_document_count()
 
-    result_count = query.count()
+    (facet,) = collection.aggregate([{"$match": query._query}, {"$facet": facets}])
+    results = [document._from_son(son) for son in facet["results"]]
+    if "total_count" in facet:
+        total_count = facet["total_count"][0]["value"] if facet["total_count"] else 0
 
-    if result_count == 0 or len(results) == 0:
+    has_more = len(results) > limit
+    results = results[:limit]
+    if not results or total_count == 0:
         return {"error": "No results found."}, 404
 
-    results = schema.dump(results, many=True)
-    total_pages = math.ceil(result_count / limit)
+    if probe:
+        total_pages = None if total_count is None else math.ceil(total_count / limit)
+        next_page = page + 1 if has_more else None
+    else:
+        total_pages = math.ceil(total_count / limit)
+        next_page = None if page >= total_pages else page + 1
+
+    pagination = {
+        "current_page": page,
+        "next_page": next_page,
+        "prev_page": None if page == 1 else page - 1,
+        "total_count": total_count,
+        "total_pages": total_pages,
+    }
+    if estimated:
+        pagination["estimated"] = True
+    return {"results": schema.dump(results, many=True), "pagination": pagination}, 200
+
+
+def clamp_limit(limit: int):
+    """
+    Returns a usable page size: 50 for values below 1, at most PAGINATION_MAX_LIMIT.
+    """
+    return 50 if limit < 1 else min(limit, PAGINATION_MAX_LIMIT)
 
-    return {
-        "results": results,
-        "pagination": {
-            "current_page": page,
-            "next_page": None if page == total_pages else page + 1,
-            "prev_page": None if page == 1 else page - 1,
-            "total_count": result_count,
-            "total_pages": total_pages,
-        },
-    }, 200
+
+class InvalidCursorError(Exception):
+    """
+    Raised when a pagination cursor is malformed or was issued for another ordering.
+    """
+
+
+# Types a cursor value may have, by sort key. Other keys hold plain numbers or strings.
+CURSOR_VALUE_TYPES = {"id": ObjectId, "created_at": datetime, "updated_at": datetime}
+
+
+def _cursor_keys(sort: [str]):
+    # The document id is always the last key, so the ordering is total.
+    keys = [(value.lstrip("-+"), -1 if value.startswith("-") else 1) for value in sort]
+    if not keys or keys[-1][0] != "id":
+        keys.append(("id", keys[-1][1] if keys else -1))
+    return keys
+
+
+def encode_cursor(document, sort: [str]):
+    """
+    Builds an opaque cursor pointing right after the given document.
+
+    Parameters
+    ----------
+    document: Document
+        Last document of the current page.
+    sort: List[String] -> Example: ["-vote", "-created_at"]
+
+    Returns
+    -------
+    str
+        URL safe cursor.
+    """
+    values = [document[field] for field, _ in _cursor_keys(sort)]
+    payload = json_util.dumps({"sort": list(sort), "values": values})
+    return urlsafe_b64encode(payload.encode("utf-8")).decode("utf-8")
+
+
+def decode_cursor(cursor: str, sort: [str]):
+    """
+    Decodes a cursor built by encode_cursor.
+
+    Parameters
+    ----------
+    cursor: str
+    sort: List[String]
+        Ordering of the current request, it must match the cursor's ordering.
+
+    Returns
+    -------
+    list
+        Values of the sort keys, followed by the document id.
+    """
+    try:
+        payload = json_util.loads(urlsafe_b64decode(cursor.encode("utf-8")))
+        values = payload["values"]
+        cursor_sort = payload["sort"]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursorError(cursor)
+    keys = _cursor_keys(sort)
+    if (
+        cursor_sort != list(sort)
+        or not isinstance(values, list)
+        or len(values) != len(keys)
+    ):
+        raise InvalidCursorError(cursor)
+    for (key, _), value in zip(keys, values):
+        value_type = CURSOR_VALUE_TYPES.get(key, (int, float, str))
+        if not isinstance(value, value_type) or isinstance(value, bool):
+            raise InvalidCursorError(cursor)
+    return values
+
+
+def apply_cursor(query, sort: [str], cursor: str = None):
+    """
+    Orders a query by the given keys and filters it to the documents after the cursor.
+
+    Parameters
+    ----------
+    query: QuerySet
+    sort: List[String] -> Example: ["-vote", "-created_at"]
+    cursor: str, optional
+        Cursor returned with the previous page, None for the first page.
+
+    Returns
+    -------
+    QuerySet
+    """
+    keys = _cursor_keys(sort)
+    query = query.order_by(*[("-" if order < 0 else "") + key for key, order in keys])
+    if not cursor:
+        return query
+
+    values = decode_cursor(cursor, sort)
+    conditions = None
+    for index, (key, order) in enumerate(keys):
+        condition = Q(**{f"{key}__{'lt' if order < 0 else 'gt'}": values[index]})
+        for previous_index, (previous_key, _) in enumerate(keys[:index]):
+            condition &= Q(**{previous_key: values[previous_index]})
+        conditions = condition if conditions is None else conditions | condition
+    return query.filter(conditions)
+
+
+def sort_key(sort: [str]):
+    """
+    Builds a key function that orders documents in memory like apply_cursor.
+
+    Parameters
+    ----------
+    sort: List[String] -> Example: ["-vote", "-created_at"]
+
+    Returns
+    -------
+    Callable
+        Ascending key, for sorted and heapq.merge.
+    """
+    keys = _cursor_keys(sort)
+
+    def to_number(value):
+        if isinstance(value, datetime):
+            return value.timestamp()
+        if isinstance(value, ObjectId):
+            return int(str(value), 16)
+        return value or 0
+
+    def key(document):
+        return tuple(to_number(document[field]) * order for field, order in keys)
+
+    return key
+
+
+def split_cursor_page(results: list, limit: int, sort: [str]):
+    """
+    Trims a page fetched with limit + 1 items and builds the next cursor.
+
+    Parameters
+    ----------
+    results: list
+        Up to limit + 1 documents.
+    limit: int
+    sort: List[String]
+
+    Returns
+    -------
+    tuple
+        Page documents and the next cursor, None on the last page.
+    """
+    if len(results) <= limit:
+        return results, None
+    results = results[:limit]
+    return results, encode_cursor(results[-1], sort)
+
+
+def cursor_paginate(query, limit: int, sort: [str], cursor: str = None):
+    """
+    Returns one keyset paginated page of a query, without counting the collection.
+
+    Parameters
+    ----------
+    query: QuerySet
+    limit: int
+        Page size, see clamp_limit.
+    sort: List[String]
+    cursor: str, optional
+
+    Returns
+    -------
+    tuple
+        Page documents and the next cursor, None on the last page.
+    """
+    limit = clamp_limit(limit)
+    results = list(apply_cursor(query, sort, cursor).limit(limit + 1))
+    return split_cursor_page(results, limit, sort)
 
 
 def create_audit_log(
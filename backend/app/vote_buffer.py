@@ -0,0 +1,319 @@
+from redis import RedisError, WatchError
+from pymongo import UpdateOne
+from bson import ObjectId
+from datetime import datetime
+from uuid import uuid4
+from app.config import VOTE_WRITE_BEHIND
+from app.models.post import PostModel
+from app.models.vote import VoteModel
+from app.ranking import hot_score
+from app.database import decode_redis, get_redis
+import logging
+
+# Redis keys:
+# votes:pending:<post_id>   Hash of user id -> latest vote value, not written to
+#                           MongoDB yet.
+# votes:delta:<post_id>     Sum of the vote changes in votes:pending:<post_id>.
+# votes:dirty               Set of post ids with pending votes.
+# votes:flushing:<post_id>  Pending votes taken by a flush, with their _delta and
+#                           _flush_id. Removed once written, left over ones are
+#                           written by the next flush.
+# votes:flushing            Set of post ids with a votes:flushing:<post_id> hash.
+VOTE_PENDING_KEY = "votes:pending:{}"
+VOTE_DELTA_KEY = "votes:delta:{}"
+VOTE_DIRTY_KEY = "votes:dirty"
+VOTE_FLUSHING_KEY = "votes:flushing:{}"
+VOTE_FLUSHING_SET_KEY = "votes:flushing"
+FLUSH_ID_FIELD = "_flush_id"
+DELTA_FIELD = "_delta"
+# Flush ids kept on a post, enough to recognise a retried flush.
+VOTE_FLUSH_HISTORY = 10
+
+
+def write_behind_enabled():
+    return VOTE_WRITE_BEHIND
+
+
+def buffer_vote(user_id: str, post_id: str, vote_value: int, get_persisted_value):
+    """
+    Records a vote in Redis, it is written to MongoDB by flush_vote_buffer.
+
+    Parameters
+    ----------
+    user_id: str
+    post_id: str
+    vote_value: int
+    get_persisted_value: Callable
+        Returns the user's vote stored in MongoDB, None when there is none.
+        It is called while the buffer is watched, so a flush finishing
+        meanwhile makes the vote start over instead of counting twice.
+
+    Returns
+    -------
+    int
+        The previous vote of the user, pending or stored, None when there is none.
+        Like VoteModel.set_value, nothing changes when it equals vote_value or
+        when a blank vote has nothing to replace.
+    """
+    pending_key = VOTE_PENDING_KEY.format(post_id)
+    flushing_key = VOTE_FLUSHING_KEY.format(post_id)
+    with get_redis().pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(pending_key, flushing_key)
+                previous_value = pipe.hget(pending_key, user_id)
+                if previous_value is None:
+                    previous_value = pipe.hget(flushing_key, user_id)
+                previous_value = (
+                    get_persisted_value()
+                    if previous_value is None
+                    else int(previous_value)
+                )
+                if previous_value == vote_value or (
+                    previous_value is None and vote_value == 0
+                ):
+                    pipe.unwatch()
+                    return previous_value
+
+                pipe.multi()
+                pipe.hset(pending_key, user_id, vote_value)
+                pipe.incrby(
+                    VOTE_DELTA_KEY.format(post_id), vote_value - (previous_value or 0)
+                )
+                pipe.sadd(VOTE_DIRTY_KEY, post_id)
+                pipe.execute()
+                return previous_value
+            except WatchError:
+                # A concurrent vote or flush changed the post's buffer, read it again.
+                continue
+
+
+def get_pending_deltas(post_ids):
+    """
+    Returns the vote changes of posts that are not in MongoDB yet.
+
+    Parameters
+    ----------
+    post_ids: Iterable[ObjectId]
+
+    Returns
+    -------
+    dict
+        Post id -> pending delta, posts without one are left out.
+    """
+    post_ids = list(post_ids)
+    if not write_behind_enabled() or not post_ids:
+        return {}
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for post_id in post_ids:
+            pipe.get(VOTE_DELTA_KEY.format(post_id))
+            pipe.hget(VOTE_FLUSHING_KEY.format(post_id), DELTA_FIELD)
+        values = pipe.execute()
+    except RedisError as error:
+        logging.error(f"Pending vote read failed: {error}")
+        return {}
+
+    deltas = {}
+    for index, post_id in enumerate(post_ids):
+        delta = int(values[2 * index] or 0) + int(values[2 * index + 1] or 0)
+        if delta:
+            deltas[post_id] = delta
+    return deltas
+
+
+def get_pending_vote(user_id: str, post_id):
+    """
+    Returns a user's vote on a post that is not in MongoDB yet, None when there is none.
+    """
+    if not write_behind_enabled():
+        return None
+    try:
+        redis_client = get_redis()
+        value = redis_client.hget(VOTE_PENDING_KEY.format(post_id), user_id)
+        if value is None:
+            value = redis_client.hget(VOTE_FLUSHING_KEY.format(post_id), user_id)
+    except RedisError as error:
+        logging.error(f"Pending vote read failed for post {post_id}: {error}")
+        return None
+    return None if value is None else int(value)
+
+
+def get_pending_votes(user_id: str, post_ids):
+    """
+    Returns a user's votes on posts that are not in MongoDB yet, post id -> vote value.
+    """
+    post_ids = list(post_ids)
+    if not write_behind_enabled() or not post_ids:
+        return {}
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for post_id in post_ids:
+            pipe.hget(VOTE_PENDING_KEY.format(post_id), user_id)
+            pipe.hget(VOTE_FLUSHING_KEY.format(post_id), user_id)
+        values = pipe.execute()
+    except RedisError as error:
+        logging.error(f"Pending vote read failed for user {user_id}: {error}")
+        return {}
+
+    votes = {}
+    for index, post_id in enumerate(post_ids):
+        # The pending hash holds the newest vote.
+        value = values[2 * index]
+        if value is None:
+            value = values[2 * index + 1]
+        if value is not None:
+            votes[post_id] = int(value)
+    return votes
+
+
+def get_my_votes(user_id, post_ids):
+    """
+    Returns a user's vote on each of the given posts, 0 when there is none.
+
+    Stored votes are read with one query on the (author, post_id) index,
+    votes still buffered in Redis replace them.
+
+    Parameters
+    ----------
+    user_id: str
+    post_ids: Iterable[ObjectId]
+        Post ids of one page.
+
+    Returns
+    -------
+    dict
+        Post id -> vote value.
+    """
+    post_ids = [ObjectId(post_id) for post_id in post_ids]
+    votes = VoteModel.get_values(user_id, post_ids)
+    votes.update(get_pending_votes(user_id, post_ids))
+    return {post_id: votes.get(post_id, 0) for post_id in post_ids}
+
+
+def _take_pending_votes(redis_client, post_id: str):
+    # Moves a post's buffer to its flushing hash, votes arriving meanwhile start a
+    # new one.
+    pending_key = VOTE_PENDING_KEY.format(post_id)
+    delta_key = VOTE_DELTA_KEY.format(post_id)
+    flushing_key = VOTE_FLUSHING_KEY.format(post_id)
+    with redis_client.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(pending_key, delta_key, flushing_key)
+                has_pending = pipe.exists(pending_key)
+                if pipe.exists(flushing_key) or not has_pending:
+                    pipe.unwatch()
+                    if not has_pending:
+                        redis_client.srem(VOTE_DIRTY_KEY, post_id)
+                    return
+                delta = int(pipe.get(delta_key) or 0)
+                pipe.multi()
+                pipe.rename(pending_key, flushing_key)
+                pipe.hset(
+                    flushing_key,
+                    mapping={FLUSH_ID_FIELD: uuid4().hex, DELTA_FIELD: delta},
+                )
+                pipe.delete(delta_key)
+                pipe.srem(VOTE_DIRTY_KEY, post_id)
+                pipe.sadd(VOTE_FLUSHING_SET_KEY, post_id)
+                pipe.execute()
+                return
+            except WatchError:
+                continue
+
+
+def _write_flushing_votes(redis_client, post_ids):
+    vote_operations = []
+    post_operations = []
+    for post_id in post_ids:
+        entries = {
+            decode_redis(field): decode_redis(value)
+            for field, value in redis_client.hgetall(
+                VOTE_FLUSHING_KEY.format(post_id)
+            ).items()
+        }
+        flush_id = entries.pop(FLUSH_ID_FIELD, None)
+        delta = int(entries.pop(DELTA_FIELD, 0))
+        for user_id, vote_value in entries.items():
+            vote_operations.append(
+                UpdateOne(
+                    {"author": ObjectId(user_id), "post_id": ObjectId(post_id)},
+                    {"$set": {"vote_value": int(vote_value)}},
+                    upsert=True,
+                )
+            )
+        if delta and flush_id:
+            created_at = datetime.fromtimestamp(
+                ObjectId(post_id).generation_time.timestamp()
+            )
+            # The flush id makes a retried $inc a no-op.
+            post_operations.append(
+                UpdateOne(
+                    {"_id": ObjectId(post_id), "vote_flushes": {"$ne": flush_id}},
+                    {
+                        "$inc": {
+                            "vote": delta,
+                            "hot_score": hot_score(delta, created_at),
+                            "version": 1,
+                        },
+                        "$push": {
+                            "vote_flushes": {
+                                "$each": [flush_id],
+                                "$slice": -VOTE_FLUSH_HISTORY,
+                            }
+                        },
+                    },
+                )
+            )
+
+    if vote_operations:
+        VoteModel._get_collection().bulk_write(vote_operations, ordered=False)
+    if post_operations:
+        PostModel._get_collection().bulk_write(post_operations, ordered=False)
+
+    pipe = redis_client.pipeline()
+    for post_id in post_ids:
+        pipe.delete(VOTE_FLUSHING_KEY.format(post_id))
+    pipe.srem(VOTE_FLUSHING_SET_KEY, *post_ids)
+    pipe.execute()
+
+
+def flush_vote_buffer(redis_client):
+    """
+    Writes buffered votes to MongoDB with one bulk_write per collection.
+
+    Buffers left by a flush that failed or crashed are written first, their
+    vote values are set again and the post counters are only incremented if
+    the post has not recorded the buffer's flush id yet. This job is
+    scheduled in create_app every VOTE_FLUSH_INTERVAL seconds.
+
+    Parameters
+    ----------
+    redis_client: Redis
+
+    Returns
+    -------
+    int
+        Number of flushed posts.
+    """
+    flushed_count = 0
+    left_over = [
+        decode_redis(post_id)
+        for post_id in redis_client.smembers(VOTE_FLUSHING_SET_KEY)
+    ]
+    if left_over:
+        logging.warning(f"Recovering {len(left_over)} unflushed vote buffers.")
+        _write_flushing_votes(redis_client, left_over)
+        flushed_count += len(left_over)
+
+    for post_id in redis_client.smembers(VOTE_DIRTY_KEY):
+        _take_pending_votes(redis_client, decode_redis(post_id))
+    taken = [
+        decode_redis(post_id)
+        for post_id in redis_client.smembers(VOTE_FLUSHING_SET_KEY)
+    ]
+    if taken:
+        _write_flushing_votes(redis_client, taken)
+        flushed_count += len(taken)
+    return flushed_count
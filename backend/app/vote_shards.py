@@ -0,0 +1,273 @@
+from redis import RedisError
+from pymongo import UpdateOne
+from bson import ObjectId
+from datetime import datetime
+from random import randrange
+import time
+from app.config import (
+    VOTE_SHARDING,
+    VOTE_SHARD_COUNT,
+    VOTE_SHARD_THRESHOLD,
+    VOTE_SHARD_CACHE_TTL,
+    RELATION_CACHE_SIZE,
+)
+from app.models.counter import CounterModel, POST_VOTE_SHARD_COUNTER
+from app.models.post import PostModel
+from app.loader import LRUCache
+from app.ranking import hot_score
+from app.database import decode_redis, get_redis
+import logging
+
+# Redis keys:
+# votes:rate:<post_id>:<minute>  Votes cast on a post in one minute.
+# votes:sharded                  Hash of promoted post id -> shard count, tells
+#                                writers where to vote. The post document is
+#                                the source of truth, a missing entry only
+#                                sends votes to the post itself.
+# votes:shards:dirty             Set of promoted post ids whose shards changed
+#                                since the last fold.
+VOTE_RATE_KEY = "votes:rate:{}:{}"
+VOTE_SHARDED_KEY = "votes:sharded"
+VOTE_SHARD_DIRTY_KEY = "votes:shards:dirty"
+
+# Summed shards of promoted posts, post id -> total.
+shard_total_cache = LRUCache(RELATION_CACHE_SIZE, VOTE_SHARD_CACHE_TTL)
+
+
+def sharding_enabled():
+    return VOTE_SHARDING
+
+
+def shard_names(post_id, shard_count: int):
+    return [
+        POST_VOTE_SHARD_COUNTER.format(post_id, shard) for shard in range(shard_count)
+    ]
+
+
+def track_vote(post_id: str):
+    """
+    Counts a vote towards the post's rate and returns its shard count.
+
+    A post voted on more than VOTE_SHARD_THRESHOLD times in a minute is
+    promoted. Promoted posts stay sharded.
+
+    Returns
+    -------
+    int
+        Shard count of the post, None when its votes go to the post itself.
+    """
+    if not sharding_enabled():
+        return None
+    rate_key = VOTE_RATE_KEY.format(post_id, int(time.time() // 60))
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hget(VOTE_SHARDED_KEY, post_id)
+        pipe.incr(rate_key)
+        pipe.expire(rate_key, 120)
+        shard_count, rate, _ = pipe.execute()
+    except RedisError as error:
+        logging.error(f"Vote rate update failed for post {post_id}: {error}")
+        return None
+    if shard_count is not None:
+        return int(shard_count)
+    if rate > VOTE_SHARD_THRESHOLD:
+        return promote_post(post_id)
+    return None
+
+
+def promote_post(post_id: str, shard_count: int = VOTE_SHARD_COUNT):
+    """
+    Spreads the future votes of a post over shard_count counter documents.
+
+    The shards are created before the post is marked, so the first votes
+    never race to insert them.
+
+    Returns
+    -------
+    int
+        Shard count of the post, None if it does not exist.
+    """
+    CounterModel._get_collection().bulk_write(
+        [
+            UpdateOne(
+                {"name": name},
+                {"$setOnInsert": {"value": 0, "updated_at": datetime.now()}},
+                upsert=True,
+            )
+            for name in shard_names(post_id, shard_count)
+        ],
+        ordered=False,
+    )
+    promoted = PostModel.objects(
+        id=post_id, vote_shards=None, deleted_at=None
+    ).update_one(set__vote_shards=shard_count, set__vote_shard_total=0)
+    if not promoted:
+        # Promoted before, or by a concurrent request.
+        post = (
+            PostModel.objects(id=post_id, deleted_at=None).only("vote_shards").first()
+        )
+        if post is None or post.vote_shards is None:
+            return None
+        shard_count = post.vote_shards
+    else:
+        logging.info(f"Post {post_id} is promoted to {shard_count} vote shards.")
+    try:
+        get_redis().hset(VOTE_SHARDED_KEY, post_id, shard_count)
+    except RedisError as error:
+        logging.error(f"Vote shard hint write failed for post {post_id}: {error}")
+    return shard_count
+
+
+def increment_shard(post_id: str, shard_count: int, delta: int):
+    """
+    Adds a vote change to one random shard of a promoted post and marks the
+    post for the next fold.
+
+    A post that could not be marked is folded after its next vote, reads
+    add its shards meanwhile, see get_shard_deltas.
+    """
+    CounterModel.increment(
+        POST_VOTE_SHARD_COUNTER.format(post_id, randrange(shard_count)), delta
+    )
+    try:
+        get_redis().sadd(VOTE_SHARD_DIRTY_KEY, str(post_id))
+    except RedisError as error:
+        logging.error(f"Vote shard mark failed for post {post_id}: {error}")
+
+
+def get_shard_totals(posts):
+    """
+    Sums the shards of promoted posts, reading the ones not cached with one query.
+
+    Parameters
+    ----------
+    posts: Iterable[PostModel]
+        Loaded with vote_shards.
+
+    Returns
+    -------
+    dict
+        Post id -> sum of its shards, posts that are not promoted are left out.
+    """
+    shard_counts = {post.id: post.vote_shards for post in posts if post.vote_shards}
+    if not shard_counts:
+        return {}
+    totals = shard_total_cache.get_many(shard_counts)
+    missing = {id: count for id, count in shard_counts.items() if id not in totals}
+    if missing:
+        values = CounterModel.get_values(
+            [name for id, count in missing.items() for name in shard_names(id, count)]
+        )
+        loaded = {
+            id: sum(values.get(name, 0) for name in shard_names(id, count))
+            for id, count in missing.items()
+        }
+        shard_total_cache.set_many(loaded)
+        totals.update(loaded)
+    return totals
+
+
+def get_shard_deltas(posts):
+    """
+    Returns the shard votes that are not added to the posts' vote yet.
+
+    Parameters
+    ----------
+    posts: Iterable[PostModel]
+        Loaded with vote_shards and vote_shard_total.
+
+    Returns
+    -------
+    dict
+        Post id -> votes to add, posts without one are left out.
+    """
+    posts = list(posts)
+    totals = get_shard_totals(posts)
+    deltas = {}
+    for post in posts:
+        if post.id in totals:
+            delta = totals[post.id] - (post.vote_shard_total or 0)
+            if delta:
+                deltas[post.id] = delta
+    return deltas
+
+
+def _take_dirty_posts(redis_client):
+    pipe = redis_client.pipeline()
+    pipe.smembers(VOTE_SHARD_DIRTY_KEY)
+    pipe.delete(VOTE_SHARD_DIRTY_KEY)
+    post_ids, _ = pipe.execute()
+    return [ObjectId(decode_redis(post_id)) for post_id in post_ids]
+
+
+def fold_vote_shards(redis_client):
+    """
+    Adds the shard votes of changed promoted posts to their vote and hot score.
+
+    Only the posts in VOTE_SHARD_DIRTY_KEY are read. The set is emptied
+    before the shards are read, a vote landing meanwhile marks its post
+    again. Shards only grow by the votes cast on them, each post remembers
+    the total it has added so far. The update is a compare and set on that
+    total, a retried or concurrent fold matches nothing and changes nothing.
+    This job is scheduled in create_app every VOTE_SHARD_FOLD_INTERVAL seconds.
+
+    Parameters
+    ----------
+    redis_client: Redis
+
+    Returns
+    -------
+    int
+        Number of updated posts.
+    """
+    post_ids = _take_dirty_posts(redis_client)
+    if not post_ids:
+        return 0
+    try:
+        return _fold_posts(post_ids)
+    except Exception:
+        # Marked again, the next fold retries them.
+        redis_client.sadd(VOTE_SHARD_DIRTY_KEY, *[str(post_id) for post_id in post_ids])
+        raise
+
+
+def _fold_posts(post_ids):
+    posts = list(
+        PostModel.objects(id__in=post_ids, vote_shards__ne=None, deleted_at=None).only(
+            "id", "vote_shards", "vote_shard_total"
+        )
+    )
+    if not posts:
+        return 0
+    values = CounterModel.get_values(
+        [name for post in posts for name in shard_names(post.id, post.vote_shards)]
+    )
+
+    operations = []
+    for post in posts:
+        total = sum(
+            values.get(name, 0) for name in shard_names(post.id, post.vote_shards)
+        )
+        folded = post.vote_shard_total or 0
+        if total == folded:
+            continue
+        created_at = datetime.fromtimestamp(
+            ObjectId(post.id).generation_time.timestamp()
+        )
+        operations.append(
+            UpdateOne(
+                {"_id": post.id, "vote_shard_total": post.vote_shard_total},
+                {
+                    "$set": {"vote_shard_total": total},
+                    "$inc": {
+                        "vote": total - folded,
+                        "hot_score": hot_score(total - folded, created_at),
+                        "version": 1,
+                    },
+                },
+            )
+        )
+    if not operations:
+        return 0
+    result = PostModel._get_collection().bulk_write(operations, ordered=False)
+    return result.modified_count
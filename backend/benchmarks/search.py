@@ -0,0 +1,99 @@
+"""
+Measures /search ranking latency on a synthetic corpus.
+
+Posts are built from a Zipf distributed vocabulary, like natural text, whose
+most frequent words are the stop words the index drops. Queries of one to
+three words are drawn from the same distribution, so common terms with long
+postings lists are part of the run.
+
+Usage:
+    python -m benchmarks.search --posts 1000000
+"""
+
+from app.search import SearchIndex, STOP_WORDS
+from bson import ObjectId
+import numpy as np
+import argparse
+import time
+
+VOCABULARY_SIZE = 50000
+BUILD_BATCH_SIZE = 10000
+
+
+def make_vocabulary(size: int):
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    words = set()
+    generator = np.random.default_rng(0)
+    while len(words) < size - len(STOP_WORDS):
+        length = generator.integers(3, 10)
+        word = "".join(generator.choice(letters, length))
+        if word not in STOP_WORDS:
+            words.add(word)
+    # Stop words take the most frequent ranks.
+    return np.array(sorted(STOP_WORDS) + sorted(words))
+
+
+def zipf_probabilities(size: int, exponent: float = 1.1):
+    weights = 1 / np.power(np.arange(1, size + 1), exponent)
+    return weights / weights.sum()
+
+
+def build_index(posts: int, generator, vocabulary, probabilities):
+    index = SearchIndex()
+    for start in range(0, posts, BUILD_BATCH_SIZE):
+        count = min(BUILD_BATCH_SIZE, posts - start)
+        lengths = generator.poisson(40, count) + 6
+        words = vocabulary[
+            generator.choice(len(vocabulary), lengths.sum(), p=probabilities)
+        ]
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        index.add(
+            (
+                ObjectId(),
+                0,
+                " ".join(words[offsets[i] : offsets[i] + 6]),
+                " ".join(words[offsets[i] + 6 : offsets[i + 1]]),
+                [],
+            )
+            for i in range(count)
+        )
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--posts", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--target-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    generator = np.random.default_rng(1)
+    vocabulary = make_vocabulary(VOCABULARY_SIZE)
+    probabilities = zipf_probabilities(VOCABULARY_SIZE)
+
+    started_at = time.perf_counter()
+    index = build_index(args.posts, generator, vocabulary, probabilities)
+    print(f"Indexed {len(index)} posts in {time.perf_counter() - started_at:.1f}s.")
+
+    timings = []
+    for _ in range(args.queries):
+        terms = vocabulary[
+            generator.choice(len(vocabulary), generator.integers(1, 4), p=probabilities)
+        ]
+        started_at = time.perf_counter()
+        index.search(" ".join(terms), args.limit)
+        timings.append((time.perf_counter() - started_at) * 1000)
+
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    print(
+        f"{args.queries} queries: p50 {p50:.1f}ms, p95 {p95:.1f}ms, "
+        f"p99 {p99:.1f}ms, max {max(timings):.1f}ms"
+    )
+    if p99 > args.target_ms:
+        print(f"p99 is above the {args.target_ms:.0f}ms target.")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
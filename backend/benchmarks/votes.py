@@ -0,0 +1,98 @@
+"""
+Measures vote throughput on one busy post with and without vote shards.
+
+Every worker thread votes on the same post for a fixed time, each vote by a
+new user. A vote runs the write path of POST /vote: the VoteModel upsert,
+then VoteResource.apply_delta, which tracks the vote rate in Redis and
+either increments the post document or reads the post and increments one of
+its K counter shards. The first run leaves the post unpromoted, the following
+ones promote a fresh post to K shards first. Needs a running MongoDB and
+Redis, mongomock serializes every write and shows no difference.
+
+Usage:
+    python -m benchmarks.votes --mongodb-uri mongodb://localhost:27017/microblog_bench
+"""
+
+from app.config import MONGODB_SETTINGS, REDIS_SETTINGS
+from app.database import connect_redis
+from app.models.counter import CounterModel, POST_VOTE_SHARD_COUNTER
+from app.models.post import PostModel
+from app.models.vote import VoteModel
+from app.resources.vote import VoteResource
+from app import vote_shards
+from concurrent.futures import ThreadPoolExecutor
+from mongoengine import connect
+from flask import Flask
+from bson import ObjectId
+import argparse
+import time
+
+
+def vote_on_post(post_id):
+    VoteModel.set_value(ObjectId(), post_id, 1)
+    VoteResource.apply_delta(post_id, 1)
+
+
+def run(app, vote, workers: int, duration: float):
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        count = 0
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                vote()
+                count += 1
+        return count
+
+    with ThreadPoolExecutor(workers) as executor:
+        futures = [executor.submit(worker) for _ in range(workers)]
+        return sum(future.result() for future in futures) / duration
+
+
+def measure(app, shard_count, workers: int, duration: float):
+    post = PostModel(title="Benchmark", content="Benchmark", author=ObjectId()).save()
+    post_id = str(post.id)
+    try:
+        with app.app_context():
+            if shard_count:
+                vote_shards.promote_post(post_id, shard_count)
+        return run(app, lambda: vote_on_post(post_id), workers, duration)
+    finally:
+        post.delete()
+        VoteModel.objects(post_id=post.id).delete()
+        CounterModel.objects(
+            name__startswith=POST_VOTE_SHARD_COUNTER.format(post_id, "")
+        ).delete()
+        app.config["redis"].hdel(vote_shards.VOTE_SHARDED_KEY, post_id)
+        app.config["redis"].srem(vote_shards.VOTE_SHARD_DIRTY_KEY, post_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--mongodb-uri", default=MONGODB_SETTINGS["host"])
+    parser.add_argument("--redis-host", default=REDIS_SETTINGS["host"])
+    parser.add_argument("--redis-port", type=int, default=REDIS_SETTINGS["port"])
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    connect(host=args.mongodb_uri)
+    app = Flask(__name__)
+    app.config["redis"] = connect_redis(
+        args.redis_host, args.redis_port, REDIS_SETTINGS["db"]
+    )
+    # Votes reach the shards of promoted posts only with sharding on, the
+    # baseline post must not be promoted by its own vote rate.
+    vote_shards.VOTE_SHARDING = True
+    vote_shards.VOTE_SHARD_THRESHOLD = float("inf")
+
+    baseline = measure(app, None, args.workers, args.duration)
+    print(f"post document: {baseline:,.0f} votes/s")
+    for shard_count in args.shards:
+        rate = measure(app, shard_count, args.workers, args.duration)
+        print(f"{shard_count:>3} shards: {rate:,.0f} votes/s ({rate / baseline:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()